@@ -3,17 +3,11 @@ Lexer for our Exp1bytecode language
 '''
 
 import re
+from bisect import bisect_left
+from collections import deque
 
 token_specs = [
 #   type:          value:
-    ('PRINT',      r'print'),
-    ('STORE',      r'store'),
-    ('INPUT',      r'input'),
-    ('JUMPT',      r'jumpt'),
-    ('JUMPF',      r'jumpf'),
-    ('JUMP',       r'jump'),
-    ('STOP',       r'stop'),
-    ('NOOP',       r'noop'),
     ('NUMBER',     r'[0-9]+'),
     ('NAME',       r'[a-zA-Z_\$][a-zA-Z0-9_\$]*'),
     ('ADD',        r'\+'),
@@ -32,47 +26,100 @@ token_specs = [
     ('UNKNOWN',    r'.'),
 ]
 
+# keywords are scanned as identifiers and then looked up in this table
+keywords = {
+    'print' : 'PRINT',
+    'store' : 'STORE',
+    'input' : 'INPUT',
+    'jumpt' : 'JUMPT',
+    'jumpf' : 'JUMPF',
+    'jump'  : 'JUMP',
+    'stop'  : 'STOP',
+    'noop'  : 'NOOP',
+}
+
 # used for sanity checking in lexer.
-token_types = set(type for (type,_) in token_specs)
+token_types = set(type for (type,_) in token_specs) | set(keywords.values())
+
+# the combined regular expression of all token specs, compiled once
+token_re = re.compile('|'.join('(?P<{}>{})'.format(type,regexp)
+                               for (type,regexp) in token_specs))
+
+class Source:
+    '''
+    the text of a program, the line and column of an offset into the text
+    are computed from an index of the newlines which is built the first
+    time a position is asked for
+    '''
+    def __init__(self, text):
+        self.text = text
+        self.newlines = None
+
+    def line_col(self, offset):
+        if self.newlines is None:
+            self.newlines = [mo.start() for mo in re.finditer('\n', self.text)]
+        line = bisect_left(self.newlines, offset)
+        start = self.newlines[line - 1] + 1 if line > 0 else 0
+        return (line + 1, offset - start + 1)
+
+    def where(self, offset):
+        return 'line {}, column {}'.format(*self.line_col(offset))
 
 class Token:
-    def __init__(self,type,value):
+    # a token refers to its text by the offsets start and end into the
+    # source instead of keeping a copy of it
+    __slots__ = ('type', 'value', 'source', 'start', 'end')
+
+    def __init__(self,type,value,source=None,start=0,end=0):
         self.type = type
         self.value = value
+        self.source = source
+        self.start = start
+        self.end = end
+
+    def line_col(self):
+        return self.source.line_col(self.start)
+
+    def where(self):
+        return self.source.where(self.start)
 
     def __str__(self):
         return 'Token({},{})'.format(self.type,self.value)
 
 def tokenize(code):
-    tokens = []
-    re_list = ['(?P<{}>{})'.format(type,re) for (type,re) in token_specs]
-    combined_re = '|'.join(re_list)
-    match_object_list = list(re.finditer(combined_re, code))
-    for mo in match_object_list:
+    'generate the tokens of the code one at a time, the last token is EOF'
+    source = Source(code)
+    for mo in token_re.finditer(code):
         type = mo.lastgroup
         value = mo.group()
+        if type == 'NAME':
+            type = keywords.get(value, 'NAME')
         if type in ['WHITESPACE','COMMENT']:
             continue #ignore
         elif type == 'UNKNOWN':
-            raise ValueError("unexpected character '{}'".format(value))
+            raise ValueError("unexpected character '{}' at {}"
+                             .format(value, source.where(mo.start())))
         else:
-            tokens.append(Token(type, value))
-    tokens.append(Token('EOF', r'\eof'))
-    return tokens
+            yield Token(type, value, source, mo.start(), mo.end())
+    yield Token('EOF', r'\eof', source, len(code), len(code))
 
 class Lexer:
     def __init__(self, input_string):
         self.tokens = tokenize(input_string)
-        # the following is always valid because we will always have
-        # at least the EOF token on the tokens list.
-        self.curr_token_ix = 0
+        # the lookahead buffer holds the tokens read from the token stream
+        # that have not been consumed yet, the first one is the current
+        # token.  The buffer is never empty because the EOF token at the
+        # end of the stream is never consumed.
+        self.lookahead = deque([next(self.tokens)])
 
     def pointer(self):
-        return self.tokens[self.curr_token_ix]
+        return self.lookahead[0]
 
     def next(self):
         if not self.end_of_file():
-            self.curr_token_ix += 1
+            self.lookahead.popleft()
+            if not self.lookahead:
+                self.lookahead.append(next(self.tokens))
         return self.pointer()
 
     def match(self, token_type):
@@ -83,8 +130,9 @@ class Lexer:
         elif token_type not in token_types:
             raise ValueError("unknown token type '{}'".format(token_type))
         else:
-            raise SyntaxError('unexpected token {} while parsing, expected {}'
-                              .format(self.pointer().type, token_type))
+            raise SyntaxError('unexpected token {} while parsing, expected {} at {}'
+                              .format(self.pointer().type, token_type,
+                                      self.pointer().where()))
 
     def end_of_file(self):
         if self.pointer().type == 'EOF':
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# Benchmark for the peephole optimizer of the Cuppa1 compiler
+#
+# Generates synthetic Cuppa1 programs with nested if and while statements,
+# the kind of code that produces lots of labels followed by noops, and
+# reports the time spent in the peephole optimizer for growing program
+# sizes.  The time per statement should stay roughly constant.
+#
+# usage: python bench_peephole.py [number of statements]
+
+from time import perf_counter
+from cuppa1_fe import parse
+from cuppa1_codegen import walk as codegen
+from cuppa1_output import peephole_opt
+
+# every template is a single statement at the top level
+templates = [
+    'x = x + 1;',
+    'if (x) put x else put 0;',
+    'if (x =< 10) { if (y) put y; } else { while (y) y = y - 1; }',
+    'while (x) { if (y) { put y } x = x - 1 }',
+    'if (x) { if (y) { if (z) put z } }',
+]
+
+def program(n_stmts):
+    stmts = [templates[i % len(templates)] for i in range(n_stmts)]
+    return '\n'.join(stmts)
+
+def bench(n_stmts):
+    instr_stream = codegen(parse(program(n_stmts))) + [('stop',)]
+    n_instrs = len(instr_stream)
+
+    start = perf_counter()
+    peephole_opt(instr_stream)
+    elapsed = perf_counter() - start
+
+    print("{:>8} statements {:>8} -> {:>8} instructions {:8.3f}s {:6.2f}us/stmt"
+          .format(n_stmts, n_instrs, len(instr_stream), elapsed,
+                  1e6 * elapsed / n_stmts))
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    size = 1000
+    while size < n:
+        bench(size)
+        size *= 10
+    bench(n)
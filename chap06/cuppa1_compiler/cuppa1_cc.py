@@ -1,22 +1,30 @@
 # Cuppa1 compiler
 
+import sys
 from argparse import ArgumentParser
 from cuppa1_fe import parse
 from cuppa1_codegen import walk as codegen
 from cuppa1_fold import walk as fold
-from cuppa1_output import output
+from cuppa1_output import output, OutputFile
 from cuppa1_output import peephole_opt
+from parse_cache import ParseCache, version
 
-def cc(input_stream, opt = False):
+def cc(input_stream, opt = False, sink = None, cache = None):
     try:
-        ast = parse(input_stream)
+        # with a cache the AST of a source seen before is not parsed again
+        ast = cache.get(input_stream) if cache else None
+        if ast is None:
+            ast = parse(input_stream)
+            if cache:
+                cache.put(input_stream, ast)
         if opt:
             ast = fold(ast) # constant fold optimizer
         instr_stream = codegen(ast) + [('stop',)]
         if opt:
             peephole_opt(instr_stream) # peephole optimizer
-        bytecode = output(instr_stream)
-        return bytecode
+        # with a sink the bytecode is streamed into it and we return True
+        bytecode = output(instr_stream, sink)
+        return bytecode if sink is None else True
     except Exception as e:
         print('error: ' + str(e))
         return None
@@ -27,6 +35,7 @@ if __name__ == "__main__":
     aparser.add_argument('-O', action='store_true', help='optimization flag')
     aparser.add_argument('input', metavar='input_file', help='cuppa1 input file')
     aparser.add_argument('-o', metavar='output_file', help='exp1bytecode output file')
+    aparser.add_argument('--cache', action='store_true', help='cache the parsed program')
 
     args = vars(aparser.parse_args())
 
@@ -34,12 +43,19 @@ if __name__ == "__main__":
     input_stream = f.read()
     f.close()
 
-    # run the compiler
-    bytecode = cc(input_stream=input_stream, opt=args['O'])
+    if args['cache']:
+        import cuppa1_lexer, cuppa1_fe
+        cache = ParseCache(version(cuppa1_lexer, cuppa1_fe))
+    else:
+        cache = None
 
+    # run the compiler, streaming the bytecode into the output file
     if not args['o']:
-        print(bytecode)
+        cc(input_stream=input_stream, opt=args['O'], sink=sys.stdout, cache=cache)
     else:
-        f = open(args['o'], 'w')
-        f.write(bytecode)
-        f.close()
+        f = OutputFile(args['o'])
+        try:
+            if cc(input_stream=input_stream, opt=args['O'], sink=f, cache=cache):
+                f.commit()
+        finally:
+            f.close()
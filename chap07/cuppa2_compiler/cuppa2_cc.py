@@ -1,17 +1,19 @@
 # Cuppa2 compiler
 
+import sys
 from argparse import ArgumentParser
 from cuppa2_fe import parse
 from cuppa2_codegen import walk as codegen
-from cuppa2_output import output
+from cuppa2_output import output, OutputFile
 
-def cc(input_stream):
+def cc(input_stream, sink=None):
 
     try:
         ast = parse(input_stream)
         instr_stream = codegen(ast) + [('stop',)]
-        bytecode = output(instr_stream)
-        return bytecode
+        # with a sink the bytecode is streamed into it and we return True
+        bytecode = output(instr_stream, sink)
+        return bytecode if sink is None else True
     except Exception as e:
         print('error: ' + str(e))
         return None
@@ -28,12 +30,13 @@ if __name__ == "__main__":
     input_stream = f.read()
     f.close()
 
-    # run the compiler
-    bytecode = cc(input_stream)
-
+    # run the compiler, streaming the bytecode into the output file
     if not args['o']:
-        print(bytecode)
+        cc(input_stream, sink=sys.stdout)
     else:
-        f = open(args['o'], 'w')
-        f.write(bytecode)
-        f.close()
+        f = OutputFile(args['o'])
+        try:
+            if cc(input_stream, sink=f):
+                f.commit()
+        finally:
+            f.close()
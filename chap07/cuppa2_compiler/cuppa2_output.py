@@ -1,27 +1,63 @@
 # This is the output phase of the Cuppa2 compiler
 
 # take a list of Exp1bytecode instruction tuples and format them nicely
-# for output. 
+# for output.
+
+import io
+import os
 
 #########################################################################
-def output(instr_stream):
+def output(instr_stream, sink=None):
+    '''
+    format the instructions and write them to the file-like sink as they
+    arrive from the instruction stream.  Without a sink the formatted program
+    is returned as a string.
+    '''
+    if sink is None:
+        buffer = io.StringIO()
+        output(instr_stream, buffer)
+        return buffer.getvalue()
 
-    output_stream = ''
-    
     for instr in instr_stream:
+        sink.write(format_instr(instr))
+
+    return None
+
+#########################################################################
+class OutputFile:
+    '''
+    a file-like sink for the output file of the compiler.  The output is
+    written to a temporary file next to the output file which replaces
+    the output file on commit().  Closing the sink without a commit
+    removes the temporary file, a failed compilation leaves the output
+    file alone.
+    '''
 
-        if label_def(instr):  # label def - print without preceeding '\t' or trailing ';'
-            output_stream += instr[0] + '\n'
+    def __init__(self, name):
+        self.name = name
+        self.temp_name = '{}.{}.tmp'.format(name, os.getpid())
+        self.file = open(self.temp_name, 'w')
 
-        else:                 # regular instruction - indent and put a ';' at the end
-            output_stream += '\t'
-                
-            for component in instr:
-                output_stream += component + ' '
+    def write(self, s):
+        return self.file.write(s)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.temp_name, self.name)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.temp_name)
+
+#########################################################################
+def format_instr(instr):
 
-            output_stream += ';\n'
+    if label_def(instr):  # label def - print without preceeding '\t' or trailing ';'
+        return instr[0] + '\n'
 
-    return output_stream
+    else:                 # regular instruction - indent and put a ';' at the end
+        return '\t' + ''.join(component + ' ' for component in instr) + ';\n'
 
 #########################################################################
 def label_def(instr_tuple):
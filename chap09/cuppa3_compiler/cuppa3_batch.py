@@ -0,0 +1,129 @@
+# Cuppa3 batch compiler
+#
+# compiles many Cuppa3 programs in parallel on a pool of worker processes,
+# e.g.
+#
+#     python3 cuppa3_batch.py -O -d out .
+#
+# compiles every .txt file in the current directory into a .bc file in the
+# directory out.  A worker compiles many programs one after the other,
+# every program is compiled with a fresh CompilerContext and therefore
+# exactly as by a separate run of cuppa3_cc.  The results are reported in
+# the order of the input files no matter which worker finishes first.
+
+import os
+import sys
+import io
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from cuppa3_cc import cc
+from cuppa3_context import CompilerContext
+from parse_cache import ParseCache, version
+
+# the extension of the output files
+output_ext = '.bc'
+
+def compile_file(job):
+    '''
+    compile a single program, returns (input file, ok, time, messages)
+    where messages are the messages printed by the compiler
+    '''
+    (input_file, output_file, opt, cache) = job
+    start = time.perf_counter()
+    log = io.StringIO()
+    try:
+        with open(input_file, 'r') as f:
+            input_stream = f.read()
+        with redirect_stdout(log):
+            bytecode = cc(input_stream,
+                          opt=opt,
+                          cache=cache,
+                          ctx=CompilerContext())
+        with open(output_file, 'w') as f:
+            f.write(bytecode)
+        ok = True
+    except Exception as e:
+        # cc has printed the error message already
+        if not log.getvalue():
+            log.write('error: ' + str(e) + '\n')
+        ok = False
+    return (input_file, ok, time.perf_counter() - start, log.getvalue())
+
+def source_files(inputs):
+    'the source files named by the inputs, directories contribute their .txt files'
+    files = list()
+    for name in inputs:
+        if os.path.isdir(name):
+            files += sorted(os.path.join(name, f)
+                            for f in os.listdir(name)
+                            if f.endswith('.txt'))
+        else:
+            files.append(name)
+    return files
+
+def batch(files, output_dir, opt=False, cache=None, workers=None):
+    '''
+    compile the files on a pool of worker processes and return the results
+    of compile_file in the order of the files
+    '''
+    jobs = list()
+    for input_file in files:
+        stem = os.path.splitext(os.path.basename(input_file))[0]
+        output_file = os.path.join(output_dir, stem + output_ext)
+        jobs.append((input_file, output_file, opt, cache))
+    workers = workers if workers else os.cpu_count()
+    # hand out the jobs in chunks so that workers are not starved by
+    # the overhead of many small jobs
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(compile_file, jobs, chunksize=chunksize))
+
+def summary(results, elapsed, sink=sys.stdout):
+    'print the per file timings followed by the totals'
+    width = max([len(r[0]) for r in results] + [4])
+    for (input_file, ok, t, messages) in results:
+        print("{:<{}}  {:>9.2f} ms  {}"
+              .format(input_file, width, 1000 * t, 'ok' if ok else 'FAILED'),
+              file=sink)
+        for line in messages.splitlines():
+            print("    " + line, file=sink)
+    failed = len([r for r in results if not r[1]])
+    total = sum(r[2] for r in results)
+    print("{} file(s), {} failed, {:.2f} ms compile time, {:.2f} ms elapsed"
+          .format(len(results), failed, 1000 * total, 1000 * elapsed),
+          file=sink)
+
+if __name__ == "__main__":
+    # parse command line args
+    aparser = ArgumentParser()
+    aparser.add_argument('input', metavar='input', nargs='+', help='cuppa3 input files or directories')
+    aparser.add_argument('-d', metavar='output_dir', default='.', help='directory for the output files')
+    aparser.add_argument('-j', metavar='workers', type=int, default=None, help='number of worker processes')
+    aparser.add_argument('-O', help='optimization flag', action="store_true")
+    aparser.add_argument('--cache', help='cache the rewritten programs', action="store_true")
+
+    args = vars(aparser.parse_args())
+
+    if args['cache']:
+        import cuppa3_lexer, cuppa3_fe, cuppa3_symtab
+        import cuppa3_tree_rewrite, cuppa3_context
+        cache = ParseCache(version(cuppa3_lexer,
+                                   cuppa3_fe,
+                                   cuppa3_tree_rewrite,
+                                   cuppa3_symtab,
+                                   cuppa3_context))
+    else:
+        cache = None
+
+    os.makedirs(args['d'], exist_ok=True)
+    start = time.perf_counter()
+    results = batch(source_files(args['input']),
+                    args['d'],
+                    opt=args['O'],
+                    cache=cache,
+                    workers=args['j'])
+    summary(results, time.perf_counter() - start)
+    if not all(r[1] for r in results):
+        sys.exit(1)
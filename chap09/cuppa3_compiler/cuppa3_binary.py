@@ -0,0 +1,241 @@
+# This is the binary output phase of the Cuppa3 compiler
+
+# take a list of Exp2bytecode instruction tuples and encode them as a
+# binary Exp2bytecode program that the interpreter can load without lexing
+# and parsing the program text.  The layout of a binary program is
+# described in exp2bytecode_binary of the Exp2bytecode interpreter, the
+# constants below have to agree with the ones defined there.
+
+import re
+import struct
+
+MAGIC = b'E2BC'
+VERSION = 1
+
+HEADER = struct.Struct('<4sH4I')
+INSTR = struct.Struct('<4i')
+LABEL = struct.Struct('<2I')
+LENGTH = struct.Struct('<I')
+
+opcodes = [
+    'PRINT',
+    'INPUT',
+    'STORE',
+    'JUMPT',
+    'JUMPF',
+    'JUMP',
+    'CALL',
+    'RETURN',
+    'PUSHV',
+    'POPV',
+    'PUSHF',
+    'POPF',
+    'STOP',
+    'NOOP',
+    ]
+
+exp_codes = [
+    'ADD',
+    'SUB',
+    'MUL',
+    'DIV',
+    'EQ',
+    'LE',
+    'UMINUS',
+    'NOT',
+    'NUMBER',
+    'ID',
+    'RVX',
+    'TSX',
+    ]
+
+#########################################################################
+# The operands of the instructions are Exp2bytecode expressions in text
+# form, e.g. '(+ %tsx[0] 1)'.  We parse them into the expression trees
+# of the Exp2bytecode frontend with a parser following the same grammar,
+# only the tree is stored in the binary program.
+
+operand_tokens = re.compile(r'\s*(%rvx|%tsx|[0-9]+|[a-zA-Z_\$][a-zA-Z0-9_\$]*'
+                            r'|==|=<|[-+*/!()\[\]])')
+
+binops = {
+    '+'  : 'ADD',
+    '*'  : 'MUL',
+    '/'  : 'DIV',
+    '==' : 'EQ',
+    '=<' : 'LE',
+    }
+
+def tokenize_operand(text):
+    tokens = list()
+    pos = 0
+    while pos < len(text.rstrip()):
+        mo = operand_tokens.match(text, pos)
+        if not mo:
+            raise ValueError("unexpected character in operand '{}'".format(text))
+        tokens.append(mo.group(1))
+        pos = mo.end()
+    return tokens
+
+def parse_operand(tokens, ix):
+    # parse the expression starting at token ix, returns the tree and
+    # the index of the token following it
+    tk = tokens[ix]
+    ix += 1
+
+    if tk in binops:
+        (e1, ix) = parse_operand(tokens, ix)
+        (e2, ix) = parse_operand(tokens, ix)
+        return ((binops[tk], e1, e2), ix)
+    elif tk == '-':
+        # binary if another expression follows, unary otherwise
+        (e1, ix) = parse_operand(tokens, ix)
+        if ix < len(tokens) and tokens[ix] not in [')', ']']:
+            (e2, ix) = parse_operand(tokens, ix)
+            return (('SUB', e1, e2), ix)
+        else:
+            return (('UMINUS', e1), ix)
+    elif tk == '!':
+        (e, ix) = parse_operand(tokens, ix)
+        return (('NOT', e), ix)
+    elif tk == '(':
+        (e, ix) = parse_operand(tokens, ix)
+        if tokens[ix] != ')':
+            raise ValueError("expected ')' in operand")
+        return (e, ix + 1)
+    elif tk == '%rvx':
+        return (('RVX',), ix)
+    elif tk == '%tsx':
+        if ix < len(tokens) and tokens[ix] == '[':
+            (e, ix) = parse_operand(tokens, ix + 1)
+            if tokens[ix] != ']':
+                raise ValueError("expected ']' in operand")
+            return (('TSX', e), ix + 1)
+        else:
+            return (('TSX', None), ix)
+    elif tk.isdigit():
+        return (('NUMBER', int(tk)), ix)
+    elif tk[0].isalpha() or tk[0] in '_$':
+        return (('ID', tk), ix)
+    else:
+        raise ValueError("unexpected token '{}' in operand".format(tk))
+
+#########################################################################
+class Pool:
+    'the constant pool of a binary program'
+
+    def __init__(self):
+        self.strings = dict()
+        self.exps = dict()
+
+    def string(self, s):
+        if s not in self.strings:
+            self.strings[s] = len(self.strings)
+        return self.strings[s]
+
+    def exp(self, text):
+        if text not in self.exps:
+            tokens = tokenize_operand(text)
+            (tree, ix) = parse_operand(tokens, 0)
+            if ix != len(tokens):
+                raise ValueError("syntax error in operand '{}'".format(text))
+            cells = list()
+            self.encode(tree, cells)
+            self.exps[text] = (len(self.exps), cells)
+        return self.exps[text][0]
+
+    def encode(self, tree, cells):
+        # encode the tree in prefix order
+        type = tree[0]
+        cells.append(exp_codes.index(type))
+        if type == 'NUMBER':
+            cells.append(tree[1])
+        elif type == 'ID':
+            cells.append(self.string(tree[1]))
+        elif type == 'TSX':
+            if tree[1]:
+                cells.append(1)
+                self.encode(tree[1], cells)
+            else:
+                cells.append(0)
+        elif type != 'RVX':
+            for child in tree[1:]:
+                self.encode(child, cells)
+
+#########################################################################
+def output_binary(instr_stream):
+
+    # compute the instruction index of every label
+    labels = dict()
+    ix = 0
+    for instr in instr_stream:
+        if label_def(instr):
+            labels[instr[0][:-1]] = ix
+        elif instr[0] != '#':
+            ix += 1
+
+    def target(label):
+        if label not in labels:
+            raise ValueError("unknown label {}".format(label))
+        return labels[label]
+
+    pool = Pool()
+    instrs = list()
+    for instr in instr_stream:
+        if label_def(instr) or instr[0] == '#':
+            continue
+        type = instr[0].upper()
+        operands = instr[1:]
+        if type == 'PRINT':
+            encoded = [-1, pool.exp(operands[0])]
+        elif type == 'INPUT':
+            encoded = [-1, pool.exp(operands[0])]
+        elif type == 'STORE':
+            encoded = [pool.exp(operands[0]), pool.exp(operands[1])]
+        elif type in ['JUMPT', 'JUMPF']:
+            encoded = [pool.exp(operands[0]), target(operands[1])]
+        elif type in ['JUMP', 'CALL']:
+            encoded = [target(operands[0])]
+        elif type in ['PUSHV', 'PUSHF', 'POPF']:
+            encoded = [pool.exp(operands[0])]
+        elif type == 'POPV':
+            encoded = [pool.exp(operands[0]) if operands else -1]
+        elif type in opcodes:
+            encoded = []
+        else:
+            raise ValueError("unknown instruction {}".format(instr[0]))
+        encoded += [-1] * (3 - len(encoded))
+        instrs.append(INSTR.pack(opcodes.index(type), *encoded))
+
+    # the label names are pooled after the operands have been encoded,
+    # the expressions may refer to strings as well
+    label_entries = [LABEL.pack(pool.string(name), labels[name])
+                     for name in labels]
+
+    strings = list()
+    for s in pool.strings:
+        data = s.encode('utf-8')
+        strings.append(LENGTH.pack(len(data)) + data)
+
+    exps = list()
+    for (ix, cells) in pool.exps.values():
+        exps.append(LENGTH.pack(len(cells)) +
+                    struct.pack('<{}q'.format(len(cells)), *cells))
+
+    header = HEADER.pack(MAGIC, VERSION,
+                         len(instrs), len(label_entries),
+                         len(strings), len(exps))
+
+    return b''.join([header] + instrs + label_entries + strings + exps)
+
+#########################################################################
+def label_def(instr_tuple):
+
+    instr_name = instr_tuple[0]
+
+    if instr_name[-1] == ':':
+        return True
+    else:
+        return False
+
+#########################################################################
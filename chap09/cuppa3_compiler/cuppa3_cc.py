@@ -1,11 +1,14 @@
 # Cuppa3 compiler
 
+import sys
 from argparse import ArgumentParser
 from cuppa3_fe import parse
 from cuppa3_tree_rewrite import walk as rewrite
 from cuppa3_codegen import walk as codegen
-from cuppa3_output import output
+from cuppa3_output import output, peephole_opt, OutputFile
+from cuppa3_binary import output_binary
 from dumpast import dumpast
+from parse_cache import ParseCache, version
 import pprint
 
 pp = pprint.PrettyPrinter()
@@ -13,22 +16,38 @@ pp = pprint.PrettyPrinter()
 def cc(input_stream,
        ast_switch=False,
        three_address_switch=False,
-       bytecode_switch=False):
+       bytecode_switch=False,
+       binary_switch=False,
+       opt=False,
+       sink=None,
+       cache=None,
+       ctx=None):
 
     try:
-        ast = parse(input_stream)
-        if ast_switch:
-            dumpast(ast)
-            return ""
-        ast = rewrite(ast)
+        # with a cache the rewritten AST of a source seen before is
+        # neither parsed nor rewritten again
+        ast = cache.get(input_stream) if cache and not ast_switch else None
+        if ast is None:
+            ast = parse(input_stream)
+            if ast_switch:
+                dumpast(ast)
+                return ""
+            ast = rewrite(ast, ctx)
+            if cache:
+                cache.put(input_stream, ast)
         if three_address_switch:
             dumpast(ast)
             return ""
-        instr_stream = codegen(ast) + [('stop',)]
+        instr_stream = codegen(ast, ctx) + [('stop',)]
+        if opt:
+            peephole_opt(instr_stream) # peephole optimizer
         if bytecode_switch:
             pp.pprint(instr_stream)
             return ""
-        bytecode = output(instr_stream)
+        if binary_switch:
+            return output_binary(instr_stream)
+        # with a sink the bytecode is streamed into it and we return None
+        bytecode = output(instr_stream, sink)
         return bytecode
     except Exception as e:
         print('error: ' + str(e))
@@ -43,6 +62,9 @@ if __name__ == "__main__":
     aparser.add_argument('-a', help='dump ast', action="store_true")
     aparser.add_argument('-t', help='dump three address code tree', action="store_true")
     aparser.add_argument('-l', help='dump bytecode list', action="store_true")
+    aparser.add_argument('-b', help='emit binary bytecode', action="store_true")
+    aparser.add_argument('-O', help='optimization flag', action="store_true")
+    aparser.add_argument('--cache', help='cache the rewritten program', action="store_true")
 
     args = vars(aparser.parse_args())
 
@@ -65,15 +87,44 @@ if __name__ == "__main__":
     else:
         bytecode_switch = False
 
-    # run the compiler
-    bytecode = cc(input_stream,
-                  ast_switch=ast_switch,
-                  three_address_switch=three_address_switch,
-                  bytecode_switch=bytecode_switch)
+    if args['b']:
+        binary_switch = True
+    else:
+        binary_switch = False
+
+    if args['cache']:
+        import cuppa3_lexer, cuppa3_fe, cuppa3_symtab
+        import cuppa3_tree_rewrite, cuppa3_context
+        cache = ParseCache(version(cuppa3_lexer,
+                                   cuppa3_fe,
+                                   cuppa3_tree_rewrite,
+                                   cuppa3_symtab,
+                                   cuppa3_context))
+    else:
+        cache = None
 
-    if args['o']:
-        f = open(args['o'], 'w')
-        f.write(bytecode)
-        f.close()
+    # run the compiler, text bytecode is streamed into the output file
+    if binary_switch:
+        bytecode = cc(input_stream, binary_switch=True, opt=args['O'], cache=cache)
+        if isinstance(bytecode, bytes):
+            if args['o']:
+                f = open(args['o'], 'wb')
+                f.write(bytecode)
+                f.close()
+            else:
+                sys.stdout.buffer.write(bytecode)
     else:
-        print(bytecode)
+        f = OutputFile(args['o']) if args['o'] else sys.stdout
+        try:
+            cc(input_stream,
+               ast_switch=ast_switch,
+               three_address_switch=three_address_switch,
+               bytecode_switch=bytecode_switch,
+               opt=args['O'],
+               sink=f,
+               cache=cache)
+            if args['o']:
+                f.commit()
+        finally:
+            if args['o']:
+                f.close()
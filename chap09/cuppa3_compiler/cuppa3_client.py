@@ -0,0 +1,51 @@
+# Cuppa3 compiler client
+#
+# compiles a program on a running cuppa3_server instead of starting the
+# compiler, the output is the same as the output of cuppa3_cc
+
+import sys
+from argparse import ArgumentParser
+from compile_server import request, default_socket
+
+# the name of the default socket, see cuppa3_server
+server_name = 'cuppa3-bytecode'
+
+if __name__ == "__main__":
+    # parse command line args
+    aparser = ArgumentParser()
+    aparser.add_argument('input', metavar='input_file', nargs='?', help='cuppa3 input file')
+    aparser.add_argument('-o', metavar='output_file', help='exp2bytecode output file')
+    aparser.add_argument('-O', help='optimization flag', action="store_true")
+    aparser.add_argument('-s', metavar='socket', default=default_socket(server_name), help='socket of the server')
+    aparser.add_argument('--stop', help='stop the server', action="store_true")
+
+    args = vars(aparser.parse_args())
+
+    if args['stop']:
+        message = {'stop': True}
+    elif args['input']:
+        f = open(args['input'], 'r')
+        input_stream = f.read()
+        f.close()
+        message = {'source': input_stream, 'options': {'O': args['O']}}
+    else:
+        aparser.error("an input file is required")
+
+    try:
+        response = request(args['s'], message)
+    except OSError as e:
+        print("error: cannot reach the server on {}: {}".format(args['s'], e))
+        sys.exit(1)
+
+    if not response['ok']:
+        print('error: ' + response['error'])
+        sys.exit(1)
+
+    if args['stop']:
+        sys.exit(0)
+    elif args['o']:
+        f = open(args['o'], 'w')
+        f.write(response['output'])
+        f.close()
+    else:
+        sys.stdout.write(response['output'])
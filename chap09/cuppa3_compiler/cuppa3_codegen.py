@@ -6,16 +6,17 @@ NOTE: this code generator does not need access to the symbol table,
       of the abstract machine code
 '''
 
+from cuppa3_context import default_context
+
 #########################################################################
-# curr_frame_size: we use this global variable to broadcast the frame
-# size of the current function definition to all the statements within
+# ctx.curr_frame_size: we use this field of the context to broadcast the
+# frame size of the current function definition to all the statements within
 # the function body -- the return statement needs this information in order
 # to generate the proper pop frame instruction. Outside of a
 # function definition this value is set to None
-curr_frame_size = None
 
 #########################################################################
-def push_args(args):
+def push_args(args, ctx):
 
     if args[0] != 'LIST':
         raise ValueError("expected an argument list")
@@ -27,7 +28,7 @@ def push_args(args):
     ll.reverse()
     code = list()
     for e in ll:
-        (ecode, eloc) = walk(e)
+        (ecode, eloc) = walk(e, ctx)
         code += ecode
         code += [('pushv', eloc)]
     return code
@@ -45,7 +46,7 @@ def pop_args(args):
     return code
 
 #########################################################################
-def init_formal_args(formal_args, frame_size):
+def init_formal_args(formal_args, frame_size, ctx):
     '''
     in order to understand this function recall that the stack
     in the called function after the frame has been pushed
@@ -91,30 +92,30 @@ def init_formal_args(formal_args, frame_size):
 #########################################################################
 # Statements
 #########################################################################
-def stmtlist(node):
+def stmtlist(node, ctx):
 
     (STMTLIST, lst) = node
 
     code = list()
     for stmt in lst:
-        code += walk(stmt)
+        code += walk(stmt, ctx)
 
     return code
 
 
 #########################################################################
-def fundef_stmt(node):
-
-    global curr_frame_size
+def fundef_stmt(node, ctx):
 
     # unpack node
     (FUNDEF,
      (ADDR, name),
      formal_arglist,
      body,
-     (FRAMESIZE, curr_frame_size)) = node
+     (FRAMESIZE, frame_size)) = node
+
+    ctx.curr_frame_size = frame_size
 
-    ignore_label = label()
+    ignore_label = label(ctx)
     code = list()
 
     code += [('jump', ignore_label)]
@@ -122,10 +123,10 @@ def fundef_stmt(node):
     code += [('#','Start Function ' + name)]
     code += [('#','####################################')]
     code += [(name + ':',)]
-    code += [('pushf', str(curr_frame_size))]
-    code += init_formal_args(formal_arglist, curr_frame_size)
-    code += walk(body)
-    code += [('popf', str(curr_frame_size))]
+    code += [('pushf', str(ctx.curr_frame_size))]
+    code += init_formal_args(formal_arglist, ctx.curr_frame_size, ctx)
+    code += walk(body, ctx)
+    code += [('popf', str(ctx.curr_frame_size))]
     code += [('return',)]
     code += [('#','####################################')]
     code += [('#','End Function ' + name)]
@@ -133,48 +134,46 @@ def fundef_stmt(node):
     code += [(ignore_label + ':',)]
     code += [('noop',)]
 
-    curr_frame_size = None
+    ctx.curr_frame_size = None
 
     return code
 
 #########################################################################
-def call_stmt(node):
+def call_stmt(node, ctx):
 
     (CALLSTMT, (ADDR, name), actual_args) = node
 
     code = list()
 
-    code += push_args(actual_args)
+    code += push_args(actual_args, ctx)
     code += [('call', name)]
     code += pop_args(actual_args)
 
     return code
 
 #########################################################################
-def return_stmt(node):
-    global curr_frame_size
-
+def return_stmt(node, ctx):
     (RETURN, exp) = node
 
     code = list()
 
     # if return has a return value
     if exp[0] != 'NIL':
-        (ecode, eloc) = walk(exp)
+        (ecode, eloc) = walk(exp, ctx)
         code += ecode
         code += [('store', '%rvx', eloc)]
 
-    code += [('popf', str(curr_frame_size))]
+    code += [('popf', str(ctx.curr_frame_size))]
     code += [('return',)]
 
     return code
 
 #########################################################################
-def assign_stmt(node):
+def assign_stmt(node, ctx):
 
     (ASSIGN, (ADDR, target), exp) = node
 
-    (ecode, eloc) = walk(exp)
+    (ecode, eloc) = walk(exp, ctx)
     code = list()
 
     code += ecode
@@ -183,7 +182,7 @@ def assign_stmt(node):
     return code
 
 #########################################################################
-def get_stmt(node):
+def get_stmt(node, ctx):
 
     (GET, (ADDR, target)) = node
 
@@ -192,11 +191,11 @@ def get_stmt(node):
     return code
 
 #########################################################################
-def put_stmt(node):
+def put_stmt(node, ctx):
 
     (PUT, exp) = node
 
-    (ecode, eloc) = walk(exp)
+    (ecode, eloc) = walk(exp, ctx)
     code = list()
 
     code += ecode
@@ -205,14 +204,14 @@ def put_stmt(node):
     return code
 
 #########################################################################
-def while_stmt(node):
+def while_stmt(node, ctx):
 
     (WHILE, cond, body) = node
 
-    top_label = label()
-    bottom_label = label()
-    (cond_code, cond_loc) = walk(cond)
-    body_code = walk(body)
+    top_label = label(ctx)
+    bottom_label = label(ctx)
+    (cond_code, cond_loc) = walk(cond, ctx)
+    body_code = walk(body, ctx)
     code = list()
 
     code += [(top_label + ':',)]
@@ -226,14 +225,14 @@ def while_stmt(node):
     return code
 
 #########################################################################
-def if_stmt(node):
+def if_stmt(node, ctx):
 
     (IF, cond, s1, s2) = node
 
     if s2[0] == 'NIL':
-        end_label = label();
-        (cond_code, cond_loc) = walk(cond)
-        s1_code = walk(s1)
+        end_label = label(ctx);
+        (cond_code, cond_loc) = walk(cond, ctx)
+        s1_code = walk(s1, ctx)
         code = list()
 
         code += cond_code
@@ -244,11 +243,11 @@ def if_stmt(node):
         return code
 
     else:
-        else_label = label()
-        end_label = label()
-        (cond_code, cond_loc) = walk(cond)
-        s1_code = walk(s1)
-        s2_code = walk(s2)
+        else_label = label(ctx)
+        end_label = label(ctx)
+        (cond_code, cond_loc) = walk(cond, ctx)
+        s1_code = walk(s1, ctx)
+        s2_code = walk(s2, ctx)
         code = list()
 
         code += cond_code
@@ -262,18 +261,18 @@ def if_stmt(node):
         return code
 
 #########################################################################
-def block_stmt(node):
+def block_stmt(node, ctx):
 
     (BLOCK, s) = node
 
-    code = walk(s)
+    code = walk(s, ctx)
 
     return code
 
 #########################################################################
 # Expressions
 #########################################################################
-def binop_exp(node):
+def binop_exp(node, ctx):
 
     (OP, (ADDR, target), c1, c2) = node
 
@@ -293,8 +292,8 @@ def binop_exp(node):
     else:
         raise ValueError('unknown operation: ' + OP)
 
-    (lcode, lloc) = walk(c1)
-    (rcode, rloc) = walk(c2)
+    (lcode, lloc) = walk(c1, ctx)
+    (rcode, rloc) = walk(c2, ctx)
     code = list()
 
     code += lcode
@@ -304,12 +303,12 @@ def binop_exp(node):
     return (code, target)
 
 #########################################################################
-def call_exp(node):
+def call_exp(node, ctx):
 
     (CALLEXP, (ADDR, target), (ADDR, name), actual_args) = node
 
     code = list()
-    code += push_args(actual_args)
+    code += push_args(actual_args, ctx)
     code += [('call', name)]
     code += pop_args(actual_args)
     code += [('store', target, '%rvx')]
@@ -317,7 +316,7 @@ def call_exp(node):
     return (code, target)
 
 #########################################################################
-def integer_exp(node):
+def integer_exp(node, ctx):
 
     (INTEGER, value) = node
 
@@ -327,7 +326,7 @@ def integer_exp(node):
     return (code, loc)
 
 #########################################################################
-def addr_exp(node):
+def addr_exp(node, ctx):
 
     (ADDR, loc) = node
 
@@ -336,11 +335,11 @@ def addr_exp(node):
     return (code, loc)
 
 #########################################################################
-def uminus_exp(node):
+def uminus_exp(node, ctx):
 
     (UMINUS, (ADDR, target), e) = node
 
-    (ecode, eloc) = walk(e)
+    (ecode, eloc) = walk(e, ctx)
 
     code = list()
     code += ecode
@@ -350,11 +349,11 @@ def uminus_exp(node):
     return (code, loc)
 
 #########################################################################
-def not_exp(node):
+def not_exp(node, ctx):
 
     (NOT, (ADDR, target), e) = node
 
-    (ecode, eloc) = walk(e)
+    (ecode, eloc) = walk(e, ctx)
 
     code = list()
     code += ecode
@@ -366,12 +365,16 @@ def not_exp(node):
 #########################################################################
 # walk
 #########################################################################
-def walk(node):
+def walk(node, ctx=None):
+    # without a context the walker uses the shared default context
+    if ctx is None:
+        ctx = default_context
+
     node_type = node[0]
 
     if node_type in dispatch_dict:
         node_function = dispatch_dict[node_type]
-        return node_function(node)
+        return node_function(node, ctx)
 
     else:
         raise ValueError("walk: unknown tree node type: " + node_type)
@@ -402,12 +405,9 @@ dispatch_dict = {
 }
 
 #########################################################################
-label_id = 0
-
-def label():
-    global label_id
-    s =  'L' + str(label_id)
-    label_id += 1
+def label(ctx):
+    s =  'L' + str(ctx.label_id)
+    ctx.label_id += 1
     return s
 
 #########################################################################
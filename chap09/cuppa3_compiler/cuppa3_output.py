@@ -1,30 +1,67 @@
 # This is the output phase of the Cuppa3 compiler
 
 # take a list of Exp2bytecode instruction tuples and format them nicely
-# for output. 
+# for output.
+
+import io
+import os
+from peephole import RuleSet, peephole
 
 #########################################################################
-def output(instr_stream):
+def output(instr_stream, sink=None):
+    '''
+    format the instructions and write them to the file-like sink as they
+    arrive from the instruction stream.  Without a sink the formatted program
+    is returned as a string.
+    '''
+    if sink is None:
+        buffer = io.StringIO()
+        output(instr_stream, buffer)
+        return buffer.getvalue()
 
-    output_stream = ''
-    
     for instr in instr_stream:
+        sink.write(format_instr(instr))
+
+    return None
+
+#########################################################################
+class OutputFile:
+    '''
+    a file-like sink for the output file of the compiler.  The output is
+    written to a temporary file next to the output file which replaces
+    the output file on commit().  Closing the sink without a commit
+    removes the temporary file, a failed compilation leaves the output
+    file alone.
+    '''
 
-        if label_def(instr):  # label def - print without preceeding '\t' or trailing ';'
-            output_stream += instr[0] + '\n'
-        
-        elif instr[0] == '#': # comment dummy instruction
-            output_stream += instr[0] + ' ' + instr[1] + '\n'
+    def __init__(self, name):
+        self.name = name
+        self.temp_name = '{}.{}.tmp'.format(name, os.getpid())
+        self.file = open(self.temp_name, 'w')
+
+    def write(self, s):
+        return self.file.write(s)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.temp_name, self.name)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.temp_name)
+
+#########################################################################
+def format_instr(instr):
 
-        else:                 # regular instruction - indent and put a ';' at the end
-            output_stream += '\t'
-                
-            for component in instr:
-                output_stream += component + ' '
+    if label_def(instr):  # label def - print without preceeding '\t' or trailing ';'
+        return instr[0] + '\n'
 
-            output_stream += ';\n'
+    elif instr[0] == '#': # comment dummy instruction
+        return instr[0] + ' ' + instr[1] + '\n'
 
-    return output_stream
+    else:                 # regular instruction - indent and put a ';' at the end
+        return '\t' + ''.join(component + ' ' for component in instr) + ';\n'
 
 #########################################################################
 def label_def(instr_tuple):
@@ -37,3 +74,39 @@ def label_def(instr_tuple):
         return False
 
 #########################################################################
+# the peephole rules for Exp2bytecode, see peephole for the rule language
+exp2bytecode_rules = RuleSet('''
+# a noop following a label is not needed when an instruction follows it
+label-noop:  ?L: ; noop ; ?I      =>  ?L: ; ?I  where not label(?I)
+
+# a noop without a label does nothing
+noop:        noop                 =>            where not label(?prev)
+
+# two labels separated by a noop are merged into the second one
+label-merge: ?L1: ; noop ; ?L2:   =>  ?L2:      do backpatch(?L1, ?L2)
+
+# a jump to the label right after it
+jump-next:   jump ?L ; ?L:        =>  ?L:
+
+# instructions after an unconditional transfer of control without a label
+# can never be reached, e.g. the jump around the else branch of an if
+# statement whose then branch returns
+dead-return: return ; ?I          =>  return    where code(?I)
+dead-jump:   jump ?L ; ?I         =>  jump ?L   where code(?I)
+dead-stop:   stop ; ?I            =>  stop      where code(?I)
+''',
+    label_operands = {
+        'jumpt' : [2],
+        'jumpf' : [2],
+        'jump'  : [1],
+        'call'  : [1],
+    })
+
+#########################################################################
+# apply peephole optimization.  The instruction tuple format is:
+#   (instr_name_str, [param_str1, param_str2, ...])
+def peephole_opt(instr_stream):
+
+    peephole(instr_stream, exp2bytecode_rules)
+
+#########################################################################
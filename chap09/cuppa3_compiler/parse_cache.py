@@ -0,0 +1,168 @@
+'''
+An on-disk cache for the results of our frontends
+
+Lexing, parsing and checking a program is repeated from scratch every time
+a driver runs, even if the program has not changed since the last run.  A
+ParseCache stores the result of the frontend, e.g. the checked AST, in a
+file named after a hash of the source text and of the compiler version so
+that the next run on the same source can load it instead,
+
+    cache = ParseCache(version(cuppa1_lexer, cuppa1_fe))
+    ast = cache.get(input_stream)
+    if ast is None:
+        ast = parse(input_stream)
+        cache.put(input_stream, ast)
+
+The version is a hash of the source files of the modules that compute the
+cached result, changing any of them invalidates all entries made with the
+old code.  The entries are stored with marshal, values therefore have to be
+made up of tuples, lists, dictionaries, strings and numbers.  The total size
+of the cache is limited, when it is exceeded the least recently used
+entries are removed.  A long running process, e.g. a compile server, can
+keep the most recently used entries in memory as well.  The cache is only an
+optimization: unreadable entries count as misses and entries that cannot be
+written are simply not stored.
+'''
+
+import os
+import sys
+import hashlib
+import marshal
+import threading
+from collections import OrderedDict
+
+# the default limit of the total size of the cache files in bytes
+MAX_BYTES = 64 * 1024 * 1024
+
+def default_directory():
+    'the cache directory, PLIPY_CACHE_DIR or ~/.cache/plipy'
+    directory = os.environ.get('PLIPY_CACHE_DIR')
+    if not directory:
+        directory = os.path.join(os.path.expanduser('~'), '.cache', 'plipy')
+    return directory
+
+def version(*modules):
+    'a version string for a compiler made up of the given modules'
+    h = hashlib.sha256()
+    # the marshal format depends on the interpreter
+    h.update("{} {} {}".format(sys.implementation.cache_tag,
+                               marshal.version,
+                               sys.byteorder).encode())
+    for m in modules:
+        with open(m.__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+class ParseCache:
+
+    def __init__(self, version, directory=None, max_bytes=MAX_BYTES, memory_entries=0):
+        self.version = version
+        self.directory = directory if directory else default_directory()
+        self.max_bytes = max_bytes
+        # the marshaled values of the most recently used entries, every
+        # get unmarshals a fresh copy so that callers never share a value
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # e.g. sent to the worker processes of a batch compile, the lock
+        # cannot be pickled and the entries in memory are left behind
+        return (self.version, self.directory, self.max_bytes, self.memory_entries)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def path(self, source):
+        'the file of the entry for the source text'
+        h = hashlib.sha256()
+        h.update(self.version.encode())
+        h.update(b'\0')
+        h.update(source.encode('utf-8', 'surrogatepass'))
+        return os.path.join(self.directory, h.hexdigest() + '.ast')
+
+    def remember(self, path, data):
+        'keep the marshaled value of an entry in memory'
+        if self.memory_entries > 0:
+            with self.lock:
+                self.memory[path] = data
+                self.memory.move_to_end(path)
+                while len(self.memory) > self.memory_entries:
+                    self.memory.popitem(last=False)
+
+    def get(self, source):
+        'the cached value for the source text or None'
+        path = self.path(source)
+        with self.lock:
+            data = self.memory.get(path)
+            if data is not None:
+                self.memory.move_to_end(path)
+        if data is not None:
+            return marshal.loads(data)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            value = marshal.loads(data)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        self.remember(path, data)
+        # the modification time of an entry is the time of its last use
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, source, value):
+        'store the value for the source text'
+        try:
+            data = marshal.dumps(value)
+        except ValueError:
+            # e.g. a tree nested too deeply for marshal
+            return
+        if len(data) > self.max_bytes:
+            return
+        path = self.path(source)
+        self.remember(path, data)
+        # write a temporary file first so that concurrent runs never see
+        # a partially written entry
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def evict(self):
+        'remove the least recently used entries until the cache fits'
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        entries = list()
+        for name in names:
+            if name.endswith('.ast'):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # removed by a concurrent run
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for (mtime, size, path) in entries)
+        entries.sort()
+        for (mtime, size, path) in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
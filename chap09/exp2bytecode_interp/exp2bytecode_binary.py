@@ -0,0 +1,195 @@
+'''
+Loader for binary Exp2bytecode programs
+
+Binary programs are written by the Cuppa3 compiler with the -b switch, see
+cuppa3_binary in the Cuppa3 compiler, and can be loaded without lexing and
+parsing.  All integers are little-endian, the layout of a binary program is
+
+    header:       magic b'E2BC', version (u16), then the number of
+                  instructions, labels, strings and expressions (4 x u32)
+    instructions: 4 x i32 per instruction (opcode, a, b, c)
+    labels:       2 x u32 per label (string index of the name,
+                  instruction index)
+    strings:      u32 length followed by the UTF-8 bytes per string
+    expressions:  u32 number of cells followed by the cells (i64)
+                  per expression
+
+Strings and expressions make up the constant pool, every distinct operand
+of the program is stored exactly once.  The operands of an instruction are
+indices into the pool or, for jumps and calls, the index of the target
+instruction, -1 marks a missing operand.  The operands of each opcode are
+
+    PRINT  string? exp        INPUT  string? storable
+    STORE  storable exp       JUMPT  exp target
+    JUMPF  exp target         JUMP   target
+    CALL   target             PUSHV  exp
+    POPV   storable?          PUSHF  exp
+    POPF   exp                RETURN, STOP, NOOP
+
+Expression trees are stored in prefix order as a sequence of cells, see
+exp_codes below, NUMBER and ID cells are followed by the value and the
+string index of the name, TSX cells by 1 if an offset expression follows
+and 0 otherwise.  Storables are stored as expressions.
+'''
+
+import mmap
+import struct
+from exp2bytecode_interp_state import state
+
+MAGIC = b'E2BC'
+VERSION = 1
+
+HEADER = struct.Struct('<4sH4I')
+INSTR = struct.Struct('<4i')
+LABEL = struct.Struct('<2I')
+LENGTH = struct.Struct('<I')
+
+opcodes = [
+    'PRINT',
+    'INPUT',
+    'STORE',
+    'JUMPT',
+    'JUMPF',
+    'JUMP',
+    'CALL',
+    'RETURN',
+    'PUSHV',
+    'POPV',
+    'PUSHF',
+    'POPF',
+    'STOP',
+    'NOOP',
+    ]
+
+exp_codes = [
+    'ADD',
+    'SUB',
+    'MUL',
+    'DIV',
+    'EQ',
+    'LE',
+    'UMINUS',
+    'NOT',
+    'NUMBER',
+    'ID',
+    'RVX',
+    'TSX',
+    ]
+
+#####################################################################################
+def is_binary(path):
+    'check whether the file is a binary Exp2bytecode program'
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+#####################################################################################
+def decode_exp(cells, ix, strings):
+    # decode the expression tree starting at cell ix, returns the tree
+    # and the index of the cell following it
+    type = exp_codes[cells[ix]]
+    ix += 1
+
+    if type in ['UMINUS', 'NOT']:
+        (e, ix) = decode_exp(cells, ix, strings)
+        return ((type, e), ix)
+
+    elif type == 'NUMBER':
+        return (('NUMBER', str(cells[ix])), ix + 1)
+
+    elif type == 'ID':
+        return (('ID', strings[cells[ix]]), ix + 1)
+
+    elif type == 'RVX':
+        return (('RVX',), ix)
+
+    elif type == 'TSX':
+        if cells[ix]:
+            (offset, ix) = decode_exp(cells, ix + 1, strings)
+            return (('TSX', offset), ix)
+        else:
+            return (('TSX', None), ix + 1)
+
+    else:
+        (e1, ix) = decode_exp(cells, ix, strings)
+        (e2, ix) = decode_exp(cells, ix, strings)
+        return ((type, e1, e2), ix)
+
+#####################################################################################
+def load(path):
+    '''
+    load a binary program into the initialized machine state, the result
+    is the same as parsing the program text with exp2bytecode_fe except
+    that the operands are not compiled yet
+    '''
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            (magic, version, n_instrs, n_labels, n_strings, n_exps) = \
+                HEADER.unpack_from(buffer, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{} is not a version {} Exp2bytecode binary"
+                                 .format(path, VERSION))
+            offset = HEADER.size
+
+            instrs = list(INSTR.iter_unpack(
+                buffer[offset:offset + n_instrs * INSTR.size]))
+            offset += n_instrs * INSTR.size
+
+            labels = list(LABEL.iter_unpack(
+                buffer[offset:offset + n_labels * LABEL.size]))
+            offset += n_labels * LABEL.size
+
+            strings = list()
+            for i in range(n_strings):
+                (length,) = LENGTH.unpack_from(buffer, offset)
+                offset += LENGTH.size
+                strings.append(str(buffer[offset:offset + length], 'utf-8'))
+                offset += length
+
+            exps = list()
+            for i in range(n_exps):
+                (length,) = LENGTH.unpack_from(buffer, offset)
+                offset += LENGTH.size
+                cells = struct.unpack_from('<{}q'.format(length), buffer, offset)
+                offset += 8 * length
+                exps.append(decode_exp(cells, 0, strings)[0])
+
+    # the label table is already resolved, the instructions refer to their
+    # targets by name just like parsed instructions do
+    names = dict()
+    for (name, target) in labels:
+        state.label_table[strings[name]] = target
+        names[target] = strings[name]
+
+    # rebuild the instruction tuples, instructions with the same operand
+    # share its tree so that the operand is compiled only once when the
+    # instructions are linked
+    def exp(ix):
+        return exps[ix]
+
+    def storable(ix):
+        return exps[ix] if ix >= 0 else None
+
+    def string(ix):
+        return strings[ix] if ix >= 0 else None
+
+    for (op, a, b, c) in instrs:
+        type = opcodes[op]
+        if type == 'PRINT':
+            instr = (type, string(a), exp(b))
+        elif type == 'INPUT':
+            instr = (type, string(a), storable(b))
+        elif type == 'STORE':
+            instr = (type, storable(a), exp(b))
+        elif type in ['JUMPT', 'JUMPF']:
+            instr = (type, exp(a), names[b])
+        elif type in ['JUMP', 'CALL']:
+            instr = (type, names[a])
+        elif type in ['PUSHV', 'PUSHF', 'POPF']:
+            instr = (type, exp(a))
+        elif type == 'POPV':
+            instr = (type, storable(a))
+        else:
+            instr = (type,)
+        state.program.append(instr)
+
+    state.instr_ix = len(state.program)
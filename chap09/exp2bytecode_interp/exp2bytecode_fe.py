@@ -97,6 +97,7 @@ def instr(stream):
             s = None
         e = exp(stream)
         stream.match('SEMI')
+        compile_exp(e)
         return ('PRINT', s, e)
     elif stream.pointer().type in ['INPUT']:
         stream.match('INPUT')
@@ -106,24 +107,29 @@ def instr(stream):
             s = None
         v = storable(stream)
         stream.match('SEMI')
+        compile_storable(v)
         return ('INPUT', s, v)
     elif stream.pointer().type in ['STORE']:
         stream.match('STORE')
         s = storable(stream)
         e = exp(stream)
         stream.match('SEMI')
+        compile_storable(s)
+        compile_exp(e)
         return ('STORE', s, e)
     elif stream.pointer().type in ['JUMPT']:
         stream.match('JUMPT')
         e = exp(stream)
         l = label(stream)
         stream.match('SEMI')
+        compile_exp(e)
         return ('JUMPT', e, l)
     elif stream.pointer().type in ['JUMPF']:
         stream.match('JUMPF')
         e = exp(stream)
         l = label(stream)
         stream.match('SEMI')
+        compile_exp(e)
         return ('JUMPF', e, l)
     elif stream.pointer().type in ['JUMP']:
         stream.match('JUMP')
@@ -143,11 +149,13 @@ def instr(stream):
         stream.match('PUSHV')
         e = exp(stream)
         stream.match('SEMI')
+        compile_exp(e)
         return ('PUSHV', e)
     elif stream.pointer().type in ['POPV']:
         stream.match('POPV')
         if stream.pointer().type in ['NAME','RVX','TSX']:
             s = storable(stream)
+            compile_storable(s)
         else:
             s = None
         stream.match('SEMI')
@@ -156,11 +164,13 @@ def instr(stream):
         stream.match('PUSHF')
         s = size(stream)
         stream.match('SEMI')
+        compile_exp(s)
         return ('PUSHF', s)
     elif stream.pointer().type in ['POPF']:
         stream.match('POPF')
         s = size(stream)
         stream.match('SEMI')
+        compile_exp(s)
         return ('POPF', s)
     elif stream.pointer().type in ['STOP']:
         stream.match('STOP')
@@ -305,6 +315,105 @@ def num(stream):
         raise SyntaxError("num: syntax error at {}"
                           .format(stream.pointer().value))
 
+# Operand compilation
+#
+# The operands of an instruction are compiled into Python functions as
+# soon as the instruction is parsed: an expression becomes a function of
+# no arguments computing its value and a storable becomes a function of
+# one argument storing that value.  We do this by translating the tree
+# into Python source which the Python compiler turns into a code object,
+# constants are converted once at translation time and constant offsets
+# into the runtime stack become direct indices relative to the top of
+# the stack.  The code objects are cached by their source text, the
+# compiled operands are kept in state.exp_code and state.store_code keyed
+# by the identity of their trees so that compiling an operand again just
+# returns its function.
+binop_source = {
+    'ADD' : '({} + {})',
+    'SUB' : '({} - {})',
+    'MUL' : '({} * {})',
+    'DIV' : '({} // {})',
+    'EQ'  : '(1 if {} == {} else 0)',
+    'LE'  : '(1 if {} <= {} else 0)',
+    }
+
+code_cache = dict()
+
+def const_value(node):
+    # return the value of a constant expression tree or None
+    if node[0] == 'NUMBER':
+        return int(node[1])
+    elif node[0] == 'UMINUS' and node[1][0] == 'NUMBER':
+        return - int(node[1][1])
+    else:
+        return None
+
+def location_source(storable):
+    # Python source for the location denoted by the storable
+    if storable[0] == 'ID':
+        return 'symbol_table[{!r}]'.format(storable[1])
+    elif storable[0] == 'RVX':
+        return 'state.rvx'
+    elif storable[0] == 'TSX':
+        if not storable[1]:
+            return 'stack[-1]'
+        offset = const_value(storable[1])
+        if offset is not None and offset <= 0:
+            # %tsx[k] is the element k-1 positions from the end
+            return 'stack[{}]'.format(offset - 1)
+        else:
+            return 'stack[len(stack) - 1 + {}]'.format(exp_source(storable[1]))
+    else:
+        raise ValueError("Unknown storable {}".format(storable[0]))
+
+def exp_source(node):
+    # Python source computing the value of the expression tree
+    type = node[0]
+    if type in binop_source:
+        return binop_source[type].format(exp_source(node[1]),
+                                         exp_source(node[2]))
+    elif type == 'UMINUS':
+        return '(- {})'.format(exp_source(node[1]))
+    elif type == 'NOT':
+        return '(0 if {} != 0 else 1)'.format(exp_source(node[1]))
+    elif type == 'NUMBER':
+        return repr(int(node[1]))
+    elif type == 'ID':
+        # variables that were never stored into have the value 0
+        return 'symbol_table.get({!r}, 0)'.format(node[1])
+    elif type in ['RVX', 'TSX']:
+        return location_source(node)
+    else:
+        raise ValueError("Unexpected expression type: {}".format(type))
+
+def make_function(source):
+    # instantiate a function from its source, the source is wrapped in
+    # a factory so that the machine structures are bound as closure
+    # variables of the function
+    if source not in code_cache:
+        factory = ("def factory(symbol_table, stack, state):\n" +
+                   source +
+                   "    return f\n")
+        namespace = dict()
+        exec(compile(factory, '<exp2bytecode>', 'exec'), namespace)
+        code_cache[source] = namespace['factory']
+    return code_cache[source](state.symbol_table, state.runtime_stack, state)
+
+def compile_exp(node):
+    'compile an expression tree into a function computing its value'
+    if id(node) not in state.exp_code:
+        source = "    f = lambda: {}\n".format(exp_source(node))
+        state.exp_code[id(node)] = make_function(source)
+    return state.exp_code[id(node)]
+
+def compile_storable(storable):
+    'compile a storable into a function storing its argument in the storable'
+    if id(storable) not in state.store_code:
+        source = ("    def f(val):\n" +
+                  "        {} = val\n".format(location_source(storable)))
+        state.store_code[id(storable)] = make_function(source)
+    return state.store_code[id(storable)]
+
 # parser top-level driver
 def parse(stream):
     from exp2bytecode_lexer import Lexer
@@ -0,0 +1,233 @@
+'''
+Superinstruction fusion for our Exp2bytecode interpreter
+
+The code generated by the Cuppa3 compiler is dominated by a few recurring
+instruction sequences: the arguments of a call are pushed right before the
+call and popped right after it, a condition is stored into a temporary just
+before a conditional jump tests it, and the function prologue pushes a
+frame immediately followed by the stores copying the actual arguments into
+the frame.  The sequences were picked by profiling the generated code, run
+the interpreter with -p to see which fusions fire on a program and which
+instruction pairs are still dispatched separately.
+
+The fusion pass finds these sequences and the linker installs a single
+handler performing the whole sequence at the start of each of them.  The fused handler is built
+from the Python source of the operands, see exp2bytecode_fe, so that the
+instructions of a sequence execute without any intervening dispatch.  The
+handlers of the remaining instructions of the sequence stay in place, a
+jump into the middle of a sequence still finds a handler for its target.
+Sequences never extend across an entry point, i.e. a label or the return
+address of a call, which guarantees that the fused handlers are the ones
+executed on the hot paths.
+'''
+
+from exp2bytecode_fe import exp_source, location_source, make_function
+from exp2bytecode_interp_state import state
+
+# superinstructions: (name, pattern), a pattern is a list of instruction
+# types, a trailing '+' matches one or more instructions of that type, a
+# trailing '*' zero or more and a trailing '?' zero or one.  When several
+# patterns match at the same index the longest match wins.
+fusions = [
+    ('pushv-call',   ['STORE*', 'PUSHV+', 'CALL']),
+    ('popv-store',   ['POPV+', 'STORE*', 'JUMP?']),
+    ('pushf-store',  ['PUSHF', 'STORE*', 'JUMPF?']),
+    ('store-jumpf',  ['STORE+', 'JUMPF']),
+    ('store-jump',   ['STORE+', 'JUMP']),
+    ('store-return', ['STORE*', 'POPF', 'RETURN']),
+    ('store',        ['STORE', 'STORE+']),
+    ]
+
+#####################################################################################
+def entry_points():
+    # instruction indices where execution can start other than by falling
+    # through from the previous instruction
+    entries = set(state.label_table.values())
+    entries.add(0)
+    for (ix, instr) in enumerate(state.program):
+        if instr[0] == 'CALL':
+            entries.add(ix + 1)
+    return entries
+
+#####################################################################################
+def match(pattern, ix, entries):
+    # return the length of the longest sequence at ix matching the pattern,
+    # zero if there is none
+    program = state.program
+    n = 0
+    for element in pattern:
+        type = element.rstrip('+*?')
+        repeat = element[-1] in '+*'
+        optional = element[-1] in '*?'
+        count = 0
+        while (ix + n < len(program)
+               and program[ix + n][0] == type
+               and (n == 0 or ix + n not in entries)):
+            n += 1
+            count += 1
+            if not repeat:
+                break
+        if count == 0 and not optional:
+            return 0
+    return n
+
+#####################################################################################
+def instr_source(instr):
+    # Python statements performing a straight line instruction
+    type = instr[0]
+
+    if type == 'STORE':
+        # STORE storable exp
+        return ["{} = {}".format(location_source(instr[1]), exp_source(instr[2]))]
+
+    elif type == 'PUSHV':
+        # PUSHV exp
+        return ["stack.append({})".format(exp_source(instr[1]))]
+
+    elif type == 'POPV':
+        # POPV storable?
+        if instr[1]:
+            return ["{} = stack.pop()".format(location_source(instr[1]))]
+        else:
+            return ["stack.pop()"]
+
+    elif type == 'PUSHF':
+        # PUSHF size_exp
+        return ["stack.extend([0] * {})".format(exp_source(instr[1]))]
+
+    elif type == 'POPF':
+        # POPF size_exp
+        return ["for i in range({}):".format(exp_source(instr[1])),
+                "    stack.pop()"]
+
+    else:
+        raise ValueError("Cannot fuse instruction type: {}".format(type))
+
+#####################################################################################
+def exit_source(instr, ix):
+    # Python statements ending a sequence with the instruction at index ix,
+    # the statements return the index of the next instruction
+    type = instr[0]
+
+    if type == 'CALL':
+        # CALL label
+        return ["stack.append({})".format(ix + 1),
+                "return {}".format(state.label_table[instr[1]])]
+
+    elif type == 'JUMPF':
+        # JUMPF exp label
+        return ["return {} if {} else {}".format(ix + 1,
+                                                 exp_source(instr[1]),
+                                                 state.label_table[instr[2]])]
+
+    elif type == 'JUMP':
+        # JUMP label
+        return ["return {}".format(state.label_table[instr[1]])]
+
+    elif type == 'RETURN':
+        # RETURN
+        return ["return stack.pop()"]
+
+    else:
+        return instr_source(instr) + ["return {}".format(ix + 1)]
+
+#####################################################################################
+def fused_handler(ix, length):
+    'build a handler for the length instructions starting at index ix'
+
+    sequence = state.program[ix:ix + length]
+    last_ix = ix + length - 1
+
+    lines = []
+    for instr in sequence[:-2]:
+        lines += instr_source(instr)
+
+    # a conditional jump testing the location just stored into can use
+    # the stored value directly
+    (second_last, last) = sequence[-2:]
+    if (second_last[0] == 'STORE' and last[0] == 'JUMPF'
+        and second_last[1] == last[1]):
+        (STORE, storable, exp) = second_last
+        lines += ["val = {}".format(exp_source(exp)),
+                  "{} = val".format(location_source(storable)),
+                  "return {} if val else {}"
+                  .format(last_ix + 1, state.label_table[last[2]])]
+    else:
+        lines += instr_source(second_last)
+        lines += exit_source(last, last_ix)
+
+    source = "    def f():\n"
+    for line in lines:
+        source += "        " + line + "\n"
+
+    return make_function(source)
+
+#####################################################################################
+def first_types(pattern):
+    # the instruction types a sequence matching the pattern can start with
+    types = set()
+    for element in pattern:
+        types.add(element.rstrip('+*?'))
+        if element[-1] not in '*?':
+            break
+    return types
+
+#####################################################################################
+def fusion_sites():
+    '''
+    find the fusable sequences of the program, returns a dictionary mapping
+    the index of the first instruction of every sequence to the (name,
+    length) of its superinstruction
+    '''
+    program = state.program
+    entries = entry_points()
+    sites = dict()
+
+    # the candidate fusions for each instruction type
+    candidates = dict()
+    for (name, pattern) in fusions:
+        for type in first_types(pattern):
+            candidates.setdefault(type, []).append((name, pattern))
+
+    ix = 0
+    while ix < len(program):
+        best = (None, 1)
+        for (name, pattern) in candidates.get(program[ix][0], []):
+            length = match(pattern, ix, entries)
+            if length > best[1]:
+                best = (name, length)
+        if best[0]:
+            sites[ix] = best
+        ix += best[1]
+
+    return sites
+
+#####################################################################################
+def fusion_report(sites, counts, pairs, top=5):
+    '''
+    format a report of the fusions for a profiled run, counts maps handler
+    indices to the number of times they were dispatched and pairs maps
+    pairs of instruction types to the number of times the second was
+    dispatched right after the first
+    '''
+    lines = ["{:<14}{:>8}{:>14}{:>18}".format('fusion', 'sites', 'executions',
+                                             'dispatches saved')]
+    total_saved = 0
+    for (name, pattern) in fusions:
+        fired = [ix for ix in sites if sites[ix][0] == name]
+        executions = sum(counts.get(ix, 0) for ix in fired)
+        saved = sum(counts.get(ix, 0) * (sites[ix][1] - 1) for ix in fired)
+        total_saved += saved
+        lines.append("{:<14}{:>8}{:>14}{:>18}"
+                     .format(name, len(fired), executions, saved))
+
+    dispatches = sum(counts.values())
+    lines.append("dispatches: {} ({} without fusion)"
+                 .format(dispatches, dispatches + total_saved))
+
+    lines.append("most frequent instruction pairs still dispatched separately:")
+    ranked = sorted(pairs.items(), key=lambda item: item[1], reverse=True)
+    for ((first, second), count) in ranked[:top]:
+        lines.append("  {:<8}{:<8}{:>12}".format(first, second, count))
+
+    return "\n".join(lines)
@@ -1,262 +1,263 @@
 #!/usr/bin/env python3
 
+import sys
 from argparse import ArgumentParser
-from exp2bytecode_fe import parse
+from exp2bytecode_fe import parse, compile_exp, compile_storable
+from exp2bytecode_binary import is_binary, load
+from exp2bytecode_fuse import fusion_sites, fused_handler, fusion_report
 from exp2bytecode_interp_state import state
 from pprint import pprint
 
 #####################################################################################
-def get_tsx():
-    # compute the 'top of stack' index
-    return len(state.runtime_stack) - 1
+# The link phase
+#
+# Before execution the parsed program is linked: labels are resolved to
+# instruction indices and every instruction is turned into a handler, a
+# closure with its operands already bound.  The operands themselves are
+# compiled into Python functions by the frontend, see exp2bytecode_fe.
+# A handler performs its instruction and returns the index of the next
+# instruction, the machine loop simply calls the handler at the current
+# index until it runs off the end of the program.  Handlers are built on
+# the first execution of their instruction, the cost of linking is
+# therefore proportional to the part of the program that actually runs.
+#####################################################################################
+def resolve_label(label):
+    # resolve a label to the index of the instruction it marks
+    if label not in state.label_table:
+        raise ValueError("Unknown label {}".format(label))
+    return state.label_table[label]
 
 #####################################################################################
-def store_storable(storable, val):
-    # store the value in the appropriate storable
-    if storable[0] == 'ID':
-        # ('ID', name)
-        name = storable[1]
-        state.symbol_table[name] = val
-
-    elif storable[0] == 'RVX':
-        # ('RVX',)
-        state.rvx = val
-
-    elif storable[0] == 'TSX':
-        # ('TSX', opt_offset_exp)
-        tsx = get_tsx()
-        if storable[1]:
-            offset = eval_exp_tree(storable[1])
-            state.runtime_stack[tsx+offset] = val
+def link_instr(instr, ix):
+    'turn the instruction at index ix into a handler'
+
+    # instruction format: (type, [arg1, arg2, ...])
+    type = instr[0]
+    next_ix = ix + 1
+    stack = state.runtime_stack
+
+    if type == 'PRINT':
+        # PRINT string? exp
+        e = compile_exp(instr[2])
+        str = instr[1] if instr[1] else ""
+        def handler():
+            print("{}{}".format(str, e()))
+            return next_ix
+
+    elif type == 'INPUT':
+        # INPUT string? storable
+        store = compile_storable(instr[2])
+        str = instr[1] if instr[1] else "Please enter a value: "
+        def handler():
+            store(int(input(str)))
+            return next_ix
+
+    elif type == 'STORE':
+        # STORE storable exp
+        store = compile_storable(instr[1])
+        e = compile_exp(instr[2])
+        def handler():
+            store(e())
+            return next_ix
+
+    elif type == 'CALL':
+        # CALL label
+        target = resolve_label(instr[1])
+        def handler():
+            # push the return address onto the stack
+            stack.append(next_ix)
+            return target
+
+    elif type == 'RETURN':
+        # RETURN
+        # pop the return address off the stack and jump to it
+        handler = stack.pop
+
+    elif type == 'PUSHV':
+        # PUSHV exp
+        e = compile_exp(instr[1])
+        def handler():
+            stack.append(e())
+            return next_ix
+
+    elif type == 'POPV':
+        # POPV storable?
+        if instr[1]:
+            store = compile_storable(instr[1])
+            def handler():
+                store(stack.pop())
+                return next_ix
         else:
-            state.runtime_stack[tsx] = val
+            def handler():
+                stack.pop()
+                return next_ix
+
+    elif type == 'PUSHF':
+        # PUSHF size_exp
+        # pushing a stack frame onto the stack
+        # zeroing out each stack location in the frame
+        size = compile_exp(instr[1])
+        def handler():
+            stack.extend([0] * size())
+            return next_ix
+
+    elif type == 'POPF':
+        # POPF size_exp
+        # popping a stack frame off the stack
+        size = compile_exp(instr[1])
+        def handler():
+            for i in range(size()):
+                stack.pop()
+            return next_ix
+
+    elif type == 'JUMPT':
+        # JUMPT exp label
+        e = compile_exp(instr[1])
+        target = resolve_label(instr[2])
+        def handler():
+            return target if e() else next_ix
+
+    elif type == 'JUMPF':
+        # JUMPF exp label
+        e = compile_exp(instr[1])
+        target = resolve_label(instr[2])
+        def handler():
+            return next_ix if e() else target
+
+    elif type == 'JUMP':
+        # JUMP label
+        target = resolve_label(instr[1])
+        handler = lambda: target
+
+    elif type == 'STOP':
+        # STOP
+        # jump past the end of the program
+        end = len(state.program)
+        handler = lambda: end
+
+    elif type == 'NOOP':
+        # NOOP
+        handler = lambda: next_ix
 
     else:
-        raise ValueError("Unknown storable {}".format(storable[0]))
-
-#####################################################################################
-def interp_program():
-    'execute abstract bytecode machine'
-
-    # We cannot use the list iterator here because we
-    # need to be able to interpret jump instructions
+        raise ValueError("Unexpected instruction type: {}".format(type))
 
-    # start at the first instruction in program
-    state.instr_ix = 0
+    return handler
 
-    # keep interpreting until we run out of instructions
-    # or we hit a 'stop'
-    while True:
-        if state.instr_ix == len(state.program):
-            # no more instructions
-            break
-        else:
-            # get instruction from program
-            instr = state.program[state.instr_ix]
-
-        # instruction format: (type, [arg1, arg2, ...])
-        type = instr[0]
-
-        # interpret instruction
-        if type == 'PRINT':
-            # PRINT string? exp
-            val = eval_exp_tree(instr[2])
-            str = instr[1] if instr[1] else ""
-            print("{}{}".format(str, val))
-            state.instr_ix += 1
-
-        elif type == 'INPUT':
-            # INPUT string? storable
-            storable = instr[2]
-            str = instr[1] if instr[1] else "Please enter a value: "
-            val = int(input(str))
-            store_storable(storable, val)
-            state.instr_ix += 1
-
-        elif type == 'STORE':
-            # STORE storable exp
-            storable = instr[1]
-            exp = instr[2]
-            val = eval_exp_tree(exp)
-            store_storable(storable, val)
-            state.instr_ix += 1
-
-        elif type == 'CALL':
-            # CALL label
-            # push the return address onto the stack
-            state.runtime_stack.append(state.instr_ix+1)
-            # get the target address from the label table
-            label = instr[1]
-            state.instr_ix = state.label_table.get(label)
-
-        elif type == 'RETURN':
-            # RETURN
-            # pop the return address off the stack and jump to it
-            state.instr_ix = state.runtime_stack.pop()
-
-        elif type == 'PUSHV':
-            # PUSHV exp
-            exp_tree = instr[1]
-            val = eval_exp_tree(exp_tree)
-            # push value onto stack
-            state.runtime_stack.append(val)
-            state.instr_ix += 1
-
-        elif type == 'POPV':
-            # POPV storable?
-            storable = instr[1]
-            val = state.runtime_stack.pop()
-            if storable:
-                store_storable(storable, val)
-            state.instr_ix += 1
-
-        elif type == 'PUSHF':
-            # PUSHF size_exp
-            size_val = eval_exp_tree(instr[1])
-            # pushing a stack frame onto the stack
-            # zeroing out each stack location in the frame
-            for i in range(size_val):
-                state.runtime_stack.append(0)
-            state.instr_ix += 1
-
-        elif type == 'POPF':
-            # POPF size_exp
-            size_val = eval_exp_tree(instr[1])
-            # popping a stack frame off the stack
-            for i in range(size_val):
-                state.runtime_stack.pop()
-            state.instr_ix += 1
-
-        elif type == 'JUMPT':
-            # JUMPT exp label
-            val = eval_exp_tree(instr[1])
-            if val:
-                state.instr_ix = state.label_table.get(instr[2])
-            else:
-                state.instr_ix += 1
-
-        elif type == 'JUMPF':
-            # JUMPF exp label
-            val = eval_exp_tree(instr[1])
-            if not val:
-                state.instr_ix = state.label_table.get(instr[2])
+#####################################################################################
+def link_program(sites):
+    '''
+    link the parsed program into a list of instruction handlers, sites maps
+    the indices of the fused instruction sequences to their (name, length)
+    '''
+    program = state.program
+    code = [None] * len(program)
+
+    # report unknown labels before we start executing
+    for instr in program:
+        if instr[0] in ['JUMP', 'CALL']:
+            resolve_label(instr[1])
+        elif instr[0] in ['JUMPT', 'JUMPF']:
+            resolve_label(instr[2])
+
+    def deferred(ix):
+        # build the actual handler on the first execution and replace
+        # ourselves with it
+        def handler():
+            if ix in sites:
+                code[ix] = fused_handler(ix, sites[ix][1])
             else:
-                state.instr_ix += 1
+                code[ix] = link_instr(program[ix], ix)
+            return code[ix]()
+        return handler
 
-        elif type == 'JUMP':
-            # JUMP label
-            state.instr_ix = state.label_table.get(instr[1], None)
+    for ix in range(len(program)):
+        code[ix] = deferred(ix)
 
-        elif type == 'STOP':
-            # STOP
-            break
+    return code
 
-        elif type == 'NOOP':
-            # NOOP
-            state.instr_ix += 1
+#####################################################################################
+def interp_program(fusion=True, profile=False):
+    'execute abstract bytecode machine'
 
-        else:
-            raise ValueError("Unexpected instruction type: {}".format(p[1]))
+    sites = fusion_sites() if fusion else dict()
+    code = link_program(sites)
+    end = len(code)
 
-#####################################################################################
-def eval_exp_tree(node):
-    'walk expression tree and evaluate to an integer value'
-
-    # tree nodes are tuples (TYPE, [arg1, arg2,...])
-
-    type = node[0]
-
-    if type == 'ADD':
-        # ADD exp exp
-        v_left = eval_exp_tree(node[1])
-        v_right = eval_exp_tree(node[2])
-        return v_left + v_right
-
-    elif type == 'SUB':
-        # SUB exp exp
-        v_left = eval_exp_tree(node[1])
-        v_right = eval_exp_tree(node[2])
-        return v_left - v_right
-
-    elif type == 'MUL':
-        # MUL exp exp
-        v_left = eval_exp_tree(node[1])
-        v_right = eval_exp_tree(node[2])
-        return v_left * v_right
-
-    elif type == 'DIV':
-        # DIV exp exp
-        v_left = eval_exp_tree(node[1])
-        v_right = eval_exp_tree(node[2])
-        return v_left // v_right
-
-    elif type == 'EQ':
-        # EQ exp exp
-        v_left = eval_exp_tree(node[1])
-        v_right = eval_exp_tree(node[2])
-        return 1 if v_left == v_right else 0
-
-    elif type == 'LE':
-        # LE exp exp
-        v_left = eval_exp_tree(node[1])
-        v_right = eval_exp_tree(node[2])
-        return 1 if v_left <= v_right else 0
-
-    elif type == 'UMINUS':
-        # 'UMINUS' exp
-        val = eval_exp_tree(node[1])
-        return - val
-
-    elif type == 'NOT':
-        # NOT exp
-        val = eval_exp_tree(node[1])
-        return 0 if val != 0 else 1
-
-    elif type == 'ID':
-        # ID var_name
-        return state.symbol_table.get(node[1],0)
-
-    elif type == 'RVX':
-        # RVX
-        return state.rvx
-
-    elif type == 'TSX':
-        # TSX opt_offset
-        tsx = get_tsx()
-        offset_exp = node[1]
-        if offset_exp:
-            val = eval_exp_tree(offset_exp)
-            return state.runtime_stack[tsx+val]
-        else:
-            return state.runtime_stack[tsx]
+    if profile:
+        profile_program(code, sites)
+        return
 
-    elif type == 'NUMBER':
-        # NUMBER val
-        return int(node[1])
+    # start at the first instruction in program and keep interpreting
+    # until we run out of instructions or we hit a 'stop'
+    ix = 0
+    while ix < end:
+        ix = code[ix]()
 
-    else:
-        raise ValueError("Unexpected expression type: {}".format(type))
+#####################################################################################
+def profile_program(code, sites):
+    'execute the linked program counting dispatches, then report on the fusions'
+
+    program = state.program
+    end = len(code)
+    counts = dict()
+    pairs = dict()
+
+    # the type of the last instruction performed by the handler at each index
+    last_type = [program[ix + sites[ix][1] - 1][0] if ix in sites else instr[0]
+                 for (ix, instr) in enumerate(program)]
+
+    prev_ix = None
+    ix = 0
+    while ix < end:
+        counts[ix] = counts.get(ix, 0) + 1
+        if prev_ix is not None:
+            pair = (last_type[prev_ix], program[ix][0])
+            pairs[pair] = pairs.get(pair, 0) + 1
+        prev_ix = ix
+        ix = code[ix]()
+
+    print(fusion_report(sites, counts, pairs), file=sys.stderr)
 
 #####################################################################################
-def interp(input_stream):
+def interp(input_stream, fusion=True, profile=False):
     'driver for our Exp2bytecode interpreter.'
     # initialize our abstract machine
     state.initialize()
     # build the IR
     parse(input_stream)
     # interpret the IR
-    interp_program()
+    interp_program(fusion, profile)
+
+#####################################################################################
+def interp_binary(path, fusion=True, profile=False):
+    'driver for binary Exp2bytecode programs.'
+    # initialize our abstract machine
+    state.initialize()
+    # load the IR
+    load(path)
+    # interpret the IR
+    interp_program(fusion, profile)
 
 #####################################################################################
 if __name__ == '__main__':
     # parse command line args
     aparser = ArgumentParser()
     aparser.add_argument('input')
+    aparser.add_argument('-n',
+                         action='store_true',
+                         help='do not fuse instruction sequences')
+    aparser.add_argument('-p',
+                         action='store_true',
+                         help='profile the run and report on the fusions')
 
     args = vars(aparser.parse_args())
 
-    f = open(args['input'], 'r')
-    input_stream = f.read()
-    f.close()
+    if is_binary(args['input']):
+        interp_binary(args['input'], fusion=not args['n'], profile=args['p'])
+    else:
+        f = open(args['input'], 'r')
+        input_stream = f.read()
+        f.close()
 
-    interp(input_stream=input_stream)
+        interp(input_stream=input_stream, fusion=not args['n'], profile=args['p'])
@@ -12,5 +12,8 @@ class State:
         self.runtime_stack = list()
         self.instr_ix = 0
         self.rvx = None # return value register
+        # compiled operands keyed by the identity of their trees
+        self.exp_code = dict()
+        self.store_code = dict()
 
 state = State()
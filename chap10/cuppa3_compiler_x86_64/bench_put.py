@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# Benchmark for the output of the tinyrts runtime system
+#
+# Compiles a Cuppa3 program printing the integers 0 to n-1, assembles and
+# links it with tinyrts.s and reports the run time with the output
+# written to /dev/null and to a pipe.
+#
+# usage: python bench_put.py [number of integers]
+
+import os
+import subprocess
+import tempfile
+from time import perf_counter
+from cuppa3_cc import cc
+
+program = '''
+declare i = 0;
+while (i =< {}) {{
+    put i;
+    i = i + 1;
+}}
+'''
+
+def build(n, dir):
+    asm = os.path.join(dir, 'put.s')
+    obj = os.path.join(dir, 'put.o')
+    rts = os.path.join(dir, 'tinyrts.o')
+    exe = os.path.join(dir, 'put')
+    code = cc(program.format(n - 1), opt=True)
+    with open(asm, 'w') as f:
+        f.write(code)
+    subprocess.run(['as', asm, '-o', obj], check=True)
+    subprocess.run(['as', 'tinyrts.s', '-o', rts], check=True)
+    subprocess.run(['ld', obj, rts, '-o', exe], check=True)
+    return exe
+
+def bench(name, exe, sink):
+    start = perf_counter()
+    subprocess.run([exe], stdout=sink, check=True)
+    elapsed = perf_counter() - start
+    print("  {:10} {:8.2f}ms".format(name, 1e3 * elapsed), flush=True)
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    with tempfile.TemporaryDirectory() as dir:
+        exe = build(n, dir)
+        print("put ({} integers)".format(n))
+        with open(os.devnull, 'w') as null:
+            bench('/dev/null', exe, null)
+        bench('pipe', exe, subprocess.PIPE)
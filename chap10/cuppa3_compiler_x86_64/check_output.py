@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# Check that the Cuppa3 compiler only writes its output file on success
+#
+# Compiles a valid and a broken program with -o into a temporary
+# directory.  The valid program has to produce the output file, the
+# broken one must not leave an output file or a temporary file behind.
+#
+# usage: python check_output.py
+
+import os
+import subprocess
+import sys
+import tempfile
+
+drivers = ['cuppa3_cc.py']
+
+good = 'declare inc (x) return x+1;\ndeclare y = inc(1);\nput y;\n'
+
+bad = 'x = ;\n'
+
+def compile(driver, source, dir):
+    input = os.path.join(dir, 'input.txt')
+    output = os.path.join(dir, 'output.s')
+    with open(input, 'w') as f:
+        f.write(source)
+    subprocess.run([sys.executable, driver, input, '-o', output],
+                   stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    return output
+
+if __name__ == "__main__":
+    for driver in drivers:
+        with tempfile.TemporaryDirectory() as dir:
+            output = compile(driver, bad, dir)
+            assert not os.path.exists(output), driver + ': output of a failed compile'
+            assert os.listdir(dir) == ['input.txt'], driver + ': temporary file left behind'
+            output = compile(driver, good, dir)
+            assert os.path.getsize(output) > 0, driver + ': no output'
+            assert sorted(os.listdir(dir)) == ['input.txt', 'output.s']
+        print(driver + ': ok')
@@ -0,0 +1,105 @@
+'''
+A local compile server and its client
+
+Starting Python and importing a compiler takes much longer than compiling
+a small program.  A compile server is started once, keeps the compiler
+and its caches loaded and compiles the programs sent to it over a UNIX
+domain socket.  Every connection carries a single request: the client
+sends a JSON object and shuts down its side of the connection, the server
+answers with a JSON object and closes the connection,
+
+    request   {"source": <program>, "options": {<name>: <value>, ...}}
+    response  {"ok": true, "output": <output>}
+              {"ok": false, "error": <message>}
+
+The meaning of the options and of the output is up to the compile function
+the server was started with, a request {"stop": true} stops the server.
+Every request is handled on a thread of its own, the compile function
+therefore has to be thread safe, e.g. by compiling with a fresh
+CompilerContext per request.
+'''
+
+import os
+import json
+import socket
+import socketserver
+import tempfile
+import threading
+
+def default_socket(name):
+    'the default socket of a server, private to the user'
+    return os.path.join(tempfile.gettempdir(),
+                        "{}-{}.sock".format(name, os.getuid()))
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        stop = False
+        try:
+            request = json.loads(self.rfile.read().decode('utf-8'))
+            if not isinstance(request, dict):
+                raise ValueError("a request has to be a JSON object")
+            if request.get('stop'):
+                stop = True
+                response = {'ok': True, 'output': ''}
+            else:
+                source = request.get('source')
+                options = request.get('options', {})
+                # the compile function gets what it expects or nothing,
+                # a bad request is not a failing program
+                if not isinstance(source, str):
+                    raise ValueError("the source of a request has to be a string")
+                if not isinstance(options, dict):
+                    raise ValueError("the options of a request have to be an object")
+                output = self.server.compile(source, options)
+                response = {'ok': True, 'output': output}
+        except Exception as e:
+            response = {'ok': False, 'error': str(e)}
+        self.wfile.write(json.dumps(response).encode('utf-8'))
+        if stop:
+            # the response is out, shutdown waits for serve_forever and
+            # therefore cannot be called on the thread of a request
+            threading.Thread(target=self.server.shutdown).start()
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path, compile):
+        self.compile = compile
+        if os.path.exists(path):
+            # a socket nobody listens on is left over from a server that
+            # did not shut down cleanly
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                    s.connect(path)
+                raise ValueError("a server is already listening on {}".format(path))
+            except ConnectionRefusedError:
+                os.remove(path)
+        super().__init__(path, RequestHandler)
+
+def serve(path, compile):
+    '''
+    serve requests on the socket path until a stop request arrives,
+    compile(source, options) returns the output for a request
+    '''
+    server = CompileServer(path, compile)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+
+def request(path, message):
+    'send a request to the server on the socket path and return the response'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall(json.dumps(message).encode('utf-8'))
+        s.shutdown(socket.SHUT_WR)
+        chunks = list()
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b''.join(chunks).decode('utf-8'))
@@ -1,12 +1,15 @@
 # Cuppa3 compiler
 
+import sys
 from argparse import ArgumentParser
 from cuppa3_fe import parse
 from cuppa3_tree_rewrite import walk as rewrite
+from cuppa3_regalloc import allocate, locations
 from cuppa3_codegen import walk as codegen
-from cuppa3_output import output, output_data
-from cuppa3_symtab import symtab
+from cuppa3_output import output, output_data, peephole_opt, OutputFile
+from cuppa3_context import default_context
 from dumpast import dumpast
+from parse_cache import ParseCache, version
 import pprint
 
 pp = pprint.PrettyPrinter()
@@ -14,16 +17,44 @@ pp = pprint.PrettyPrinter()
 def cc(input_stream,
        ast_switch=False,
        three_address_switch=False,
-       bytecode_switch=False):
+       bytecode_switch=False,
+       opt=False,
+       sink=None,
+       cache=None,
+       ctx=None):
 
-    try:
-        ast = parse(input_stream)
+    # without a context of its own the compilation uses the default context
+    if ctx is None:
+        ctx = default_context
 
-        if ast_switch:
-            dumpast(ast)
-            return ""
-
-        ast = rewrite(ast)
+    try:
+        # with a cache the rewritten AST of a source seen before is
+        # neither parsed nor rewritten again, the global variables
+        # declared by the rewriter are cached along with it
+        entry = cache.get(input_stream) if cache and not ast_switch else None
+
+        if entry is not None:
+            (ast, global_vars) = entry
+            ctx.symtab.global_vars = list(global_vars)
+        else:
+            ast = parse(input_stream)
+
+            if ast_switch:
+                dumpast(ast)
+                return ""
+
+            ast = rewrite(ast, ctx)
+
+            if cache:
+                cache.put(input_stream, (ast, ctx.symtab.global_vars))
+
+        # the optimizer keeps values in registers, the global variables
+        # living in registers now are not needed in .data anymore
+        data = ctx.symtab.global_vars
+        if opt:
+            ast = allocate(ast, ctx)
+            used = locations(ast, set())
+            data = [(name, size) for (name, size) in data if name in used]
 
         if three_address_switch:
             dumpast(ast)
@@ -35,15 +66,24 @@ def cc(input_stream,
         instr_stream += [('.text',)]
         instr_stream += [('.global','_start')]
         instr_stream += [('_start:',)]
-        instr_stream += codegen(ast)
+        instr_stream += codegen(ast, ctx)
         instr_stream += [('call','exit')]
 
+        if opt:
+            peephole_opt(instr_stream) # peephole optimizer
+
         if bytecode_switch:
             pp.pprint(instr_stream)
             return ""
 
+        # with a sink the assembly code is streamed into it and we return None
+        if sink:
+            output_data(data, sink)
+            output(instr_stream, sink)
+            return None
+
         bytecode = ''
-        bytecode += output_data(symtab.global_vars)
+        bytecode += output_data(data)
         bytecode += output(instr_stream)
 
         return bytecode
@@ -61,6 +101,8 @@ if __name__ == "__main__":
     aparser.add_argument('-a', help='dump ast', action="store_true")
     aparser.add_argument('-t', help='dump three address code tree', action="store_true")
     aparser.add_argument('-l', help='dump bytecode list', action="store_true")
+    aparser.add_argument('-O', help='optimization flag', action="store_true")
+    aparser.add_argument('--cache', help='cache the rewritten program', action="store_true")
 
     args = vars(aparser.parse_args())
 
@@ -83,15 +125,29 @@ if __name__ == "__main__":
     else:
         bytecode_switch = False
 
-    # run the compiler
-    bytecode = cc(input_stream,
-                  ast_switch=ast_switch,
-                  three_address_switch=three_address_switch,
-                  bytecode_switch=bytecode_switch)
-
-    if args['o']:
-        f = open(args['o'], 'w')
-        f.write(bytecode)
-        f.close()
+    if args['cache']:
+        import cuppa3_lexer, cuppa3_fe, cuppa3_symtab
+        import cuppa3_tree_rewrite, cuppa3_context
+        cache = ParseCache(version(cuppa3_lexer,
+                                   cuppa3_fe,
+                                   cuppa3_tree_rewrite,
+                                   cuppa3_symtab,
+                                   cuppa3_context))
     else:
-        print(bytecode)
+        cache = None
+
+    # run the compiler, streaming the assembly code into the output file
+    f = OutputFile(args['o']) if args['o'] else sys.stdout
+    try:
+        cc(input_stream,
+           ast_switch=ast_switch,
+           three_address_switch=three_address_switch,
+           bytecode_switch=bytecode_switch,
+           opt=args['O'],
+           sink=f,
+           cache=cache)
+        if args['o']:
+            f.commit()
+    finally:
+        if args['o']:
+            f.close()
@@ -8,16 +8,22 @@ NOTE: this code generator does not need access to the symbol table,
 we map all integers into 8 byte words on the target machine.
 '''
 
+from cuppa3_context import default_context
+from cuppa3_regalloc import reg64
+
 #########################################################################
-# curr_frame_size: we use this global variable to broadcast the frame
-# size of the current function definition to all the statements within
+# ctx.curr_frame_size: we use this field of the context to broadcast the
+# frame size of the current function definition to all the statements within
 # the function body -- the return statement needs this information in order
 # to generate the proper pop frame instruction. Outside of a
 # function definition this value is set to None
-curr_frame_size = None
+#
+# ctx.curr_saved_regs: the callee-saved registers the register allocator
+# assigned in the current function, they are pushed on entry and popped
+# again when the function returns, see cuppa3_regalloc
 
 #########################################################################
-def push_args(args):
+def push_args(args, ctx):
 
     if args[0] != 'LIST':
         raise ValueError("expected an argument list")
@@ -29,9 +35,9 @@ def push_args(args):
     ll.reverse()
     code = list()
     for e in ll:
-        (ecode, eloc) = walk(e)
+        (ecode, eloc) = walk(e, ctx)
         code += ecode
-        code += [('push', eloc)]
+        code += [('push', reg64.get(eloc, eloc))]
     return code
 
 #########################################################################
@@ -47,7 +53,7 @@ def pop_args(args):
     return code
 
 #########################################################################
-def init_formal_args(formal_args):
+def init_formal_args(formal_args, ctx):
     '''
     in order to understand this function recall that the stack
     in the called function after the frame has been pushed
@@ -59,14 +65,13 @@ def init_formal_args(formal_args):
                ...
                actual arg 1
                return address
+               saved registers
                local var m
                local var m-1
                local var 1     <- %rsp
 
     The local vars include the formal parameters. Here the frame size is m.
     '''
-    global curr_frame_size
-
     if formal_args[0] != 'LIST':
         raise ValueError("expected an argument list")
 
@@ -78,41 +83,93 @@ def init_formal_args(formal_args):
         (ADDR, sym) = id
         # the last term in the following expression is the size of
         # the return address.
-        offset = str(arg_ix*8 + curr_frame_size*8 + 1*8)
+        offset = str(arg_ix*8
+                     + ctx.curr_frame_size*8
+                     + len(ctx.curr_saved_regs)*8
+                     + 1*8)
         code += [('mov', str(offset)+'(%rsp)', '%eax')]
         code += [('mov', '%eax', sym)]
         arg_ix += 1
 
     return code
 
+#########################################################################
+def register(loc):
+    'is the location a register assigned by the register allocator'
+    return loc in reg64
+
+def jump_if_false(cond, false_label, ctx):
+    '''
+    evaluate the condition and jump to false_label if it is false, a
+    comparison whose value would end up in a register jumps right on the
+    result of the comparison instead
+    '''
+    if cond[0] in ['EQ', 'LE'] and register(cond[1][1]):
+        (OP, (ADDR, target), c1, c2) = cond
+        (lcode, lloc) = walk(c1, ctx)
+        (rcode, rloc) = walk(c2, ctx)
+        code = list()
+        code += lcode
+        code += rcode
+        code += [('mov', lloc, '%eax')]
+        code += [('cmp', rloc, '%eax')]
+        code += [('jne' if OP == 'EQ' else 'jg', false_label)]
+        return code
+
+    (cond_code, cond_loc) = walk(cond, ctx)
+    code = list()
+    code += cond_code
+    if register(cond_loc):
+        code += [('cmp', '$0', cond_loc)]
+    else:
+        code += [('mov', '$0', '%eax')]
+        code += [('cmp', cond_loc, '%eax')]
+    code += [('je', false_label)]
+    return code
+
+#########################################################################
+def pop_frame(ctx):
+    '''
+    pop the frame of the current function, restore the saved registers
+    and return
+    '''
+    code = list()
+    code += [('add', '$'+str(ctx.curr_frame_size*8), '%rsp')]
+    code += [('pop', r) for r in reversed(ctx.curr_saved_regs)]
+    code += [('ret',)]
+    return code
+
 #########################################################################
 # node functions
 #########################################################################
 # Statements
 #########################################################################
-def stmtlist(node):
+def stmtlist(node, ctx):
 
     (STMTLIST, lst) = node
 
     code = list()
     for stmt in lst:
-        code += walk(stmt)
+        code += walk(stmt, ctx)
 
     return code
 
 #########################################################################
-def fundef_stmt(node):
-
-    global curr_frame_size
+def fundef_stmt(node, ctx):
 
-    # unpack node
+    # unpack node, after register allocation the node lists the
+    # callee-saved registers used by the function
     (FUNDEF,
      (ADDR, name),
      formal_arglist,
      body,
-     (FRAMESIZE, curr_frame_size)) = node
+     (FRAMESIZE, frame_size),
+     *saved) = node
 
-    ignore_label = label()
+    ctx.curr_frame_size = frame_size
+    ctx.curr_saved_regs = saved[0][1] if saved else []
+
+    ignore_label = label(ctx)
     code = list()
 
     code += [('jmp', ignore_label)]
@@ -120,38 +177,37 @@ def fundef_stmt(node):
     code += [('#','Start Function ' + name)]
     code += [('#','####################################')]
     code += [(name + ':',)]
-    code += [('sub', '$'+str(curr_frame_size*8), '%rsp')]
-    code += init_formal_args(formal_arglist)
-    code += walk(body)
-    code += [('add', '$'+str(curr_frame_size*8), '%rsp')]
-    code += [('ret',)]
+    code += [('push', r) for r in ctx.curr_saved_regs]
+    code += [('sub', '$'+str(ctx.curr_frame_size*8), '%rsp')]
+    code += init_formal_args(formal_arglist, ctx)
+    code += walk(body, ctx)
+    code += pop_frame(ctx)
     code += [('#','####################################')]
     code += [('#','End Function ' + name)]
     code += [('#','####################################')]
     code += [(ignore_label + ':',)]
     code += [('nop',)]
 
-    curr_frame_size = None
+    ctx.curr_frame_size = None
+    ctx.curr_saved_regs = []
 
     return code
 
 #########################################################################
-def call_stmt(node):
+def call_stmt(node, ctx):
 
     (CALLSTMT, (ADDR, name), actual_args) = node
 
     code = list()
 
-    code += push_args(actual_args)
+    code += push_args(actual_args, ctx)
     code += [('call', name)]
     code += pop_args(actual_args)
 
     return code
 
 #########################################################################
-def return_stmt(node):
-
-    global curr_frame_size
+def return_stmt(node, ctx):
 
     (RETURN, exp) = node
 
@@ -159,31 +215,35 @@ def return_stmt(node):
 
     # if return has a return value
     if exp[0] != 'NIL':
-        (ecode, eloc) = walk(exp)
+        (ecode, eloc) = walk(exp, ctx)
         code += ecode
         code += [('mov', eloc, '%eax')]
 
-    code += [('add', '$'+str(curr_frame_size*8), '%rsp')]
-    code += [('ret',)]
+    code += pop_frame(ctx)
 
     return code
 
 #########################################################################
-def assign_stmt(node):
+def assign_stmt(node, ctx):
 
     (ASSIGN, (ADDR, target), exp) = node
 
-    (ecode, eloc) = walk(exp)
+    (ecode, eloc) = walk(exp, ctx)
     code = list()
 
     code += ecode
-    code += [('mov', eloc, '%eax')]
-    code += [('mov', '%eax', target)]
+    if register(target) or register(eloc):
+        # at most one of the operands is in memory
+        if eloc != target:
+            code += [('mov', eloc, target)]
+    else:
+        code += [('mov', eloc, '%eax')]
+        code += [('mov', '%eax', target)]
 
     return code
 
 #########################################################################
-def get_stmt(node):
+def get_stmt(node, ctx):
 
     (GET, (ADDR, target)) = node
 
@@ -194,36 +254,33 @@ def get_stmt(node):
     return code
 
 #########################################################################
-def put_stmt(node):
+def put_stmt(node, ctx):
 
     (PUT, exp) = node
 
-    (ecode, eloc) = walk(exp)
+    (ecode, eloc) = walk(exp, ctx)
     code = list()
 
     code += ecode
-    code += [('push', eloc)]
+    code += [('push', reg64.get(eloc, eloc))]
     code += [('call', 'put')]
     code += [('add', '$8', '%rsp')]
 
     return code
 
 #########################################################################
-def while_stmt(node):
+def while_stmt(node, ctx):
 
     (WHILE, cond, body) = node
 
-    top_label = label()
-    bottom_label = label()
-    (cond_code, cond_loc) = walk(cond)
-    body_code = walk(body)
+    top_label = label(ctx)
+    bottom_label = label(ctx)
+    cond_code = jump_if_false(cond, bottom_label, ctx)
+    body_code = walk(body, ctx)
     code = list()
 
     code += [(top_label + ':',)]
     code += cond_code
-    code += [('mov', '$0', '%eax')]
-    code += [('cmp', cond_loc, '%eax')]
-    code += [('je', bottom_label)]
     code += body_code
     code += [('jmp', top_label)]
     code += [(bottom_label + ':',)]
@@ -232,20 +289,17 @@ def while_stmt(node):
     return code
 
 #########################################################################
-def if_stmt(node):
+def if_stmt(node, ctx):
 
     (IF, cond, s1, s2) = node
 
     if s2[0] == 'NIL':
-        end_label = label();
-        (cond_code, cond_loc) = walk(cond)
-        s1_code = walk(s1)
+        end_label = label(ctx);
+        cond_code = jump_if_false(cond, end_label, ctx)
+        s1_code = walk(s1, ctx)
         code = list()
 
         code += cond_code
-        code += [('mov', '$0', '%eax')]
-        code += [('cmp', cond_loc, '%eax')]
-        code += [('je', end_label)]
         code += s1_code
         code += [(end_label + ':',)]
         code += [('nop',)]
@@ -253,17 +307,14 @@ def if_stmt(node):
         return code
 
     else:
-        else_label = label()
-        end_label = label()
-        (cond_code, cond_loc) = walk(cond)
-        s1_code = walk(s1)
-        s2_code = walk(s2)
+        else_label = label(ctx)
+        end_label = label(ctx)
+        cond_code = jump_if_false(cond, else_label, ctx)
+        s1_code = walk(s1, ctx)
+        s2_code = walk(s2, ctx)
         code = list()
 
         code += cond_code
-        code += [('mov', '$0', '%eax')]
-        code += [('cmp', cond_loc, '%eax')]
-        code += [('je', else_label)]
         code += s1_code
         code += [('jmp', end_label)]
         code += [(else_label + ':',)]
@@ -274,18 +325,18 @@ def if_stmt(node):
         return code
 
 #########################################################################
-def block_stmt(node):
+def block_stmt(node, ctx):
 
     (BLOCK, s) = node
 
-    code = walk(s)
+    code = walk(s, ctx)
 
     return code
 
 #########################################################################
 # Expressions
 #########################################################################
-def binop_exp(node):
+def binop_exp(node, ctx):
 
     (OP, (ADDR, target), c1, c2) = node
 
@@ -302,14 +353,37 @@ def binop_exp(node):
         INSTR = 'idiv'
     elif OP == 'EQ':
         INSTR = 'jne'
+        SETCC = 'sete'
     elif OP == 'LE':
         INSTR = 'jg'
+        SETCC = 'setle'
 
-    (lcode, lloc) = walk(c1)
-    (rcode, rloc) = walk(c2)
+    (lcode, lloc) = walk(c1, ctx)
+    (rcode, rloc) = walk(c2, ctx)
     code = list()
 
-    if OP in ['PLUS', 'MINUS', 'MUL', 'DIV']:
+    if register(target) and rloc == target and OP in ['PLUS', 'MUL']:
+        # the right operand already is in the register of the value
+        code += lcode
+        code += rcode
+        code += [(INSTR, lloc, target)]
+    elif register(target) and rloc != target and OP in ['PLUS', 'MINUS', 'MUL']:
+        # compute the value right in its register, the right operand
+        # must not live in that register since we overwrite it first
+        code += lcode
+        code += rcode
+        if lloc != target:
+            code += [('mov', lloc, target)]
+        code += [(INSTR, rloc, target)]
+    elif register(target) and OP in ['EQ', 'LE']:
+        # in a register the truth value is computed without jumps
+        code += lcode
+        code += rcode
+        code += [('mov', lloc, '%eax')]
+        code += [('cmp', rloc, '%eax')]
+        code += [(SETCC, '%al')]
+        code += [('movzbl', '%al', target)]
+    elif OP in ['PLUS', 'MINUS', 'MUL', 'DIV']:
         code += lcode
         code += rcode
         code += [('mov', lloc, '%eax')]
@@ -320,8 +394,8 @@ def binop_exp(node):
         # relational operators are a bit complicated - we keep
         # the results in variables...therefore we have the explicit
         # test and store code
-        else_label = label();
-        end_label = label();
+        else_label = label(ctx);
+        end_label = label(ctx);
         code += lcode
         code += rcode
         code += [('mov', lloc, '%eax')]
@@ -340,12 +414,12 @@ def binop_exp(node):
     return (code, target)
 
 #########################################################################
-def call_exp(node):
+def call_exp(node, ctx):
 
     (CALLEXP, (ADDR0, target), (ADDR1, name), actual_args) = node
 
     code = list()
-    code += push_args(actual_args)
+    code += push_args(actual_args, ctx)
     code += [('call', name)]
     code += pop_args(actual_args)
     code += [('mov', '%eax', target)]
@@ -353,7 +427,7 @@ def call_exp(node):
     return (code, target)
 
 #########################################################################
-def integer_exp(node):
+def integer_exp(node, ctx):
 
     (INTEGER, value) = node
 
@@ -363,7 +437,7 @@ def integer_exp(node):
     return (code, loc)
 
 #########################################################################
-def addr_exp(node):
+def addr_exp(node, ctx):
 
     (ADDR, loc) = node
 
@@ -372,26 +446,31 @@ def addr_exp(node):
     return (code, loc)
 
 #########################################################################
-def uminus_exp(node):
+def uminus_exp(node, ctx):
 
     (UMINUS, (ADDR, target), e) = node
 
-    (ecode, eloc) = walk(e)
+    (ecode, eloc) = walk(e, ctx)
 
     code = list()
     code += ecode
-    code += [('mov', eloc, '%eax')]
-    code += [('neg', '%eax')]
-    code += [('mov', '%eax', target)]
+    if register(target):
+        if eloc != target:
+            code += [('mov', eloc, target)]
+        code += [('neg', target)]
+    else:
+        code += [('mov', eloc, '%eax')]
+        code += [('neg', '%eax')]
+        code += [('mov', '%eax', target)]
 
     return (code, target)
 
 #########################################################################
-def not_exp(node):
+def not_exp(node, ctx):
 
     (NOT, (ADDR, target), e) = node
 
-    (ecode, eloc) = walk(e)
+    (ecode, eloc) = walk(e, ctx)
 
     code = list()
     code += ecode
@@ -405,12 +484,16 @@ def not_exp(node):
 #########################################################################
 # walk
 #########################################################################
-def walk(node):
+def walk(node, ctx=None):
+    # without a context the walker uses the shared default context
+    if ctx is None:
+        ctx = default_context
+
     node_type = node[0]
 
     if node_type in dispatch_dict:
         node_function = dispatch_dict[node_type]
-        return node_function(node)
+        return node_function(node, ctx)
 
     else:
         raise ValueError("walk: unknown tree node type: " + node_type)
@@ -441,12 +524,9 @@ dispatch_dict = {
 }
 
 #########################################################################
-label_id = 0
-
-def label():
-    global label_id
-    s =  'L' + str(label_id)
-    label_id += 1
+def label(ctx):
+    s =  'L' + str(ctx.label_id)
+    ctx.label_id += 1
     return s
 
 #########################################################################
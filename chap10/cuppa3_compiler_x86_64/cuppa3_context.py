@@ -0,0 +1,37 @@
+'''
+the state of a Cuppa3 compilation
+
+The tree rewriter and the code generator keep everything they remember
+while walking a program -- the symbol table, the counters for temporary
+names and labels and the frame size of the current function -- in a
+CompilerContext which is passed along to all node functions.  Compilations
+with contexts of their own do not share any state, they can therefore run
+concurrently, e.g. on the threads of a compile server,
+
+    ctx = CompilerContext()
+    code = codegen(rewrite(parse(input_stream), ctx), ctx)
+
+The walkers can still be called without a context, they then use the
+default context below which shares the symtab object of cuppa3_symtab.
+'''
+
+from cuppa3_symtab import SymTab, symtab
+
+class CompilerContext:
+
+    def __init__(self, symtab=None):
+        # symbol table of the tree rewriter
+        self.symtab = symtab if symtab is not None else SymTab()
+        # counter used by the tree rewriter to generate temporary names
+        self.temp_cnt = 0
+        # frame size of the function the code generator is in,
+        # None outside of function definitions
+        self.curr_frame_size = None
+        # callee-saved registers the current function saves, see
+        # cuppa3_regalloc
+        self.curr_saved_regs = []
+        # counter used by the code generator to generate labels
+        self.label_id = 0
+
+# the context of compilations that do not provide their own
+default_context = CompilerContext(symtab)
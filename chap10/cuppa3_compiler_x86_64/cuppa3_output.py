@@ -3,34 +3,68 @@
 # take a list of Exp2bytecode instruction tuples and format them nicely
 # for output.
 
-#########################################################################
-def output(instr_stream):
+import io
+import os
+from peephole import RuleSet, peephole
 
-    output_stream = ''
+#########################################################################
+def output(instr_stream, sink=None):
+    '''
+    format the instructions and write them to the file-like sink as they
+    arrive from the instruction stream.  Without a sink the formatted program
+    is returned as a string.
+    '''
+    if sink is None:
+        buffer = io.StringIO()
+        output(instr_stream, buffer)
+        return buffer.getvalue()
 
     for instr in instr_stream:
+        sink.write(format_instr(instr))
+
+    return None
+
+#########################################################################
+class OutputFile:
+    '''
+    a file-like sink for the output file of the compiler.  The output is
+    written to a temporary file next to the output file which replaces
+    the output file on commit().  Closing the sink without a commit
+    removes the temporary file, a failed compilation leaves the output
+    file alone.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.temp_name = '{}.{}.tmp'.format(name, os.getpid())
+        self.file = open(self.temp_name, 'w')
 
-        if label_def(instr):  # label def - print without preceeding '\t' or trailing ';'
-            output_stream += instr[0] + '\n'
+    def write(self, s):
+        return self.file.write(s)
 
-        elif instr[0] == '#': # comment dummy instruction
-            output_stream += '\t' + instr[0] + ' ' + instr[1] + '\n'
+    def commit(self):
+        self.file.close()
+        os.replace(self.temp_name, self.name)
 
-        else:                 # regular instruction - indent and put a ';' at the end
-            output_stream += '\t'
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.temp_name)
 
-            for i in range(len(instr)):
-                output_stream += instr[i]
-                if len(instr) == 1:
-                    output_stream += '\n'
-                elif i == 0:
-                    output_stream += '\t'
-                elif i < len(instr)-1:
-                    output_stream += ', '
-                else:
-                    output_stream += '\n'
+#########################################################################
+def format_instr(instr):
+
+    if label_def(instr):  # label def - print without preceeding '\t' or trailing ';'
+        return instr[0] + '\n'
+
+    elif instr[0] == '#': # comment dummy instruction
+        return '\t' + instr[0] + ' ' + instr[1] + '\n'
 
-    return output_stream
+    elif len(instr) == 1: # regular instruction - indent, separate the operands by ','
+        return '\t' + instr[0] + '\n'
+
+    else:
+        return '\t' + instr[0] + '\t' + ', '.join(instr[1:]) + '\n'
 
 #########################################################################
 def label_def(instr_tuple):
@@ -43,12 +77,67 @@ def label_def(instr_tuple):
         return False
 
 #########################################################################
-def output_data(data_tuples):
-    data_stream = '\t.data\n'
+def output_data(data_tuples, sink=None):
+    if sink is None:
+        buffer = io.StringIO()
+        output_data(data_tuples, buffer)
+        return buffer.getvalue()
+
+    sink.write('\t.data\n')
     for (name, size) in data_tuples:
-        data_stream += "\t.lcomm {}, {}\n".format(name,size)
-    data_stream += "\n"
+        sink.write("\t.lcomm {}, {}\n".format(name,size))
+    sink.write("\n")
+
+    return None
+
+#########################################################################
+def code(instr):
+    # machine instructions, i.e. neither labels nor comments nor assembler
+    # directives like .text
+    return (instr is not None
+            and not label_def(instr)
+            and instr[0] != '#'
+            and instr[0][0] != '.')
+
+# the peephole rules for x86_64, see peephole for the rule language
+x86_64_rules = RuleSet('''
+# a nop following a label is not needed when an instruction follows it
+label-nop:   ?L: ; nop ; ?I       =>  ?L: ; ?I  where not label(?I)
+
+# a nop without a label does nothing
+nop:         nop                  =>            where not label(?prev)
+
+# two labels separated by a nop are merged into the second one
+label-merge: ?L1: ; nop ; ?L2:    =>  ?L2:      do backpatch(?L1, ?L2)
+
+# a jump to the label right after it
+jmp-next:    jmp ?L ; ?L:         =>  ?L:
+
+# a value moved back to where it just came from, e.g. a temporary stored
+# and immediately reloaded into the same register
+mov-back:    mov ?A, ?B ; mov ?B, ?A  =>  mov ?A, ?B
+
+# instructions after an unconditional transfer of control without a label
+# can never be reached
+dead-ret:    ret ; ?I             =>  ret       where code(?I)
+dead-jmp:    jmp ?L ; ?I          =>  jmp ?L    where code(?I)
+''',
+    label_operands = {
+        'jmp'  : [1],
+        'je'   : [1],
+        'jne'  : [1],
+        'jg'   : [1],
+        'call' : [1],
+    },
+    predicates = {
+        'code' : code,
+    })
+
+#########################################################################
+# apply peephole optimization.  The instruction tuple format is:
+#   (instr_name_str, [param_str1, param_str2, ...])
+def peephole_opt(instr_stream):
 
-    return data_stream
+    peephole(instr_stream, x86_64_rules)
 
 #########################################################################
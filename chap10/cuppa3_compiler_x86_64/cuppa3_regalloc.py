@@ -0,0 +1,415 @@
+'''
+regalloc: a register allocator for the three-address tree of our Cuppa3
+compiler
+
+Without register allocation every variable and every temporary of the
+rewritten program lives in memory, in .data or in the stack frame of a
+function, and the code generator moves each value through %eax.  The
+allocator rewrites the three-address tree so that the locations of as many
+values as possible are registers instead, the code generator then
+produces the same instructions operating on registers.
+
+The main program and every function are allocated separately.  For each
+of them we
+
+  * flatten the tree into a list of instructions, one for each store of
+    a value, with the control flow of the while and if statements as
+    successor edges,
+  * compute the live variables at each instruction with the usual
+    backwards dataflow analysis,
+  * coalesce the target and the source of an assignment x = t if they
+    are never live at the same time, x then takes the place of t and
+    the assignment becomes a move of a register into itself,
+  * turn the instructions at which a value is live into a live interval
+    and assign registers to the intervals by linear scan.
+
+Values live across a call of a Cuppa3 function are kept in callee-saved
+registers, every function saves the callee-saved registers it uses on
+entry and restores them when it returns.  All other values prefer the
+caller-saved registers which functions use freely.  A value whose interval
+finds no register stays in its memory location, i.e. it is spilled.
+Global variables that functions refer to always stay in memory.  The
+registers used by the code generator (%eax, %ebx, %edx) and by the runtime
+system (%ecx, %esi, %edi, %r11) are not allocated.
+
+The allocated registers are 32 bit registers like the rest of the code,
+reg64 maps them to their 64 bit names for push and pop.
+'''
+
+#########################################################################
+# registers
+
+# preserved by the runtime system, clobbered by Cuppa3 function calls
+caller_saved = ['%r8d', '%r9d', '%r10d']
+
+# preserved by the runtime system and by Cuppa3 functions
+callee_saved = ['%r12d', '%r13d', '%r14d', '%r15d', '%ebp']
+
+reg64 = {
+    '%r8d'  : '%r8',
+    '%r9d'  : '%r9',
+    '%r10d' : '%r10',
+    '%r12d' : '%r12',
+    '%r13d' : '%r13',
+    '%r14d' : '%r14',
+    '%r15d' : '%r15',
+    '%ebp'  : '%rbp',
+}
+
+#########################################################################
+# flatten a unit into instructions
+#########################################################################
+class Flattener:
+    '''
+    the instructions of a unit, instruction i is described by its used
+    and defined locations, its successors and whether it calls a Cuppa3
+    function or copies one location into another
+    '''
+
+    def __init__(self):
+        self.uses = list()
+        self.defs = list()
+        self.succ = list()
+        self.calls = list()
+        # (instruction, target, source)
+        self.moves = list()
+
+    def emit(self, uses=(), defs=(), call=False):
+        'emit an instruction falling through to the next one'
+        i = len(self.uses)
+        self.uses.append(set(u for u in uses if u is not None))
+        self.defs.append(set(defs))
+        self.succ.append([i + 1])
+        if call:
+            self.calls.append(i)
+        return i
+
+    def next(self):
+        return len(self.uses)
+
+    def finish(self):
+        # the instruction after the last one is the exit of the unit
+        n = len(self.uses)
+        self.succ = [[s for s in succ if s < n] for succ in self.succ]
+
+#########################################################################
+def flatten_args(args, fl):
+    # the arguments are evaluated and pushed in reverse order
+    (LIST, ll) = args
+    for e in reversed(ll):
+        fl.emit(uses=[flatten(e, fl)])
+
+#########################################################################
+def flatten(node, fl):
+    '''
+    emit the instructions of the node in the order of the code generator,
+    expressions return the location of their value or None for constants
+    '''
+    node_type = node[0]
+
+    if node_type == 'STMTLIST':
+        for stmt in node[1]:
+            flatten(stmt, fl)
+
+    elif node_type in ['NIL', 'FUNDEF']:
+        # function definitions are units of their own, the main program
+        # jumps over them
+        pass
+
+    elif node_type == 'ASSIGN':
+        (ASSIGN, (ADDR, target), exp) = node
+        source = flatten(exp, fl)
+        i = fl.emit(uses=[source], defs=[target])
+        if source is not None and source != target:
+            fl.moves.append((i, target, source))
+
+    elif node_type == 'GET':
+        (GET, (ADDR, target)) = node
+        fl.emit(defs=[target])
+
+    elif node_type == 'PUT':
+        (PUT, exp) = node
+        fl.emit(uses=[flatten(exp, fl)])
+
+    elif node_type == 'CALLSTMT':
+        (CALLSTMT, name, args) = node
+        flatten_args(args, fl)
+        fl.emit(call=True)
+
+    elif node_type == 'RETURN':
+        (RETURN, exp) = node
+        i = fl.emit(uses=[flatten(exp, fl)] if exp[0] != 'NIL' else [])
+        fl.succ[i] = []
+
+    elif node_type == 'WHILE':
+        (WHILE, cond, body) = node
+        top = fl.next()
+        test = fl.emit(uses=[flatten(cond, fl)])
+        flatten(body, fl)
+        jump = fl.emit()
+        fl.succ[jump] = [top]
+        fl.succ[test].append(fl.next())
+
+    elif node_type == 'IF':
+        (IF, cond, s1, s2) = node
+        test = fl.emit(uses=[flatten(cond, fl)])
+        flatten(s1, fl)
+        if s2[0] == 'NIL':
+            fl.succ[test].append(fl.next())
+        else:
+            jump = fl.emit()
+            fl.succ[test].append(fl.next())
+            flatten(s2, fl)
+            fl.succ[jump] = [fl.next()]
+
+    elif node_type == 'BLOCK':
+        flatten(node[1], fl)
+
+    elif node_type == 'CALLEXP':
+        (CALLEXP, (ADDR, target), name, args) = node
+        flatten_args(args, fl)
+        fl.emit(call=True)
+        fl.emit(defs=[target])
+        return target
+
+    elif node_type == 'INTEGER':
+        return None
+
+    elif node_type == 'ADDR':
+        return node[1]
+
+    elif node_type in ['UMINUS', 'NOT']:
+        (OP, (ADDR, target), e) = node
+        fl.emit(uses=[flatten(e, fl)], defs=[target])
+        return target
+
+    elif node_type in ['PLUS', 'MINUS', 'MUL', 'DIV', 'EQ', 'LE']:
+        (OP, (ADDR, target), c1, c2) = node
+        l = flatten(c1, fl)
+        r = flatten(c2, fl)
+        fl.emit(uses=[l, r], defs=[target])
+        return target
+
+    else:
+        raise ValueError("regalloc: unknown tree node type: " + node_type)
+
+#########################################################################
+# liveness and live intervals
+#########################################################################
+def liveness(fl):
+    'the live variables after each instruction'
+    n = len(fl.uses)
+    live_in = [set() for i in range(n)]
+    live_out = [set() for i in range(n)]
+    changed = True
+    while changed:
+        changed = False
+        for i in reversed(range(n)):
+            out = set()
+            for s in fl.succ[i]:
+                out |= live_in[s]
+            inn = fl.uses[i] | (out - fl.defs[i])
+            if out != live_out[i] or inn != live_in[i]:
+                live_out[i] = out
+                live_in[i] = inn
+                changed = True
+    return live_out
+
+def intervals(fl, live_out, candidates):
+    '''
+    the live intervals of the candidates as a dictionary
+    location -> [start, end, crosses a call]
+    '''
+    ivs = dict()
+    for i in range(len(fl.uses)):
+        for v in (fl.uses[i] | fl.defs[i] | live_out[i]) & candidates:
+            if v in ivs:
+                ivs[v][1] = i
+            else:
+                ivs[v] = [i, i, False]
+    for c in fl.calls:
+        for v in live_out[c] & candidates:
+            ivs[v][2] = True
+    return ivs
+
+#########################################################################
+# coalescing
+#########################################################################
+def interfere(fl, live_out, a, b, move):
+    '''
+    a and b interfere if one of them is defined while the other one is
+    live, the move between them does not count
+    '''
+    for i in range(len(fl.uses)):
+        if i == move:
+            continue
+        if a in fl.defs[i] and b in live_out[i]:
+            return True
+        if b in fl.defs[i] and a in live_out[i]:
+            return True
+    return False
+
+def coalesce(fl, live_out, candidates):
+    '''
+    merge the sources of moves into their targets, returns the merged
+    locations as a dictionary source -> target.  The instructions and the
+    live variables are updated to refer to the targets only.
+    '''
+    merged = dict()
+    for (i, target, source) in fl.moves:
+        while target in merged:
+            target = merged[target]
+        while source in merged:
+            source = merged[source]
+        if (source == target
+                or source not in candidates
+                or target not in candidates
+                or interfere(fl, live_out, target, source, i)):
+            continue
+        merged[source] = target
+        for sets in [fl.uses, fl.defs, live_out]:
+            for s in sets:
+                if source in s:
+                    s.remove(source)
+                    s.add(target)
+    return merged
+
+#########################################################################
+# linear scan
+#########################################################################
+def linear_scan(ivs):
+    'map the locations to registers, spilled locations are not mapped'
+    assignment = dict()
+    # the active intervals with their registers ordered by their end
+    active = list()
+    free = set(caller_saved + callee_saved)
+
+    for v in sorted(ivs, key=lambda v: (ivs[v][0], v)):
+        (start, end, crosses_call) = ivs[v]
+
+        # expire the intervals that ended before this one starts, an
+        # interval ending where this one starts has been read already
+        # when this one is written
+        while active and ivs[active[0]][1] <= start:
+            free.add(assignment[active.pop(0)])
+
+        allowed = callee_saved if crosses_call else caller_saved + callee_saved
+        regs = [r for r in allowed if r in free]
+        if regs:
+            reg = regs[0]
+            free.remove(reg)
+        else:
+            # spill the interval ending last among those holding a
+            # register this interval may use
+            victims = [a for a in active if assignment[a] in allowed]
+            if not victims:
+                continue
+            victim = max(victims, key=lambda a: ivs[a][1])
+            if ivs[victim][1] <= end:
+                continue
+            reg = assignment.pop(victim)
+            active.remove(victim)
+
+        assignment[v] = reg
+        active.append(v)
+        active.sort(key=lambda a: ivs[a][1])
+
+    return assignment
+
+#########################################################################
+def allocate_unit(stmts, formal_args, candidates):
+    '''
+    allocate the registers of a unit, the formal arguments are defined
+    on entry
+    '''
+    fl = Flattener()
+    # the arguments are stored one after the other
+    for a in formal_args:
+        fl.emit(defs=[a])
+    flatten(stmts, fl)
+    fl.finish()
+    live_out = liveness(fl)
+    merged = coalesce(fl, live_out, candidates)
+    assignment = linear_scan(intervals(fl, live_out, candidates))
+
+    # a merged location shares the register of its target, if the target
+    # is spilled it simply keeps its own memory location
+    for source in merged:
+        target = source
+        while target in merged:
+            target = merged[target]
+        if target in assignment:
+            assignment[source] = assignment[target]
+    return assignment
+
+#########################################################################
+# rewrite the locations
+#########################################################################
+def locations(node, found):
+    'collect the locations the node refers to'
+    if type(node) is tuple:
+        if node[0] == 'ADDR':
+            found.add(node[1])
+        else:
+            for child in node[1:]:
+                locations(child, found)
+    elif type(node) is list:
+        for child in node:
+            locations(child, found)
+    return found
+
+def rename(node, assignment, ctx):
+    '''
+    replace the allocated locations by their registers, functions
+    are allocated on their own
+    '''
+    if type(node) is list:
+        return [rename(child, assignment, ctx) for child in node]
+    elif type(node) is not tuple:
+        return node
+    elif node[0] == 'ADDR':
+        return ('ADDR', assignment.get(node[1], node[1]))
+    elif node[0] == 'FUNDEF':
+        return allocate_function(node, ctx)
+    else:
+        return (node[0],) + tuple(rename(child, assignment, ctx)
+                                  for child in node[1:])
+
+def allocate_function(node, ctx):
+
+    (FUNDEF, name, (LIST, fl), body, framesize) = node
+
+    global_names = set(n for (n, size) in ctx.symtab.global_vars)
+    formal_args = [a for (ADDR, a) in fl]
+    candidates = locations(body, set(formal_args)) - global_names
+    assignment = allocate_unit(body, formal_args, candidates)
+
+    # the callee-saved registers the function has to save and restore
+    saved = [reg64[r] for r in callee_saved if r in assignment.values()]
+
+    return ('FUNDEF',
+            name,
+            ('LIST', [('ADDR', assignment.get(a, a)) for a in formal_args]),
+            rename(body, assignment, ctx),
+            framesize,
+            ('SAVED', saved))
+
+#########################################################################
+def allocate(ast, ctx):
+    '''
+    allocate registers for the rewritten program, returns the program with
+    the locations of the allocated values replaced by registers
+    '''
+    # global variables used by functions have to stay in memory
+    in_functions = set()
+    def functions(node):
+        if type(node) is tuple and node[0] == 'FUNDEF':
+            locations(node[3], in_functions)
+        elif type(node) in [tuple, list]:
+            for child in node:
+                functions(child)
+    functions(ast)
+
+    global_names = set(n for (n, size) in ctx.symtab.global_vars)
+    assignment = allocate_unit(ast, [], global_names - in_functions)
+    return rename(ast, assignment, ctx)
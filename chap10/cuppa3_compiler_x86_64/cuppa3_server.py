@@ -0,0 +1,52 @@
+# Cuppa3 compile server
+#
+# keeps the compiler loaded and compiles the programs sent by cuppa3_client
+# into x86_64 assembly code, e.g.
+#
+#     python3 cuppa3_server.py &
+#     python3 cuppa3_client.py -O fact.txt
+#     python3 cuppa3_client.py --stop
+#
+# the rewritten programs are cached on disk and the most recently used
+# ones are kept in memory as well.
+
+import io
+from argparse import ArgumentParser
+from cuppa3_cc import cc
+from cuppa3_context import CompilerContext
+from parse_cache import ParseCache, version
+from compile_server import serve, default_socket
+
+# the name of the default socket, shared with cuppa3_client
+server_name = 'cuppa3-x86_64'
+
+def compiler(cache):
+    'the compile function of the server'
+    def compile(source, options):
+        sink = io.StringIO()
+        cc(source,
+           opt=options.get('O', False),
+           sink=sink,
+           cache=cache,
+           ctx=CompilerContext())
+        return sink.getvalue()
+    return compile
+
+if __name__ == "__main__":
+    # parse command line args
+    aparser = ArgumentParser()
+    aparser.add_argument('-s', metavar='socket', default=default_socket(server_name), help='socket to listen on')
+    aparser.add_argument('-m', metavar='entries', type=int, default=256, help='number of cached programs kept in memory')
+
+    args = vars(aparser.parse_args())
+
+    import cuppa3_lexer, cuppa3_fe, cuppa3_symtab
+    import cuppa3_tree_rewrite, cuppa3_context
+    cache = ParseCache(version(cuppa3_lexer,
+                               cuppa3_fe,
+                               cuppa3_tree_rewrite,
+                               cuppa3_symtab,
+                               cuppa3_context),
+                       memory_entries=args['m'])
+
+    serve(args['s'], compiler(cache))
@@ -6,30 +6,30 @@ just as in previous compilers we do not use the symbol symbol_table
 table to hold values but to hold (name, target_name) pairs.
 
 we map all integers into 8 byte words on the target machine.
+
+the symbol table and the counter for temporary names are part of the
+CompilerContext passed to all node functions, see cuppa3_context.
 '''
 
-from cuppa3_symtab import symtab
+from cuppa3_context import default_context
 
 #########################################################################
-_temp_cnt = 0
-
-def make_temp_name():
-    global _temp_cnt
-    new_name = "v$" + str(_temp_cnt)
-    _temp_cnt += 1
+def make_temp_name(ctx):
+    new_name = "v$" + str(ctx.temp_cnt)
+    ctx.temp_cnt += 1
     return new_name
 
 #########################################################################
-def declare_temp():
-    name = make_temp_name()
-    target_name = symtab.make_target_name()
-    symtab.declare(name, ('INTEGER', target_name))
-    if not symtab.in_function:
-        symtab.global_vars += [(target_name, 8)]
+def declare_temp(ctx):
+    name = make_temp_name(ctx)
+    target_name = ctx.symtab.make_target_name()
+    ctx.symtab.declare(name, ('INTEGER', target_name))
+    if not ctx.symtab.in_function:
+        ctx.symtab.global_vars += [(target_name, 8)]
     return target_name
 
 #######################################################################
-def eval_actual_args(args):
+def eval_actual_args(args, ctx):
     '''
     Walk the list of actual arguments, evaluate them, and
     return a list with the evaluated actual values
@@ -38,26 +38,26 @@ def eval_actual_args(args):
 
     outlist = []
     for e in ll:
-        t = walk(e)
+        t = walk(e, ctx)
         outlist.append(t)
     return ('LIST', outlist)
 
 #########################################################################
-def declare_formal_args(formal_args):
+def declare_formal_args(formal_args, ctx):
 
     (LIST, fl) = formal_args
 
     outlist = list()
     for (ID, sym) in fl:
-        target_name = symtab.make_target_name()
-        symtab.declare(sym, ('INTEGER', target_name))
+        target_name = ctx.symtab.make_target_name()
+        ctx.symtab.declare(sym, ('INTEGER', target_name))
         outlist.append(('ADDR', target_name))
     return ('LIST', outlist)
 
 #########################################################################
-def handle_call(call_kind, name, actual_arglist):
+def handle_call(call_kind, name, actual_arglist, ctx):
 
-    val = symtab.lookup_sym(name)
+    val = ctx.symtab.lookup_sym(name)
 
     if val[0] != 'FUNVAL':
         raise ValueError("expected a function value.")
@@ -70,11 +70,11 @@ def handle_call(call_kind, name, actual_arglist):
                          .format(name, len(formal_arglist)))
 
     # convert the actual values into three-address codes
-    actual_val_args = eval_actual_args(actual_arglist)
+    actual_val_args = eval_actual_args(actual_arglist, ctx)
 
     if call_kind == 'CALLEXP':
         return ('CALLEXP',
-                ('ADDR', declare_temp()),
+                ('ADDR', declare_temp(ctx)),
                 ('ADDR', name),
                 actual_val_args)
     else:
@@ -83,18 +83,18 @@ def handle_call(call_kind, name, actual_arglist):
 #########################################################################
 # node functions
 #########################################################################
-def stmtlist(node):
+def stmtlist(node, ctx):
 
     (STMTLIST, lst) = node
 
     outlist = list()
     for stmt in lst:
-        outlist.append(walk(stmt))
+        outlist.append(walk(stmt, ctx))
 
     return ('STMTLIST', outlist)
 
 #########################################################################
-def nil(node):
+def nil(node, ctx):
 
     (NIL,) = node
 
@@ -105,19 +105,19 @@ def nil(node):
 # how many local variables there are. We need this information in order
 # to compute the frame size of the function. Also, we need to replace
 # original function local variables with their stack frame target names.
-def fundecl_stmt(node):
+def fundecl_stmt(node, ctx):
 
     (FUNDECL, (ID, name), arglist, body) = node
 
     # we don't need the function body - abbreviated function value
     funval = ('FUNVAL', arglist)
-    symtab.declare(name, funval)
+    ctx.symtab.declare(name, funval)
 
-    symtab.enter_function()
-    new_arglist = declare_formal_args(arglist)
-    new_body = walk(body)
-    frame_size = symtab.get_frame_size()
-    symtab.exit_function()
+    ctx.symtab.enter_function()
+    new_arglist = declare_formal_args(arglist, ctx)
+    new_body = walk(body, ctx)
+    frame_size = ctx.symtab.get_frame_size()
+    ctx.symtab.exit_function()
 
     return ('FUNDEF',
             ('ADDR', name),
@@ -126,168 +126,172 @@ def fundecl_stmt(node):
             ('FRAMESIZE', frame_size))
 
 #########################################################################
-def vardecl_stmt(node):
+def vardecl_stmt(node, ctx):
 
     (VARDECL, (ID, name), init_val) = node
 
-    t = walk(init_val)
-    target_name = symtab.make_target_name()
-    symtab.declare(name, ('INTEGER', target_name))
-    if not symtab.in_function:
-        symtab.global_vars += [(target_name, 8)]
+    t = walk(init_val, ctx)
+    target_name = ctx.symtab.make_target_name()
+    ctx.symtab.declare(name, ('INTEGER', target_name))
+    if not ctx.symtab.in_function:
+        ctx.symtab.global_vars += [(target_name, 8)]
 
     return ('ASSIGN', ('ADDR', target_name), t)
 
 #########################################################################
-def assign_stmt(node):
+def assign_stmt(node, ctx):
 
     (ASSIGN, (ID, name), exp) = node
 
-    t = walk(exp)
-    target_name = symtab.get_target_name(name)
+    t = walk(exp, ctx)
+    target_name = ctx.symtab.get_target_name(name)
     return ('ASSIGN', ('ADDR', target_name), t)
 
 #########################################################################
-def get_stmt(node):
+def get_stmt(node, ctx):
 
     (GET, (ID, name)) = node
 
-    target_name = symtab.get_target_name(name)
+    target_name = ctx.symtab.get_target_name(name)
     return ('GET', ('ADDR', target_name))
 
 #########################################################################
-def put_stmt(node):
+def put_stmt(node, ctx):
 
     (PUT, exp) = node
 
-    t = walk(exp)
+    t = walk(exp, ctx)
 
     return ('PUT', t)
 
 #########################################################################
-def call_stmt(node):
+def call_stmt(node, ctx):
 
     (CALLSTMT, (ID, name), actual_args) = node
 
-    return handle_call('CALLSTMT', name, actual_args)
+    return handle_call('CALLSTMT', name, actual_args, ctx)
 
 #########################################################################
-def return_stmt(node):
+def return_stmt(node, ctx):
 
     (RETURN, exp) = node
 
-    if not symtab.in_function:
+    if not ctx.symtab.in_function:
         raise ValueError("return has to appear in a function context.")
 
-    t = walk(exp)
+    t = walk(exp, ctx)
 
     return ('RETURN', t)
 
 #########################################################################
-def while_stmt(node):
+def while_stmt(node, ctx):
 
     (WHILE, cond, body) = node
 
-    t1 = walk(cond)
-    t2 = walk(body)
+    t1 = walk(cond, ctx)
+    t2 = walk(body, ctx)
 
     return ('WHILE', t1, t2)
 
 #########################################################################
-def if_stmt(node):
+def if_stmt(node, ctx):
 
     (IF, cond, then_stmt, else_stmt) = node
 
-    t1 = walk(cond)
-    t2 = walk(then_stmt)
-    t3 = walk(else_stmt)
+    t1 = walk(cond, ctx)
+    t2 = walk(then_stmt, ctx)
+    t3 = walk(else_stmt, ctx)
     return ('IF', t1, t2, t3)
 
 #########################################################################
-def block_stmt(node):
+def block_stmt(node, ctx):
 
     (BLOCK, stmt_list) = node
 
-    symtab.push_scope()
-    t = walk(stmt_list)
-    symtab.pop_scope()
+    ctx.symtab.push_scope()
+    t = walk(stmt_list, ctx)
+    ctx.symtab.pop_scope()
 
     return ('BLOCK', t)
 
 #########################################################################
-def binop_exp(node):
+def binop_exp(node, ctx):
     # turn expressions into three-address codes
 
     (OP, c1, c2) = node
 
-    t1 = walk(c1)
-    t2 = walk(c2)
+    t1 = walk(c1, ctx)
+    t2 = walk(c2, ctx)
 
-    target_name = declare_temp()
+    target_name = declare_temp(ctx)
 
     return (OP, ('ADDR', target_name), t1, t2)
 
 #########################################################################
-def integer_exp(node):
+def integer_exp(node, ctx):
 
     (INTEGER, value) = node
 
     return ('INTEGER', value)
 
 #########################################################################
-def id_exp(node):
+def id_exp(node, ctx):
 
     (ID, name) = node
 
-    target_name = symtab.get_target_name(name)
+    target_name = ctx.symtab.get_target_name(name)
 
     return ('ADDR', target_name)
 
 #########################################################################
-def call_exp(node):
+def call_exp(node, ctx):
 
     (CALLEXP, (ID, name), actual_args) = node
 
-    return handle_call('CALLEXP', name, actual_args)
+    return handle_call('CALLEXP', name, actual_args, ctx)
 
 #########################################################################
-def uminus_exp(node):
+def uminus_exp(node, ctx):
 
     (UMINUS, exp) = node
 
-    t = walk(exp)
-    target_name = declare_temp()
+    t = walk(exp, ctx)
+    target_name = declare_temp(ctx)
 
     return ('UMINUS', ('ADDR', target_name), t)
 
 #########################################################################
-def not_exp(node):
+def not_exp(node, ctx):
 
     (NOT, exp) = node
 
-    t = walk(exp)
-    target_name = declare_temp()
+    t = walk(exp, ctx)
+    target_name = declare_temp(ctx)
 
     return ('NOT', ('ADDR', target_name), t)
 
 #########################################################################
-def paren_exp(node):
+def paren_exp(node, ctx):
 
     (PAREN, exp) = node
 
     # get rid of parenthesis - not necessary in AST
-    return walk(exp)
+    return walk(exp, ctx)
 
 #########################################################################
 # walk
 #########################################################################
-def walk(node):
+def walk(node, ctx=None):
     # node format: (TYPE, [child1[, child2[, ...]]])
+    # without a context the walker uses the shared default context
+    if ctx is None:
+        ctx = default_context
+
     type = node[0]
 
     if type in dispatch:
         node_function = dispatch[type]
-        return node_function(node)
+        return node_function(node, ctx)
     else:
         raise ValueError("walk: unknown tree node type: " + type)
 
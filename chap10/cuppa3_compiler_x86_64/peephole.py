@@ -0,0 +1,467 @@
+'''
+A small rule language for peephole optimization
+
+The rules describe rewrites of short windows of instructions in the
+instruction streams of our compilers, the instruction tuple format is:
+  (instr_name_str, [param_str1, param_str2, ...])
+with label definitions of the form ('L:',).  A rule is written on a
+single line,
+
+    name: pattern => replacement [where conditions] [do actions]
+
+The pattern and the replacement are lists of instructions separated by
+';', the replacement may be empty.  An instruction in a rule is one of
+
+    ?L:              a label definition, binds the label name to ?L
+    ?I               any instruction, binds the instruction to ?I
+    mnemonic ops     an instruction with this mnemonic and operands, an
+                     operand is either a variable like ?A, which binds
+                     the operand, or a literal that has to match exactly.
+                     A trailing ... matches any remaining operands.
+                     Operands may be separated by whitespace or commas.
+
+A variable that occurs more than once in a pattern has to be bound to the
+same value at each occurrence.  The conditions are a comma separated list
+of predicate applications like 'not label(?I)', the variable ?prev refers
+to the instruction before the window or None at the start of the stream.
+The actions are applied after the window has been rewritten, e.g.
+'backpatch(?L1, ?L2)' makes all jumps to ?L1 jump to ?L2.  Lines starting
+with '#' are comments.
+
+A rule set is compiled into a decision tree keyed on the mnemonics of the
+instructions in the window so that at each position only the rules whose
+mnemonics fit are tried, in the order in which they were written.  The
+replacement of a rule has to be shorter than its pattern, every rewrite
+therefore shrinks the stream and the worklist driven optimizer runs in
+time linear in the length of the stream.
+'''
+
+import re
+
+#########################################################################
+def label_def(instr_tuple):
+
+    instr_name = instr_tuple[0]
+
+    if instr_name[-1] == ':':
+        return True
+    else:
+        return False
+
+#########################################################################
+# predicates for the where clauses of rules, they have to accept None
+# which stands for the missing instruction before the start of the stream
+
+def label(instr):
+    return instr is not None and label_def(instr)
+
+def comment(instr):
+    return instr is not None and instr[0] == '#'
+
+def code(instr):
+    return instr is not None and not label_def(instr) and instr[0] != '#'
+
+default_predicates = {
+    'label'   : label,
+    'comment' : comment,
+    'code'    : code,
+    }
+
+#########################################################################
+# actions, they receive the instruction buffer followed by the values of
+# their arguments
+
+def backpatch(buffer, orig_label, repl_label):
+    buffer.backpatch_label(orig_label, repl_label)
+
+actions = {
+    'backpatch' : backpatch,
+    }
+
+#########################################################################
+# rule compilation
+#########################################################################
+class Rule:
+
+    def __init__(self, name, pattern, replacement, conditions, actions):
+        self.name = name
+        self.pattern = pattern
+        self.replacement = replacement
+        self.conditions = conditions
+        self.actions = actions
+
+#########################################################################
+def parse_instr(text, rule_name):
+    # an instruction of a rule as one of the tuples
+    #   ('LABEL', var)  ('ANY', var)  ('INSTR', mnemonic, operands, rest)
+    # where the operands are ('VAR', name) or ('LIT', text)
+    tokens = [t for t in re.split(r'[\s,]+', text.strip()) if t]
+    if not tokens:
+        raise ValueError("rule {}: empty instruction".format(rule_name))
+
+    if len(tokens) == 1 and tokens[0][0] == '?' and tokens[0][-1] == ':':
+        return ('LABEL', tokens[0][:-1])
+    elif len(tokens) == 1 and tokens[0][0] == '?':
+        return ('ANY', tokens[0])
+
+    rest = tokens[-1] == '...'
+    if rest:
+        tokens = tokens[:-1]
+    operands = [('VAR', t) if t[0] == '?' else ('LIT', t) for t in tokens[1:]]
+    return ('INSTR', tokens[0], operands, rest)
+
+#########################################################################
+def parse_instr_list(text, rule_name):
+    if not text.strip():
+        return []
+    return [parse_instr(t, rule_name) for t in text.split(';')]
+
+#########################################################################
+def parse_applications(text, rule_name, table):
+    # a comma separated list of '[not] name(?A, ...)' as (negated, f, vars)
+    applications = list()
+    for mo in re.finditer(r'(not\s+)?(\w+)\s*\(([^)]*)\)', text):
+        (negated, name, args) = mo.groups()
+        if name not in table:
+            raise ValueError("rule {}: unknown predicate or action {}"
+                             .format(rule_name, name))
+        vars = [a.strip() for a in args.split(',') if a.strip()]
+        applications.append((bool(negated), table[name], vars))
+    return applications
+
+#########################################################################
+def pattern_vars(pattern):
+    vars = set(['?prev'])
+    for element in pattern:
+        if element[0] in ['LABEL', 'ANY']:
+            vars.add(element[1])
+        else:
+            vars.update(o[1] for o in element[2] if o[0] == 'VAR')
+    return vars
+
+#########################################################################
+def parse_rule(line, predicates):
+
+    mo = re.match(r'\s*([\w-]+)\s*:(.*)=>(.*)$', line)
+    if not mo:
+        raise ValueError("syntax error in peephole rule: {}".format(line))
+    (name, lhs, rhs) = mo.groups()
+
+    (rhs, _, action_text) = rhs.partition(' do ')
+    (rhs, _, condition_text) = rhs.partition(' where ')
+
+    pattern = parse_instr_list(lhs, name)
+    replacement = parse_instr_list(rhs, name)
+    conditions = parse_applications(condition_text, name, predicates)
+    rule_actions = parse_applications(action_text, name, actions)
+
+    if not pattern:
+        raise ValueError("rule {}: empty pattern".format(name))
+    if len(replacement) >= len(pattern):
+        raise ValueError("rule {}: the replacement has to be shorter than the pattern"
+                         .format(name))
+    bound = pattern_vars(pattern)
+    used = pattern_vars(replacement)
+    for (negated, f, vars) in conditions + rule_actions:
+        used.update(vars)
+    for element in replacement:
+        if element[0] == 'INSTR' and element[3]:
+            raise ValueError("rule {}: ... in a replacement".format(name))
+    if not used <= bound:
+        raise ValueError("rule {}: unbound variables {}"
+                         .format(name, ', '.join(sorted(used - bound))))
+
+    return Rule(name, pattern, replacement, conditions, rule_actions)
+
+#########################################################################
+def element_key(element):
+    # the key of a pattern element in the decision tree, None matches any
+    # instruction
+    if element[0] == 'LABEL':
+        return ':'
+    elif element[0] == 'ANY':
+        return None
+    else:
+        return element[1]
+
+def instr_key(instr):
+    return ':' if label_def(instr) else instr[0]
+
+#########################################################################
+class RuleSet:
+    '''
+    a compiled set of peephole rules, label_operands maps the mnemonic of
+    every instruction referring to labels to the indices of its label
+    operands, extra predicates for the where clauses can be given as a
+    dictionary
+    '''
+
+    def __init__(self, text, label_operands, predicates=None):
+        self.label_operands = label_operands
+        self.predicates = dict(default_predicates)
+        if predicates:
+            self.predicates.update(predicates)
+
+        self.rules = list()
+        for line in text.splitlines():
+            if line.strip() and not line.strip().startswith('#'):
+                self.rules.append(parse_rule(line, self.predicates))
+        self.max_length = max([len(r.pattern) for r in self.rules], default=0)
+
+        # decision tree: every node is a pair (rules, children), the rules
+        # of a node are those whose pattern ends at the depth of the node
+        self.tree = ([], dict())
+        for (priority, rule) in enumerate(self.rules):
+            node = self.tree
+            for element in rule.pattern:
+                node = node[1].setdefault(element_key(element), ([], dict()))
+            node[0].append((priority, rule))
+
+    def candidates(self, buffer, ix):
+        # walk the decision tree along the instructions starting at
+        # position ix, returns the rules whose mnemonics fit, in the order
+        # in which they were written, and the positions of the window
+        positions = list()
+        found = list()
+        nodes = [self.tree]
+        p = ix
+        while p is not None:
+            key = instr_key(buffer.instrs[p])
+            next_nodes = list()
+            for (rules, children) in nodes:
+                if key in children:
+                    next_nodes.append(children[key])
+                if None in children:
+                    next_nodes.append(children[None])
+            if not next_nodes:
+                break
+            positions.append(p)
+            for (rules, children) in next_nodes:
+                found += rules
+            nodes = next_nodes
+            p = buffer.next[p]
+        if len(found) > 1:
+            found.sort(key=lambda entry: entry[0])
+        return ([rule for (priority, rule) in found], positions)
+
+    def label_uses(self, instr):
+        # the labels an instruction refers to
+        return [instr[i] for i in self.label_operands.get(instr[0], [])
+                if i < len(instr)]
+
+#########################################################################
+# matching and rewriting
+#########################################################################
+def bind(env, var, value):
+    if var in env:
+        return env[var] == value
+    env[var] = value
+    return True
+
+#########################################################################
+def match_rule(rule, window, prev):
+    # the variable bindings if the rule matches the start of the window,
+    # None otherwise
+    if len(window) < len(rule.pattern):
+        return None
+
+    env = {'?prev' : prev}
+    for (element, instr) in zip(rule.pattern, window):
+        if element[0] == 'LABEL':
+            if not label_def(instr) or not bind(env, element[1], instr[0][:-1]):
+                return None
+        elif element[0] == 'ANY':
+            if not bind(env, element[1], instr):
+                return None
+        else:
+            (INSTR, mnemonic, operands, rest) = element
+            if instr[0] != mnemonic:
+                return None
+            n = len(instr) - 1
+            if n < len(operands) or (n > len(operands) and not rest):
+                return None
+            for (operand, value) in zip(operands, instr[1:]):
+                if operand[0] == 'LIT':
+                    if operand[1] != value:
+                        return None
+                elif not bind(env, operand[1], value):
+                    return None
+
+    return env
+
+#########################################################################
+def conditions_hold(rule, env):
+    for (negated, predicate, vars) in rule.conditions:
+        if predicate(*[env[v] for v in vars]) == negated:
+            return False
+    return True
+
+#########################################################################
+def instantiate(element, env):
+    if element[0] == 'LABEL':
+        return (env[element[1]] + ':',)
+    elif element[0] == 'ANY':
+        return env[element[1]]
+    else:
+        (INSTR, mnemonic, operands, rest) = element
+        return tuple([mnemonic] + [env[o[1]] if o[0] == 'VAR' else o[1]
+                                   for o in operands])
+
+#########################################################################
+def rewrite(ix, buffer, rules):
+    '''
+    apply the first rule matching the window starting at position ix,
+    returns True if a rule fired
+    '''
+    (candidates, positions) = rules.candidates(buffer, ix)
+    if not candidates:
+        return False
+    window = [buffer.instrs[p] for p in positions]
+    prev_ix = buffer.prev[ix]
+    prev = buffer.instrs[prev_ix] if prev_ix is not None else None
+
+    for rule in candidates:
+        env = match_rule(rule, window, prev)
+        if env is None or not conditions_hold(rule, env):
+            continue
+        n = len(rule.pattern)
+        replacement = [instantiate(e, env) for e in rule.replacement]
+        buffer.replace(positions[:n], replacement)
+        for (negated, action, vars) in rule.actions:
+            action(buffer, *[env[v] for v in vars])
+        return True
+
+    return False
+
+#########################################################################
+def peephole(instr_stream, rules):
+    '''
+    optimize the instruction stream in place with the compiled rule set
+
+    A worklist holds the positions where a rule might match.  Initially
+    that is every position, after a rule fired only the positions whose
+    window of instructions was changed by the rewrite are revisited.
+    '''
+    buffer = InstrBuffer(instr_stream, rules)
+
+    # the root of the decision tree tells us which instructions can start
+    # a window at all, most positions are rejected right here
+    first_keys = rules.tree[1]
+    any_first = None in first_keys
+
+    # positions are popped off the end, visit them in program order
+    worklist = list(reversed(range(len(instr_stream))))
+
+    while worklist:
+
+        ix = worklist.pop()
+
+        if buffer.deleted[ix]:
+            continue
+        if not any_first and instr_key(buffer.instrs[ix]) not in first_keys:
+            continue
+
+        prev_ix = buffer.prev[ix]
+
+        if not rewrite(ix, buffer, rules):
+            continue
+
+        # revisit the positions whose window, including the instruction
+        # before the window, reaches into the rewritten window and the
+        # first position after it
+        if prev_ix is None:
+            start = buffer.head
+        else:
+            start = prev_ix
+            for i in range(rules.max_length - 1):
+                p = buffer.prev[start]
+                if p is None:
+                    break
+                start = p
+        revisit = list()
+        p = start
+        while p is not None and len(revisit) < 2 * rules.max_length + 2:
+            revisit.append(p)
+            p = buffer.next[p]
+        worklist += reversed(revisit)
+
+    instr_stream[:] = buffer.instructions()
+
+#########################################################################
+class InstrBuffer:
+    '''
+    the instructions under optimization as an array backed doubly linked
+    list, instructions are referred to by their position in the original
+    instruction stream which stays valid when other instructions are
+    deleted.  The label use index maps every label to the positions of the
+    instructions referring to it.
+    '''
+
+    def __init__(self, instr_stream, rules):
+        n = len(instr_stream)
+        self.rules = rules
+        self.instrs = list(instr_stream)
+        self.next = list(range(1, n + 1))
+        self.prev = list(range(-1, n - 1))
+        self.deleted = [False] * n
+        self.head = 0 if n > 0 else None
+        if n > 0:
+            self.next[-1] = None
+            self.prev[0] = None
+
+        self.label_uses = dict()
+        for ix in range(n):
+            self.add_uses(ix)
+
+    def add_uses(self, ix):
+        for label in self.rules.label_uses(self.instrs[ix]):
+            self.label_uses.setdefault(label, set()).add(ix)
+
+    def remove_uses(self, ix):
+        for label in self.rules.label_uses(self.instrs[ix]):
+            self.label_uses[label].discard(ix)
+
+    def set_instr(self, ix, instr):
+        self.remove_uses(ix)
+        self.instrs[ix] = instr
+        self.add_uses(ix)
+
+    def delete(self, ix):
+        self.remove_uses(ix)
+        (prev, next) = (self.prev[ix], self.next[ix])
+        if prev is None:
+            self.head = next
+        else:
+            self.next[prev] = next
+        if next is not None:
+            self.prev[next] = prev
+        self.deleted[ix] = True
+
+    def replace(self, positions, instrs):
+        # replace the instructions at the consecutive positions by the
+        # instructions of the shorter list instrs
+        for (ix, instr) in zip(positions, instrs):
+            if self.instrs[ix] != instr:
+                self.set_instr(ix, instr)
+        for ix in positions[len(instrs):]:
+            self.delete(ix)
+
+    def backpatch_label(self, orig_label, repl_label):
+        uses = self.label_uses.pop(orig_label, set())
+        for ix in uses:
+            instr = list(self.instrs[ix])
+            for i in self.rules.label_operands[instr[0]]:
+                if instr[i] == orig_label:
+                    instr[i] = repl_label
+            self.instrs[ix] = tuple(instr)
+        self.label_uses.setdefault(repl_label, set()).update(uses)
+
+    def instructions(self):
+        instrs = list()
+        ix = self.head
+        while ix is not None:
+            instrs.append(self.instrs[ix])
+            ix = self.next[ix]
+        return instrs
+
+#########################################################################
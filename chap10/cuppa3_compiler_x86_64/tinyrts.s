@@ -15,150 +15,123 @@
 # runs right on top of the kernel. written in gas using AT&T
 # syntax.
 #
+# I/O is buffered: put and the prompt of get append to an output
+# buffer which is written when it is full, before get has to read
+# from stdin, and on exit.  get reads stdin in large chunks and
+# parses the next integer from the input buffer, integers are
+# separated by white space.
+#
+# NOTE: output is only written at these points.  a program that
+# crashes, e.g. a division by zero (SIGFPE) or a stack overflow
+# (SIGSEGV), or that is killed by a signal loses everything it
+# printed since the last flush, up to OUTSIZE bytes.  a prompt is
+# always shown before get waits for input.
+#
+# the runtime only uses the registers %rax, %rcx, %rdx, %rsi, %rdi
+# and %r11, all other registers are preserved.
+#
 # syscall info was gleaned from:
 # blog.rchapman.org/posts/Linux_System_Call_Table_for_x86_64/
 #
 # (c) Lutz Hamel, University of Rhode Island
 ####################################################################
 
+	.equ	OUTSIZE, 65536
+	.equ	INSIZE, 65536
+
 	.data
 
-	# general purpose buffer
-	.lcomm rtsbuf, 256
+	# scratch buffer for converting an integer to a string
+	.lcomm rtsbuf, 16
+
+	# the output buffer and the number of bytes in it
+	.lcomm outbuf, OUTSIZE
+outpos:
+	.quad	0
 
-	# this buffer contains the prompt string
-	# for function get
-promptbuf:
-	.string "? "
+	# the input buffer, the position of the next character
+	# and the number of bytes in it
+	.lcomm inbuf, INSIZE
+inpos:
+	.quad	0
+inlen:
+	.quad	0
 
-	# this buffer contains the newline character
-	# used in function put
-nlbuf:
-	.string "\n"
+	# the two digit strings of the numbers 00 to 99
+digits:
+	.ascii	"00010203040506070809"
+	.ascii	"10111213141516171819"
+	.ascii	"20212223242526272829"
+	.ascii	"30313233343536373839"
+	.ascii	"40414243444546474849"
+	.ascii	"50515253545556575859"
+	.ascii	"60616263646566676869"
+	.ascii	"70717273747576777879"
+	.ascii	"80818283848586878889"
+	.ascii	"90919293949596979899"
 
 	.text
 
 	############################################################
-	# convert a string to an integer
+	# flush: write the output buffer to stdout
 	# Note: internal routine not visible globally
-	# Note: assembly generated from C code, see atoi.c
-atoi:
-	# %esi - length of string
-	# %rdi - pointer to string buffer
-	# returns integer value in %eax
-	pushq	%rbp
-	movq	%rsp, %rbp
-	movq	%rdi, -24(%rbp)
-	movl	%esi, -28(%rbp)
-	movl	$0, -12(%rbp)
-	movl	$1, -8(%rbp)
-	movl	$0, -4(%rbp)
-	movq	-24(%rbp), %rax
-	movzbl	(%rax), %eax
-	cmpb	$45, %al
-	jne	.L3
-	movl	$-1, -8(%rbp)
-	addl	$1, -4(%rbp)
-	jmp	.L3
-.L4:
-	movl	-12(%rbp), %edx
-	movl	%edx, %eax
-	sall	$2, %eax
-	addl	%edx, %eax
-	addl	%eax, %eax
-	movl	%eax, %ecx
-	movl	-4(%rbp), %eax
-	movslq	%eax, %rdx
-	movq	-24(%rbp), %rax
-	addq	%rdx, %rax
-	movzbl	(%rax), %eax
-	movsbl	%al, %eax
-	addl	%ecx, %eax
-	subl	$48, %eax
-	movl	%eax, -12(%rbp)
-	addl	$1, -4(%rbp)
-.L3:
-	movl	-4(%rbp), %eax
-	cmpl	-28(%rbp), %eax
-	jl	.L4
-	movl	-8(%rbp), %eax
-	imull	-12(%rbp), %eax
-	popq	%rbp
+flush:
+	push	%rdi
+	push	%rsi
+	push	%rdx
+	mov 	$outbuf, %rsi 		# buffer pointer
+	mov 	outpos, %rdx 		# len
+.Lflush:
+	test	%rdx, %rdx
+	jle 	.Lflushed
+	mov 	$1, %rdi 		# fd == 1, stdout
+	mov 	$1, %rax 		# 1, sys_write
+	syscall
+	test	%rax, %rax 		# error, drop the output
+	jle 	.Lflushed
+	add 	%rax, %rsi 		# write the rest
+	sub 	%rax, %rdx
+	jmp 	.Lflush
+.Lflushed:
+	movq	$0, outpos
+	pop 	%rdx
+	pop 	%rsi
+	pop 	%rdi
 	ret
 
 	############################################################
-	# convert an integer to a string. string will be
-	# returned in buffer, length returned in %eax
+	# nextc: return the next input character in %eax without
+	# consuming it, -1 at the end of the input
 	# Note: internal routine not visible globally
-	# Note: assembly generated from C code, see atoi.c
-itoa:
-	# %edi - val
-	# %rsi - buffer
-	# returns len in %eax
-	pushq	%rbp
-	movq	%rsp, %rbp
-	movl	%edi, -52(%rbp)
-	movq	%rsi, -64(%rbp)
-	movl	$10, -28(%rbp)
-	movq	-64(%rbp), %rax
-	movq	%rax, -16(%rbp)
-	cmpl	$0, -52(%rbp)
-	jns	.L7
-	movq	-16(%rbp), %rax
-	leaq	1(%rax), %rdx
-	movq	%rdx, -16(%rbp)
-	movb	$45, (%rax)
-	negl	-52(%rbp)
-.L7:
-	movl	-52(%rbp), %eax
-	movl	%eax, -32(%rbp)
-	movq	-16(%rbp), %rax
-	movq	%rax, -8(%rbp)
-.L8:
-	movl	-32(%rbp), %eax
-	movl	$0, %edx
-	divl	-28(%rbp)
-	movl	%edx, -24(%rbp)
-	movl	-32(%rbp), %eax
-	movl	$0, %edx
-	divl	-28(%rbp)
-	movl	%eax, -32(%rbp)
-	movl	-24(%rbp), %eax
-	leal	48(%rax), %ecx
-	movq	-16(%rbp), %rax
-	leaq	1(%rax), %rdx
-	movq	%rdx, -16(%rbp)
-	movl	%ecx, %edx
-	movb	%dl, (%rax)
-	cmpl	$0, -32(%rbp)
-	jne	.L8
-	movq	-16(%rbp), %rdx
-	movq	-64(%rbp), %rax
-	subq	%rax, %rdx
-	movq	%rdx, %rax
-	movl	%eax, -20(%rbp)
-	movq	-16(%rbp), %rax
-	leaq	-1(%rax), %rdx
-	movq	%rdx, -16(%rbp)
-	movb	$0, (%rax)
-.L9:
-	movq	-16(%rbp), %rax
-	movzbl	(%rax), %eax
-	movb	%al, -33(%rbp)
-	movq	-8(%rbp), %rax
-	movzbl	(%rax), %edx
-	movq	-16(%rbp), %rax
-	movb	%dl, (%rax)
-	movq	-8(%rbp), %rax
-	movzbl	-33(%rbp), %edx
-	movb	%dl, (%rax)
-	subq	$1, -16(%rbp)
-	addq	$1, -8(%rbp)
-	movq	-8(%rbp), %rax
-	cmpq	-16(%rbp), %rax
-	jb	.L9
-	movl	-20(%rbp), %eax
-	popq	%rbp
+nextc:
+	mov 	inpos, %rax
+	cmp 	inlen, %rax
+	jb  	.Lnextc
+	### input buffer empty, show the pending output
+	### and read the next chunk from stdin
+	call	flush
+	push	%rdi
+	push	%rsi
+	push	%rdx
+	mov 	$inbuf, %rsi 		# buffer pointer
+	mov 	$INSIZE, %rdx 		# len
+	mov 	$0, %rdi 		# fd == 0, stdin
+	mov 	$0, %rax 		# 0, sys_read
+	syscall				# num char read in %rax
+	pop 	%rdx
+	pop 	%rsi
+	pop 	%rdi
+	movq	$0, inpos
+	movq	$0, inlen
+	test	%rax, %rax
+	jle 	.Leof
+	mov 	%rax, inlen
+	xor 	%eax, %eax
+.Lnextc:
+	movzbl	inbuf(%rax), %eax
+	ret
+.Leof:
+	mov 	$-1, %eax
 	ret
 
 	############################################################
@@ -166,22 +139,55 @@ itoa:
 	# expects the integer value on the stack.
 	.global put
 put:
-	### get int and convert it to str
-	mov  	8(%rsp), %edi 		# int - actual argument
-	mov 	$rtsbuf, %rsi 	        # buffer pointer
-	call 	itoa
-	### print str to stdout
-	### Note: buffer pointer in %rsi still valid
-	mov	%rax, %rdx 		# len
-	mov 	$1, %rdi 		# fd == 1, stdout
-	mov 	$1, %rax 		# 1, sys_write
-	syscall
-	### print newline char
-	mov 	$nlbuf, %rsi 	        # buffer pointer
-	mov 	$1, %rdx 		# len
-	mov 	$1, %rdi 		# fd == 1, stdout
-	mov 	$1, %rax 		# 1, sys_write
-	syscall
+	### make room for sign, 10 digits and newline
+	cmpq	$OUTSIZE-12, outpos
+	jbe 	.Lroom
+	call	flush
+.Lroom:
+	mov 	outpos, %rdi
+	add 	$outbuf, %rdi 		# output pointer
+	mov  	8(%rsp), %eax 		# int - actual argument
+	test	%eax, %eax
+	jns 	.Lunsigned
+	movb	$'-', (%rdi)
+	inc 	%rdi
+	neg 	%eax 			# unsigned from here on
+.Lunsigned:
+	### convert to str backwards into rtsbuf, two digits at a time
+	mov 	$rtsbuf+16, %rsi
+.Lpair:
+	cmp 	$100, %eax
+	jb  	.Llast
+	mov 	%eax, %edx
+	imul	$1374389535, %rdx, %rdx	# val / 100 as multiplication
+	shr 	$37, %rdx 		# by 2^37/100
+	imul	$100, %edx, %ecx
+	sub 	%ecx, %eax 		# val % 100
+	movzwl	digits(,%rax,2), %ecx
+	sub 	$2, %rsi
+	mov 	%cx, (%rsi)
+	mov 	%edx, %eax
+	jmp 	.Lpair
+.Llast:
+	cmp 	$10, %eax
+	jb  	.Lone
+	movzwl	digits(,%rax,2), %ecx
+	sub 	$2, %rsi
+	mov 	%cx, (%rsi)
+	jmp 	.Lcopy
+.Lone:
+	add 	$'0', %eax
+	dec 	%rsi
+	mov 	%al, (%rsi)
+.Lcopy:
+	### copy the digits and a newline into the output buffer
+	mov 	$rtsbuf+16, %rcx
+	sub 	%rsi, %rcx 		# len
+	rep movsb
+	movb	$'\n', (%rdi)
+	inc 	%rdi
+	sub 	$outbuf, %rdi
+	mov 	%rdi, outpos
 	ret
 
 	############################################################
@@ -190,28 +196,50 @@ put:
 	.global get
 get:
 	### print prompt
-	mov 	$promptbuf, %rsi 	# buffer pointer
-	mov 	$2, %rdx 		# len of prompt
-	mov 	$1, %rdi 		# fd == 1, stdout
-	mov 	$1, %rax 		# 1, sys_write
-	syscall
-	### read str from stdin
-	mov 	$rtsbuf, %rsi 		# buffer pointer
-	mov 	$256, %rdx 		# len
-	mov 	$0, %rdi 		# fd == 0, stdin
-	mov 	$0, %rax 		# 0, sys_read
-	syscall				# num char read in %eax
-	sub 	$1, %eax 		# get rid of \n char
-	### convert str to int
-	mov  	%eax, %esi 		# len
-	mov 	$rtsbuf, %rdi    	# buffer pointer
-	call 	atoi			# result in %eax
+	cmpq	$OUTSIZE-2, outpos
+	jbe 	.Lprompt
+	call	flush
+.Lprompt:
+	mov 	outpos, %rax
+	movw	$0x203f, outbuf(%rax) 	# "? "
+	add 	$2, %rax
+	mov 	%rax, outpos
+	### parse the next integer from the input buffer
+	xor 	%edi, %edi 		# value
+	xor 	%esi, %esi 		# negative
+.Lspace:
+	call	nextc
+	cmp 	$' ', %eax 		# skip white space
+	ja  	.Lsign
+	incq	inpos
+	jmp 	.Lspace
+.Lsign:
+	cmp 	$'-', %eax
+	jne 	.Ldigit
+	mov 	$1, %esi
+	incq	inpos
+.Ldigit:
+	call	nextc
+	sub 	$'0', %eax
+	cmp 	$9, %eax 		# not a digit or end of input
+	ja  	.Lnumber
+	imul	$10, %edi, %edi
+	add 	%eax, %edi
+	incq	inpos
+	jmp 	.Ldigit
+.Lnumber:
+	mov 	%edi, %eax
+	test	%esi, %esi
+	jz  	.Lpositive
+	neg 	%eax
+.Lpositive:
 	ret
 
 	############################################################
-	# exit: shut down process cleanly
+	# exit: flush the output and shut down process cleanly
 	.global exit
 exit:
+	call	flush
 	mov 	$60,%rax		# sys_exit
 	mov 	$0,%rdi			# 0, no error
 	syscall
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Memory benchmark for the compact AST representation
+#
+# Parses synthetic Cuppa5 programs of growing size and reports the memory
+# held by the tuple tree built by the frontend and by the same tree as a
+# CompactAST, together with the time of the conversions.
+#
+# usage: python bench_ast.py [number of statements]
+
+import gc
+import tracemalloc
+from time import perf_counter
+from cuppa5_fe import parse, positions
+from compact_ast import CompactAST
+
+# every template is a single statement at the top level
+templates = [
+    'int x{0} = {0};',
+    'float[3] a{0} = {{1.0, 2.0, 3.0}};',
+    'while (x =< {0}) {{ put x; x = x + 1; }}',
+    'if (not (x == {0})) put a[1] * 2.0 - 1.0; else put "no";',
+    'int f{0}(int n, float y) return n * {0} + f{0}(n - 1, y);',
+]
+
+def program(n_stmts):
+    stmts = [templates[i % len(templates)].format(i) for i in range(n_stmts)]
+    return '\n'.join(stmts)
+
+def measure(build):
+    # the time of build and the memory allocated by it that is still held
+    # by its result, tracing the allocations slows build down, it is run
+    # a second time for the memory
+    start = perf_counter()
+    result = build()
+    elapsed = perf_counter() - start
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return (result, size, elapsed)
+
+def bench(n_stmts):
+    source = program(n_stmts)
+    tree = parse(source)
+    # the source positions are not part of the tree
+    positions.clear()
+
+    # the tuple tree, measured by rebuilding it from its compact form
+    compact = CompactAST(tree)
+    (copy, tuple_size, to_tuple_time) = measure(compact.to_tuple)
+    assert copy == tree
+    del copy
+
+    (compact, compact_size, from_tuple_time) = measure(lambda: CompactAST(tree))
+
+    print("{:>8} statements {:>9} nodes  tuples {:8.2f}MB  compact {:7.2f}MB"
+          "  ({:4.1f}x)  from {:6.3f}s  to {:6.3f}s"
+          .format(n_stmts, len(compact), tuple_size / 2**20, compact_size / 2**20,
+                  tuple_size / compact_size, from_tuple_time, to_tuple_time))
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    size = 1000
+    while size < n:
+        bench(size)
+        size *= 10
+    bench(n)
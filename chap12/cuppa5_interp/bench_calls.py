@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# Microbenchmark for the overhead of Cuppa5 function calls
+#
+# Runs call heavy programs with the tree walker and with the closure
+# compiled engine and reports the time per call.
+#
+# usage: python bench_calls.py [number of calls]
+
+from time import perf_counter
+from cuppa5_fe import parse
+from cuppa5_symtab import symtab
+from cuppa5_typecheck import typecheck, annotations
+from cuppa5_interp_walk import walk as run_walk
+from cuppa5_interp_compile import run as run_compiled
+
+# a loop calling a trivial function, performs n calls
+call_loop = '''
+int f(int x) return x;
+int i = 1;
+int s = 0;
+while (i =< %d) {
+  s = s + f(i);
+  i = i + 1;
+}
+put s;
+'''
+
+# recursive fibonacci, performs 2*fib(k+1)-1 calls
+fib = '''
+int fib(int n) {
+  if (n =< 1)
+    return n;
+  else
+    return fib(n-1) + fib(n-2);
+}
+put fib(%d);
+'''
+
+def fib_calls(k):
+    (a, b) = (0, 1)
+    for _ in range(k+1):
+        (a, b) = (b, a+b)
+    return 2*a - 1
+
+def time_run(run, ast):
+    symtab.initialize()
+    start = perf_counter()
+    run(ast)
+    return perf_counter() - start
+
+def bench(name, program, n_calls):
+    ast = parse(program)
+    symtab.initialize()
+    annotations.clear()
+    typecheck(ast)
+
+    t_walk = time_run(run_walk, ast)
+    t_compiled = time_run(run_compiled, ast)
+
+    print("{}: {} calls".format(name, n_calls))
+    print("  walker   {:8.3f}s {:8.2f}us/call"
+          .format(t_walk, 1e6 * t_walk / n_calls))
+    print("  compiled {:8.3f}s {:8.2f}us/call  ({:.1f}x)"
+          .format(t_compiled, 1e6 * t_compiled / n_calls, t_walk / t_compiled))
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    # pick the fibonacci argument so that we perform about n calls
+    k = 1
+    while fib_calls(k+1) <= n:
+        k += 1
+
+    bench("call loop", call_loop % n, n)
+    bench("fib({})".format(k), fib % k, fib_calls(k))
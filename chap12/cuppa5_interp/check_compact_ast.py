@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# Check that the compact AST converts exactly from and to the tuple format
+#
+# Parses every sample program, or the programs given on the command line,
+# converts the tree into a CompactAST and back, also through dump and
+# load, and compares the result with the original tree.  The trees are
+# compared by their repr, == does not tell -0.0 from 0.0.
+#
+# usage: python check_compact_ast.py [program ...]
+
+import glob
+import sys
+from cuppa5_fe import parse
+from compact_ast import CompactAST
+
+# constants that compare equal but are different values
+signed_zeros = 'put 0.0;\nput -0.0;\nfloat x = -0.0;\nput x + 0.0;\n'
+
+def check(name, source):
+    tree = parse(source)
+    compact = CompactAST(tree)
+    assert repr(compact.to_tuple()) == repr(tree), name + ': to_tuple'
+    loaded = CompactAST.load(compact.dump())
+    assert repr(loaded.to_tuple()) == repr(tree), name + ': dump/load'
+    print(name + ': ok')
+
+if __name__ == "__main__":
+    check('signed zeros', signed_zeros)
+    for program in sys.argv[1:] or sorted(glob.glob('*.txt')):
+        with open(program) as f:
+            source = f.read()
+        try:
+            parse(source)
+        except (SyntaxError, ValueError):
+            # some samples demonstrate errors of the frontend
+            print(program + ': skipped, does not parse')
+            continue
+        check(program, source)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# Check that deeply nested programs compile in linear time
+#
+# Runs an expression nested 50000 deep and else if chains of growing
+# length through parse, typecheck, codegen and the VM, i.e. the -v mode of
+# the interpreter.  The results have
+# to be correct and the compile time of a chain four times as long must
+# grow roughly four times, not sixteen times as with quadratic code
+# generation.
+#
+# usage: python check_depth.py
+
+import io
+from contextlib import redirect_stdout
+from time import perf_counter
+from cuppa5_fe import parse
+from cuppa5_symtab import symtab
+from cuppa5_typecheck import typecheck, annotations
+from cuppa5_codegen import codegen
+from cuppa5_vm import assemble, execute
+
+def nested(n):
+    'an expression nested n deep computing n + 1'
+    return 'int x = 0;\nx = ' + '(' * n + '1' + '+1)' * n + ';\nput x;\n'
+
+def chain(n):
+    'an else if chain of length n selecting its last branch'
+    s = 'int x = {};\nif (x == 0) put 0;\n'.format(n)
+    for i in range(1, n + 1):
+        s += 'else if (x == {0}) put {0};\n'.format(i)
+    return s
+
+def run(program):
+    'compile and run the program, returns its output and the compile time'
+    start = perf_counter()
+    ast = parse(program)
+    symtab.initialize()
+    annotations.clear()
+    typecheck(ast)
+    symtab.initialize()
+    code = codegen(ast)
+    elapsed = perf_counter() - start
+    out = io.StringIO()
+    with redirect_stdout(out):
+        execute(assemble(code))
+    return (out.getvalue().strip(), elapsed)
+
+if __name__ == "__main__":
+    (out, elapsed) = run(nested(50000))
+    assert out == '50001', out
+    print("nested 50000:  {:8.2f}s".format(elapsed))
+
+    times = dict()
+    for n in [10000, 40000]:
+        (out, times[n]) = run(chain(n))
+        assert out == str(n), out
+        print("chain {:6}:  {:8.2f}s".format(n, times[n]))
+
+    ratio = times[40000] / times[10000]
+    print("chain 40000/10000: {:.1f}x".format(ratio))
+    assert ratio < 8, "compile time grows faster than linear"
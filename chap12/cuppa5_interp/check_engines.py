@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# Check that the execution engines of the Cuppa5 interpreter agree
+#
+# Runs every sample program, or the programs given on the command line,
+# with the tree walker, the closure engine (-c) and the register VM (-v)
+# and compares their output.  The tree walker is the reference.
+#
+# usage: python check_engines.py [program ...]
+
+import glob
+import subprocess
+import sys
+
+engines = [[], ['-c'], ['-v']]
+
+# input for the programs that read values
+program_input = '3\n' * 10
+
+def run(switches, program):
+    result = subprocess.run([sys.executable, 'cuppa5_interp.py'] + switches + [program],
+                            input=program_input,
+                            capture_output=True,
+                            text=True)
+    return result.stdout
+
+if __name__ == "__main__":
+    programs = sys.argv[1:] or sorted(glob.glob('*.txt'))
+    failed = 0
+    for program in programs:
+        outputs = [run(switches, program) for switches in engines]
+        if all(out == outputs[0] for out in outputs):
+            print(program + ': ok')
+        else:
+            failed += 1
+            print(program + ': engines disagree')
+            for (switches, out) in zip(engines, outputs):
+                print('  {:4} {!r}'.format(' '.join(switches) or 'walk', out))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,173 @@
+'''
+A compact representation for our ASTs
+
+The frontends build trees of nested tuples of the shape
+
+    (TYPE, [arg1, arg2, arg3,...])
+
+which is convenient but expensive for large programs: every node is a
+separate tuple object, every node type is a string and lists of children
+are wrapped in yet another tuple like ('LIST', [...]).  A CompactAST stores
+the same tree in a handful of flat arrays,
+
+    ops     the opcode of every node, the node types are interned into
+            small integers, opcodes LIST and TUPLE stand for Python lists
+            and tuples without a type string
+    start   the index of the first element of every node in elems, the
+            elements of node n are elems[start[n]:start[n+1]]
+    elems   the children of all nodes, an element is either a reference
+            2*n to node n or a reference 2*k+1 to constant k
+    consts  the leaves of the tree, e.g. names and values, every distinct
+            constant is stored once
+
+Nodes are numbered in depth first order, the root is node 0 and the
+children of a node always have larger numbers than the node itself.  The
+conversions from and to the tuple format are exact and do not recurse,
+dumpast and the existing walkers keep working on the result of to_tuple.
+The arrays can be saved with dump and turned back into a tree with load,
+e.g. to store the tree in a file.
+Walkers written against the compact form can dispatch on the integer
+opcodes with a list instead of a dictionary keyed by strings, see opcode.
+'''
+
+from array import array
+
+# the opcodes of untyped containers
+LIST = 0
+TUPLE = 1
+
+class CompactAST:
+
+    def __init__(self, tree):
+        self.kinds = ['[]', '()']
+        self.opcodes = dict()
+        self.consts = list()
+        self.const_ix = dict()
+        self.ops = array('H')
+        self.start = array('I')
+        self.elems = array('i')
+        self.encode(tree)
+        # sentinel, the end of the elements of the last node
+        self.start.append(len(self.elems))
+        # the constants are only shared while the tree is encoded
+        del self.const_ix
+
+    def opcode(self, kind):
+        'the opcode of a node type, interning it if it is new'
+        if kind not in self.opcodes:
+            self.opcodes[kind] = len(self.kinds)
+            self.kinds.append(kind)
+        return self.opcodes[kind]
+
+    def const(self, value):
+        # constants are shared by value, unhashable ones are stored as is.
+        # floats are keyed by their repr because -0.0 == 0.0
+        try:
+            key = (type(value), repr(value) if type(value) is float else value)
+            if key not in self.const_ix:
+                self.const_ix[key] = len(self.consts)
+                self.consts.append(value)
+            return self.const_ix[key]
+        except TypeError:
+            self.consts.append(value)
+            return len(self.consts) - 1
+
+    def encode(self, tree):
+        if not isinstance(tree, (tuple, list)):
+            raise ValueError("expected a tree, got {}".format(tree))
+        # a stack of (value, slot) where slot is the index of the element
+        # referring to the value, the root has no slot
+        stack = [(tree, None)]
+        while stack:
+            (value, slot) = stack.pop()
+            if isinstance(value, list):
+                (op, items) = (LIST, value)
+            elif isinstance(value, tuple) and value and isinstance(value[0], str):
+                (op, items) = (self.opcode(value[0]), value[1:])
+            elif isinstance(value, tuple):
+                (op, items) = (TUPLE, value)
+            else:
+                self.elems[slot] = 2 * self.const(value) + 1
+                continue
+            n = len(self.ops)
+            if slot is not None:
+                self.elems[slot] = 2 * n
+            self.ops.append(op)
+            self.start.append(len(self.elems))
+            base = len(self.elems)
+            self.elems.extend([0] * len(items))
+            # push the children in reverse so that they are numbered in order
+            for i in range(len(items) - 1, -1, -1):
+                stack.append((items[i], base + i))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def kind(self, n):
+        return self.kinds[self.ops[n]]
+
+    def arity(self, n):
+        return self.start[n + 1] - self.start[n]
+
+    def is_node(self, n, i):
+        'is the i-th element of node n a node rather than a constant'
+        return not self.elems[self.start[n] + i] & 1
+
+    def element(self, n, i):
+        'the i-th element of node n, a node number or a constant'
+        code = self.elems[self.start[n] + i]
+        if code & 1:
+            return self.consts[code >> 1]
+        else:
+            return code >> 1
+
+    def to_tuple(self):
+        'convert the tree back into the tuple format'
+        # children have larger numbers than their parents, building the
+        # nodes from the last to the first one therefore finds all children
+        # already built
+        values = [None] * len(self.ops)
+        (ops, start, elems, consts) = (self.ops, self.start, self.elems, self.consts)
+        for n in range(len(ops) - 1, -1, -1):
+            items = [consts[code >> 1] if code & 1 else values[code >> 1]
+                     for code in elems[start[n]:start[n + 1]]]
+            op = ops[n]
+            if op == LIST:
+                values[n] = items
+            elif op == TUPLE:
+                values[n] = tuple(items)
+            else:
+                values[n] = tuple([self.kinds[op]] + items)
+            # release the children, only the root is needed in the end
+            for code in elems[start[n]:start[n + 1]]:
+                if not code & 1:
+                    values[code >> 1] = None
+        return values[0]
+
+    def dump(self):
+        'the tree as a tuple of strings, bytes and lists that marshal can store'
+        return (self.kinds,
+                self.ops.tobytes(),
+                self.start.tobytes(),
+                self.elems.tobytes(),
+                self.consts)
+
+    @classmethod
+    def load(cls, data):
+        'rebuild a tree from the result of dump'
+        (kinds, ops, start, elems, consts) = data
+        tree = cls.__new__(cls)
+        tree.kinds = list(kinds)
+        tree.opcodes = {kind : op for (op, kind) in enumerate(tree.kinds)}
+        tree.consts = list(consts)
+        tree.ops = array('H')
+        tree.ops.frombytes(ops)
+        tree.start = array('I')
+        tree.start.frombytes(start)
+        tree.elems = array('i')
+        tree.elems.frombytes(elems)
+        return tree
+
+    def nbytes(self):
+        'the memory used by the arrays of the tree'
+        return sum(a.itemsize * len(a) for a in [self.ops, self.start, self.elems])
@@ -0,0 +1,60 @@
+# Cuppa5 interpreter client
+#
+# runs a program on a running cuppa5_server instead of starting the
+# interpreter, the output is the same as the output of cuppa5_interp.  The
+# input of the program is read from the file given with -i and sent along
+# with the program, without -i the program gets no input.
+
+import sys
+from argparse import ArgumentParser
+from compile_server import request, default_socket
+
+# the name of the default socket, see cuppa5_server
+server_name = 'cuppa5-interp'
+
+if __name__ == "__main__":
+    # parse command line args
+    aparser = ArgumentParser()
+    aparser.add_argument('input', metavar='input_file', nargs='?', help='cuppa5 input file')
+    aparser.add_argument('-c', help='run the closure compiled program', action="store_true")
+    aparser.add_argument('-v', help='run the program on the register VM', action="store_true")
+    aparser.add_argument('-b', help='dump the register bytecode', action="store_true")
+    aparser.add_argument('-i', metavar='input', help='file with the input of the program, - for the standard input')
+    aparser.add_argument('-s', metavar='socket', default=default_socket(server_name), help='socket of the server')
+    aparser.add_argument('--stop', help='stop the server', action="store_true")
+
+    args = vars(aparser.parse_args())
+
+    if args['stop']:
+        message = {'stop': True}
+    elif args['input']:
+        f = open(args['input'], 'r')
+        char_stream = f.read()
+        f.close()
+        if args['i'] is None:
+            program_input = ''
+        elif args['i'] == '-':
+            program_input = sys.stdin.read()
+        else:
+            f = open(args['i'], 'r')
+            program_input = f.read()
+            f.close()
+        message = {'source': char_stream,
+                   'options': {'c': args['c'],
+                               'v': args['v'],
+                               'b': args['b'],
+                               'input': program_input}}
+    else:
+        aparser.error("an input file is required")
+
+    try:
+        response = request(args['s'], message)
+    except OSError as e:
+        print("error: cannot reach the server on {}: {}".format(args['s'], e))
+        sys.exit(1)
+
+    if not response['ok']:
+        print('error: ' + response['error'])
+        sys.exit(1)
+
+    sys.stdout.write(response['output'])
@@ -0,0 +1,604 @@
+'''
+codegen: this is the code generator that lowers typechecked Cuppa5 programs
+         to the register bytecode of the Cuppa5 VM, see cuppa5_vm.
+
+Every function activation has a register file, a Python list, that the
+instructions of the function address by position:
+
+    0                      the display for static scoping, see cuppa5_resolve
+    1..n                   formal arguments and local variables
+    n+1..m                 constants of the function
+    -1, -2, ...            temporaries, addressed from the end of the list
+
+The formal arguments and local variables occupy the slots computed by
+cuppa5_resolve.  Constants are allocated in registers that are initialized
+when the register file is created, therefore no instruction is needed to
+load a constant.  Temporaries only live during the execution of a single
+statement.  They are allocated from the end of the register file with
+negative indices, so they can be allocated independently of the constants.
+
+The static types computed by the typechecker determine where coercion
+instructions are needed, the VM itself does not know about types.
+
+Instructions are tuples of a mnemonic and up to three operands, just like in
+our other code generators, and labels are represented by label definition
+tuples ('L1:',).  Functions are compiled into separate instruction lists and
+bound to their slots at runtime by the 'closure' instruction.
+
+The node functions and the helpers calling them are generators yielding
+their recursive calls, see walker, so that deeply nested programs do not
+exhaust the Python stack.  They emit their instructions into the
+instruction list of the function currently being compiled instead of
+returning lists to their callers, concatenating the lists of the children
+at every level would make code generation quadratic in the nesting depth.
+'''
+
+from cuppa5_types import coerce
+from cuppa5_typecheck import annotation
+from cuppa5_resolve import resolve, slot
+from walker import run
+
+#########################################################################
+class RegisterFile:
+    '''
+    the register allocation of the function currently being compiled
+    '''
+
+    def __init__(self, frame_size, n_args):
+        # registers below the frame size hold the display, arguments
+        # and locals, constants follow them
+        self.next_reg = frame_size
+        self.n_locals = frame_size - 1 - n_args
+        self.constants = dict()
+        self.constant_values = list()
+        self.curr_temp = 0
+        self.n_temps = 0
+
+    def constant(self, value):
+        # the type is part of the key because 1 == 1.0 in Python
+        key = (type(value), value)
+        if key not in self.constants:
+            self.constants[key] = self.next_reg
+            self.constant_values.append(value)
+            self.next_reg += 1
+        return self.constants[key]
+
+    def new_temp(self):
+        self.curr_temp += 1
+        self.n_temps = max(self.n_temps, self.curr_temp)
+        return -self.curr_temp
+
+    def template(self):
+        # the initial values of all registers following the arguments
+        return [None] * self.n_locals \
+               + self.constant_values \
+               + [None] * self.n_temps
+
+# the register file of the function currently being compiled
+regs = None
+
+# the instruction list of the function currently being compiled
+code = None
+
+def emit(instr):
+    code.append(instr)
+
+#########################################################################
+_label_cnt = 0
+
+def label():
+    global _label_cnt
+    new_label = 'L' + str(_label_cnt)
+    _label_cnt += 1
+    return new_label
+
+#########################################################################
+def coerce_instr(target, source):
+    '''
+    compute the instruction that coerces a value of the source type
+    into the target type, None if no coercion is necessary
+    '''
+    if target[0] == 'ARRAY_TYPE':
+        return None
+
+    conv = coerce(target, source)
+    if conv is str:
+        return 'tostr'
+    elif conv is float:
+        return 'tofloat'
+    else:
+        # either no coercion or an illegal one, the typechecker
+        # made sure that it is not the latter
+        return None
+
+#########################################################################
+def coerced_exp(node, target_type, source_type, target=None):
+    '''
+    generate code for an expression whose value is coerced from the
+    source type to the target type
+    '''
+    instr = coerce_instr(target_type, source_type)
+    if not instr:
+        return (yield exp(node, target))
+
+    reg = yield exp(node)
+    dst = target if target is not None else regs.new_temp()
+    emit((instr, dst, reg))
+    return dst
+
+#########################################################################
+def actual_args(args):
+
+    (LIST, ll) = args
+    if not ll:
+        return ()
+
+    (formal_types, actual_types) = annotation(args)
+    arg_regs = list()
+    for (tf, ta, e) in zip(formal_types, actual_types, ll):
+        ereg = yield coerced_exp(e, tf, ta)
+        arg_regs.append(ereg)
+
+    return tuple(arg_regs)
+
+#########################################################################
+def function_reg(name):
+    '''
+    compute the register holding the function value of name together
+    with the instructions loading it
+    '''
+    (depth, index) = slot(name)
+
+    if depth == 0:
+        return ([], index)
+    else:
+        t = regs.new_temp()
+        return ([('getup', t, depth, index)], t)
+
+#########################################################################
+def call(name, args, target=None, discard=False):
+    '''
+    call the function name, a call whose value is discarded has no
+    destination register
+    '''
+    # the function value is loaded after the arguments are evaluated
+    (fcode, freg) = function_reg(name)
+    arg_regs = yield actual_args(args)
+    if discard:
+        dst = None
+    else:
+        dst = target if target is not None else regs.new_temp()
+
+    for instr in fcode:
+        emit(instr)
+    emit(('call', dst, freg, arg_regs))
+    return dst
+
+#########################################################################
+def store(storable, reg):
+    '''
+    store the value in reg into a variable storable
+    '''
+    (depth, index) = slot(storable)
+
+    if depth == 0:
+        if reg != index:
+            emit(('move', index, reg))
+    else:
+        emit(('setup', depth, index, reg))
+
+#########################################################################
+def cond_jump(cond, target_label, jump_if):
+    '''
+    generate code that jumps to the target label if the truth value of the
+    condition equals jump_if.  comparisons are fused with the jump.
+    '''
+    if cond[0] in ['EQ', 'LE']:
+        (OP, c1, c2) = cond
+        (t1, t2, t) = annotation(cond)
+        reg1 = yield coerced_exp(c1, t, t1)
+        reg2 = yield coerced_exp(c2, t, t2)
+        if cond[0] == 'EQ':
+            jump = 'jeq' if jump_if else 'jne'
+        else:
+            jump = 'jle' if jump_if else 'jgt'
+        emit((jump, reg1, reg2, target_label))
+    elif cond[0] == 'NOT':
+        (NOT, e) = cond
+        yield cond_jump(e, target_label, not jump_if)
+    else:
+        reg = yield exp(cond)
+        jump = 'jt' if jump_if else 'jf'
+        emit((jump, reg, target_label))
+
+#########################################################################
+# node functions
+#########################################################################
+# Statements
+#########################################################################
+def stmtlist(node):
+
+    (STMTLIST, lst) = node
+
+    for stmt in lst:
+        # temporaries do not survive the statement that uses them
+        regs.curr_temp = 0
+        yield walk(stmt)
+
+#########################################################################
+def nil(node):
+
+    (NIL,) = node
+
+#########################################################################
+def function(name, type, formal_args, body, frame_size):
+    '''
+    compile the body of a function into a function value of the form
+
+        ('FUNCTION', name, instruction list, register template)
+    '''
+    global regs
+    global code
+
+    (FUNCTION_TYPE, ret_type, arg_types) = type
+    (LIST, fl) = formal_args
+
+    (save_regs, save_code) = (regs, code)
+    regs = RegisterFile(frame_size, len(fl))
+    code = list()
+
+    yield walk(body)
+    # falling off the end of the function, the VM reports the missing
+    # value only if the caller uses it
+    emit(('retv',))
+
+    fun = ('FUNCTION', name, code, regs.template())
+    (regs, code) = (save_regs, save_code)
+
+    return fun
+
+#########################################################################
+def fundecl_stmt(node):
+
+    (FUNDECL, (ID, name), type, arglist, body) = node
+    (index, frame_size) = slot(node)
+
+    fun = yield function(name, type, arglist, body, frame_size)
+
+    emit(('closure', index, fun))
+
+#########################################################################
+def vardecl_stmt(node):
+
+    (VARDECL, (ID, name), type, init_val) = node
+    (type, ti) = annotation(node)
+    (index,) = slot(node)
+
+    reg = yield coerced_exp(init_val, type, ti, target=index)
+    if reg != index:
+        emit(('move', index, reg))
+
+#########################################################################
+def arraydecl_stmt(node):
+
+    (ARRAYDECL, (ID, name), type, (LIST, init_val_list)) = node
+    (index,) = slot(node)
+
+    # initializers are constants, see the frontend
+    values = tuple(value for (CONST, t, (VALUE, value)) in init_val_list)
+
+    emit(('newarray', index, values))
+
+#########################################################################
+def assign_stmt(node):
+
+    (ASSIGN, storable, e) = node
+    (ts, te) = annotation(node)
+
+    if storable[0] == 'ARRAY_ACCESS':
+        # a[i] = x
+        (ARRAY_ACCESS, array_exp, (IX, ix)) = storable
+        reg = yield exp(e)
+        areg = yield exp(array_exp)
+        ireg = yield exp(ix)
+        emit(('setelem', areg, ireg, reg))
+
+    elif ts[0] == 'ARRAY_TYPE':
+        # a = b, copy the elements, the arrays must not share memory
+        reg = yield exp(e)
+        sreg = yield exp(storable)
+        emit(('copyarray', sreg, reg))
+
+    else:
+        # x = v
+        (depth, index) = slot(storable)
+        target = index if depth == 0 else None
+        reg = yield coerced_exp(e, ts, te, target=target)
+        store(storable, reg)
+
+#########################################################################
+def get_stmt(node):
+
+    (GET, storable) = node
+    (ID, name) = storable
+    (type,) = annotation(node)
+    (depth, index) = slot(storable)
+
+    reg = index if depth == 0 else regs.new_temp()
+    emit(('input', reg, type[0], name))
+
+    store(storable, reg)
+
+#########################################################################
+def put_stmt(node):
+
+    (PUT, e) = node
+
+    reg = yield exp(e)
+    emit(('print', reg))
+
+#########################################################################
+def call_stmt(node):
+
+    (CALLSTMT, name, actual_args) = node
+
+    yield call(name, actual_args, discard=True)
+
+#########################################################################
+def return_stmt(node):
+
+    (RETURN, e) = node
+    (ret_type, t) = annotation(node)
+
+    if ret_type[0] == 'VOID_TYPE':
+        if e[0] != 'NIL':
+            yield exp(e)
+        emit(('retv',))
+    else:
+        reg = yield coerced_exp(e, ret_type, t)
+        emit(('ret', reg))
+
+#########################################################################
+def while_stmt(node):
+    '''
+    the condition is placed behind the body so that every iteration
+    executes a single conditional jump
+
+            jump Lcond
+        Lbody:
+            <body>
+        Lcond:
+            <jump to Lbody if cond>
+    '''
+    (WHILE, cond, body) = node
+
+    body_label = label()
+    cond_label = label()
+
+    emit(('jump', cond_label))
+    emit((body_label + ':',))
+    yield walk(body)
+    emit((cond_label + ':',))
+    regs.curr_temp = 0
+    yield cond_jump(cond, body_label, True)
+
+#########################################################################
+def if_stmt(node):
+
+    (IF, cond, then_stmt, else_stmt) = node
+
+    else_label = label()
+    end_label = label()
+
+    yield cond_jump(cond, else_label, False)
+    yield walk(then_stmt)
+    if else_stmt[0] == 'NIL':
+        emit((else_label + ':',))
+    else:
+        emit(('jump', end_label))
+        emit((else_label + ':',))
+        yield walk(else_stmt)
+        emit((end_label + ':',))
+
+#########################################################################
+def block_stmt(node):
+
+    (BLOCK, stmt_list) = node
+
+    # the variables of the block live in the registers of the function
+    yield walk(stmt_list)
+
+#########################################################################
+# Expressions
+#########################################################################
+def binop_exp(node, target):
+
+    (OP, c1, c2) = node
+    (t1, t2, t) = annotation(node)
+
+    reg1 = yield coerced_exp(c1, t, t1)
+    reg2 = yield coerced_exp(c2, t, t2)
+
+    if OP == 'DIV' and t[0] == 'INTEGER_TYPE':
+        instr = 'idiv'
+    else:
+        instr = binop_instr[OP]
+
+    dst = target if target is not None else regs.new_temp()
+    emit((instr, dst, reg1, reg2))
+
+    return dst
+
+binop_instr = {
+    'PLUS'  : 'add',
+    'MINUS' : 'sub',
+    'MUL'   : 'mul',
+    'DIV'   : 'div',
+    'EQ'    : 'eq',
+    'LE'    : 'le',
+}
+
+#########################################################################
+def const_exp(node, target):
+
+    (CONST, type, (VALUE, value)) = node
+
+    return into(regs.constant(value), target)
+
+#########################################################################
+def id_exp(node, target):
+
+    (ID, name) = node
+    (depth, index) = slot(node)
+
+    if depth == 0:
+        return into(index, target)
+    else:
+        dst = target if target is not None else regs.new_temp()
+        emit(('getup', dst, depth, index))
+        return dst
+
+#########################################################################
+def call_exp(node, target):
+
+    (CALLEXP, name, actual_args) = node
+
+    return (yield call(name, actual_args, target))
+
+#########################################################################
+def uminus_exp(node, target):
+
+    (UMINUS, e) = node
+
+    reg = yield exp(e)
+    dst = target if target is not None else regs.new_temp()
+    emit(('neg', dst, reg))
+
+    return dst
+
+#########################################################################
+def not_exp(node, target):
+
+    (NOT, e) = node
+
+    reg = yield exp(e)
+    dst = target if target is not None else regs.new_temp()
+    emit(('not', dst, reg))
+
+    return dst
+
+#########################################################################
+def paren_exp(node, target):
+
+    (PAREN, e) = node
+
+    return (yield exp(e, target))
+
+#########################################################################
+def array_access_exp(node, target):
+
+    (ARRAY_ACCESS, array_exp, (IX, ix)) = node
+
+    areg = yield exp(array_exp)
+    ireg = yield exp(ix)
+    dst = target if target is not None else regs.new_temp()
+    emit(('getelem', dst, areg, ireg))
+
+    return dst
+
+#########################################################################
+def into(reg, target):
+    '''
+    make sure the value in reg ends up in the target register if
+    a target was requested
+    '''
+    if target is None or target == reg:
+        return reg
+    else:
+        emit(('move', target, reg))
+        return target
+
+#########################################################################
+# walk
+#########################################################################
+def walk(node):
+    # node format: (TYPE, [child1[, child2[, ...]]])
+    type = node[0]
+
+    if type in dispatch:
+        node_function = dispatch[type]
+        return node_function(node)
+    else:
+        raise ValueError("walk: unknown tree node type: " + type)
+
+def exp(node, target=None):
+    '''
+    generate code for an expression, returns the register holding the
+    value of the expression.  if target is given then the value is computed
+    into the target register.
+    '''
+    type = node[0]
+
+    if type in exp_dispatch:
+        node_function = exp_dispatch[type]
+        return node_function(node, target)
+    else:
+        raise ValueError("exp: unknown tree node type: " + type)
+
+# a dictionary to associate tree nodes with node functions
+dispatch = {
+    'STMTLIST'     : stmtlist,
+    'NIL'          : nil,
+    'FUNDECL'      : fundecl_stmt,
+    'VARDECL'      : vardecl_stmt,
+    'ARRAYDECL'    : arraydecl_stmt,
+    'ASSIGN'       : assign_stmt,
+    'GET'          : get_stmt,
+    'PUT'          : put_stmt,
+    'CALLSTMT'     : call_stmt,
+    'RETURN'       : return_stmt,
+    'WHILE'        : while_stmt,
+    'IF'           : if_stmt,
+    'BLOCK'        : block_stmt,
+}
+
+exp_dispatch = {
+    'CONST'        : const_exp,
+    'ID'           : id_exp,
+    'CALLEXP'      : call_exp,
+    'PAREN'        : paren_exp,
+    'PLUS'         : binop_exp,
+    'MINUS'        : binop_exp,
+    'MUL'          : binop_exp,
+    'DIV'          : binop_exp,
+    'EQ'           : binop_exp,
+    'LE'           : binop_exp,
+    'UMINUS'       : uminus_exp,
+    'NOT'          : not_exp,
+    'ARRAY_ACCESS' : array_access_exp,
+}
+
+#########################################################################
+def codegen(ast):
+    '''
+    lower a typechecked program to register bytecode.  the main program
+    is compiled like the body of a function without arguments.
+    '''
+    global regs
+    global code
+    global _label_cnt
+
+    # every program starts with label L0, also in a long running process
+    _label_cnt = 0
+
+    frame_size = resolve(ast)
+    regs = RegisterFile(frame_size, 0)
+    code = list()
+
+    run(walk(ast))
+    emit(('halt',))
+
+    program = ('FUNCTION', 'main', code, regs.template())
+    (regs, code) = (None, None)
+
+    return program
@@ -6,6 +6,27 @@ node is of the shape,
 
 here TYPE is a string describing the node type.
 '''
+
+# The AST consists of immutable tuples, therefore the source positions of
+# the nodes are kept in a table keyed by the identity of the node.  The
+# statement and expression nodes of the tree built by the last call of
+# parse are mapped to the token they start with, binary operations to
+# their operator token.  The table keeps the nodes alive so that their ids
+# stay valid.
+positions = dict()
+
+def locate(node, tk):
+    positions[id(node)] = (node, tk)
+    return node
+
+def where(node):
+    'the source position of the node as a string, None if it is unknown'
+    entry = positions.get(id(node))
+    if entry and entry[0] is node:
+        return entry[1].where()
+    else:
+        return None
+
 # helper function to compute the type of a function
 def formalargs_type(args):
 
@@ -54,6 +75,7 @@ def stmt_list(stream):
 #      | {IF} IF LPAREN exp RPAREN stmt ({ELSE} ELSE stmt)?
 #      | {LCURLY} LCURLY stmt_list RCURLY
 def stmt(stream):
+    tk = stream.pointer()
     if stream.pointer().type in ['VOID_TYPE']:
         stream.match('VOID_TYPE')
         ret_type = ('VOID_TYPE',)
@@ -65,11 +87,11 @@ def stmt(stream):
         stream.match('RPAREN')
         arg_types = formalargs_type(args)
         body = stmt(stream)
-        return ('FUNDECL',
-                ('ID', id_tok.value),
-                ('FUNCTION_TYPE', ret_type, arg_types),
-                args,
-                body)
+        return locate(('FUNDECL',
+                       ('ID', id_tok.value),
+                       ('FUNCTION_TYPE', ret_type, arg_types),
+                       args,
+                       body), tk)
     elif stream.pointer().type in primitive_lookahead:
         type = data_type(stream)
         id_tok = stream.match('ID')
@@ -77,67 +99,67 @@ def stmt(stream):
         if e[0] == 'FUNCTION':
             (FUNCTION, args, body) = e
             arg_types = formalargs_type(args)
-            return ('FUNDECL',
-                    ('ID', id_tok.value),
-                    ('FUNCTION_TYPE', type, arg_types),
-                    args,
-                    body)
+            return locate(('FUNDECL',
+                           ('ID', id_tok.value),
+                           ('FUNCTION_TYPE', type, arg_types),
+                           args,
+                           body), tk)
         elif e[0] == 'EXPINIT':
-            return ('VARDECL',
-                    ('ID', id_tok.value),
-                    type,
-                    e[1])
+            return locate(('VARDECL',
+                           ('ID', id_tok.value),
+                           type,
+                           e[1]), tk)
         elif e[0] == 'ARRAYINIT':
-            return ('ARRAYDECL',
-                    ('ID', id_tok.value),
-                    type,
-                    e[1])
+            return locate(('ARRAYDECL',
+                           ('ID', id_tok.value),
+                           type,
+                           e[1]), tk)
         elif e[0] == 'NIL' and type[0] in primitive_lookahead:
-            return ('VARDECL',
-                    ('ID', id_tok.value),
-                    type,
-                    ('CONST', ('INTEGER_TYPE',), ('VALUE', 0)))
+            return locate(('VARDECL',
+                           ('ID', id_tok.value),
+                           type,
+                           ('CONST', ('INTEGER_TYPE',), ('VALUE', 0))), tk)
         elif e[0] == 'NIL' and type[0] == 'ARRAY_TYPE':
             # unpack the array type
             (ARRAY_TYPE, btype, (SIZE, size)) = type
-            return ('ARRAYDECL',
-                    ('ID', id_tok.value),
-                    type,
-                    ('LIST',
-                        [('CONST',('INTEGER_TYPE',),('VALUE', 0))
-                            for _ in range(size)]))
+            return locate(('ARRAYDECL',
+                           ('ID', id_tok.value),
+                           type,
+                           ('LIST',
+                               [('CONST',('INTEGER_TYPE',),('VALUE', 0))
+                                   for _ in range(size)])), tk)
     elif stream.pointer().type in ['ID']:
         id_tok = stream.match('ID')
         e = id_suffix(stream)
         if e[0] == 'CALL':
-            return ('CALLSTMT', ('ID', id_tok.value), e[1])
+            return locate(('CALLSTMT', ('ID', id_tok.value), e[1]), tk)
         elif e[0] == 'VAR_ASSIGN':
-            return ('ASSIGN', ('ID', id_tok.value), e[1])
+            return locate(('ASSIGN', ('ID', id_tok.value), e[1]), tk)
         elif e[0] == 'ARRAY_ASSIGN':
-            return ('ASSIGN',
-                    ('ARRAY_ACCESS',
-                     ('ID', id_tok.value),
-                     ('IX', e[1])),
-                    e[2])
+            return locate(('ASSIGN',
+                           ('ARRAY_ACCESS',
+                            ('ID', id_tok.value),
+                            ('IX', e[1])),
+                           e[2]), tk)
         elif e[0] == 'FUN_ARRAY_ASSIGN':
             (FUN_ARRAY_ASSIGN, args, ix, ae) = e
-            return ('ASSIGN',
-                    ('ARRAY_ACCESS',
-                     ('CALLEXP', ('ID', id_tok.value), args),
-                     ('IX', ix)),
-                     ae)
+            return locate(('ASSIGN',
+                           ('ARRAY_ACCESS',
+                            ('CALLEXP', ('ID', id_tok.value), args),
+                            ('IX', ix)),
+                            ae), tk)
     elif stream.pointer().type in ['GET']:
         stream.match('GET')
         id_tk = stream.match('ID')
         if stream.pointer().type in ['SEMI']:
             stream.match('SEMI')
-        return ('GET', ('ID', id_tk.value))
+        return locate(('GET', ('ID', id_tk.value)), tk)
     elif stream.pointer().type in ['PUT']:
         stream.match('PUT')
         e = exp(stream)
         if stream.pointer().type in ['SEMI']:
             stream.match('SEMI')
-        return ('PUT', e)
+        return locate(('PUT', e), tk)
     elif stream.pointer().type in ['RETURN']:
         stream.match('RETURN')
         if stream.pointer().type in exp_lookahead:
@@ -146,34 +168,43 @@ def stmt(stream):
             e = ('NIL',)
         if stream.pointer().type in ['SEMI']:
             stream.match('SEMI')
-        return ('RETURN', e)
+        return locate(('RETURN', e), tk)
     elif stream.pointer().type in ['WHILE']:
         stream.match('WHILE')
         stream.match('LPAREN')
         e = exp(stream)
         stream.match('RPAREN')
         s = stmt(stream)
-        return ('WHILE', e, s)
+        return locate(('WHILE', e, s), tk)
     elif stream.pointer().type in ['IF']:
-        stream.match('IF')
-        stream.match('LPAREN')
-        e = exp(stream)
-        stream.match('RPAREN')
-        s1 = stmt(stream)
-        if stream.pointer().type in ['ELSE']:
-            stream.match('ELSE')
-            s2 = stmt(stream)
-            return ('IF', e, s1, s2)
-        else:
-            return ('IF', e, s1, ('NIL',))
+        # an else if chain is parsed in a loop rather than by recursion,
+        # the nested IF nodes are built from the last branch backwards
+        branches = list()
+        else_stmt = ('NIL',)
+        while True:
+            if_tk = stream.match('IF')
+            stream.match('LPAREN')
+            e = exp(stream)
+            stream.match('RPAREN')
+            s1 = stmt(stream)
+            branches.append((if_tk, e, s1))
+            if stream.pointer().type in ['ELSE']:
+                stream.match('ELSE')
+                if stream.pointer().type in ['IF']:
+                    continue
+                else_stmt = stmt(stream)
+            break
+        for (if_tk, e, s1) in reversed(branches):
+            else_stmt = locate(('IF', e, s1, else_stmt), if_tk)
+        return else_stmt
     elif stream.pointer().type in ['LCURLY']:
         stream.match('LCURLY')
         sl = stmt_list(stream)
         stream.match('RCURLY')
-        return ('BLOCK', sl)
+        return locate(('BLOCK', sl), tk)
     else:
-        raise SyntaxError("stmt: syntax error at {}"
-                          .format(stream.pointer().value))
+        raise SyntaxError("stmt: syntax error at {} ({})"
+                          .format(stream.pointer().value, stream.pointer().where()))
 
 # data_type : {INTEGER_TYPE,FLOAT_TYPE,STRING_TYPE} primitive_type
 #                   ({LSQUARE} LSQUARE INTEGER RSQUARE)?
@@ -188,8 +219,8 @@ def data_type(stream):
             type = ('ARRAY_TYPE', type, ('SIZE', size))
         return type
     else:
-        raise SyntaxError("data_type: syntax error at {}"
-                          .format(stream.pointer().value))
+        raise SyntaxError("data_type: syntax error at {} ({})"
+                          .format(stream.pointer().value, stream.pointer().where()))
 
 # primitive_type : {INTEGER_TYPE} INTEGER_TYPE
 #           | {FLOAT_TYPE} FLOAT_TYPE
@@ -205,8 +236,8 @@ def primitive_type(stream):
         stream.match('STRING_TYPE')
         return ('STRING_TYPE',)
     else:
-        raise SyntaxError("primitive_type: syntax error at {}"
-                          .format(stream.pointer().value))
+        raise SyntaxError("primitive_type: syntax error at {} ({})"
+                          .format(stream.pointer().value, stream.pointer().where()))
 
 # decl_suffix : {LPAREN} LPAREN ({INTEGER_TYPE,FLOAT_TYPE,STRING_TYPE} formal_args)? RPAREN stmt
 #             | {ASSIGN} ASSIGN exp ({SEMI} SEMI)?
@@ -293,15 +324,31 @@ def id_suffix(stream):
             stream.match('SEMI')
         return ('VAR_ASSIGN', e)
     else:
-        raise SyntaxError("id_suffix: syntax error at {}"
-                          .format(stream.pointer().value))
+        raise SyntaxError("id_suffix: syntax error at {} ({})"
+                          .format(stream.pointer().value, stream.pointer().where()))
 
 # exp : {INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} exp_low
+# exp_low : {INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} exp_med ({EQ,LE} (EQ|LE) exp_med)*
+# exp_med : {INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} exp_high ({PLUS,MINUS} (PLUS|MINUS) exp_high)*
+# exp_high : {INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} operand ({MUL,DIV} (MUL|DIV) operand)*
+# operand : {INTEGER,FLOAT,STRING,ID} primary
+#         | {LPAREN} LPAREN exp RPAREN
+#         | {MINUS} MINUS operand
+#         | {NOT} NOT operand
+#
+# exp_low, exp_med and exp_high are not parsed by functions of their own.
+# Instead exp parses by precedence climbing with the precedence levels of
+# the binary operators given by the table below.  The binary operators
+# waiting for their right operand as well as the open parentheses and
+# unary operators in front of the current operand are kept on an explicit
+# stack, therefore the nesting depth of an expression is not limited by
+# the recursion limit of Python.
+#
 # exp_lookahead
 #   == exp_low_lookahead
 #   == exp_med_lookahead
 #   == exp_high_lookahead
-#   == primary_lookahead
+#   == operand_lookahead
 exp_lookahead = [
     'INTEGER',
     'FLOAT',
@@ -312,120 +359,120 @@ exp_lookahead = [
     'NOT',
     ]
 
-def exp(stream):
-    if stream.pointer().type in exp_lookahead:
-        e = exp_low(stream)
-        return e
-    else:
-        raise SyntaxError("exp: syntax error at {}"
-                          .format(stream.pointer().value))
+binop_precedence = {
+    'EQ'    : 1,
+    'LE'    : 1,
+    'PLUS'  : 2,
+    'MINUS' : 2,
+    'MUL'   : 3,
+    'DIV'   : 3,
+    }
 
-# exp_low : {INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} exp_med ({EQ,LE} (EQ|LE) exp_med)*
-def exp_low(stream):
-    if stream.pointer().type in exp_lookahead:
-        e = exp_med(stream)
-        while stream.pointer().type in ['EQ','LE']:
-            if stream.pointer().type == 'EQ':
-                op_tk = stream.match('EQ')
-            else:
-                op_tk = stream.match('LE')
-            tmp = exp_med(stream)
-            e = (op_tk.type, e, tmp)
-        return e
+def unary_exp(op_tk, e):
+    # constant operands are folded
+    if op_tk.type == 'MINUS':
+        if e[0] == 'CONST' and e[1][0] in ['INTEGER_TYPE', 'FLOAT_TYPE']:
+            (CONST, type, (VALUE, value)) = e
+            return locate(('CONST', type, ('VALUE', -value)), op_tk)
+        else:
+            return locate(('UMINUS', e), op_tk)
     else:
-        raise SyntaxError("exp_low: syntax error at {}"
-                          .format(stream.pointer().value))
+        if e[0] == 'CONST' and e[1][0] == 'INTEGER_TYPE':
+            (CONST, type, (VALUE, value)) = e
+            return locate(('CONST', type, ('VALUE', 0 if value else 1)), op_tk)
+        else:
+            return locate(('NOT', e), op_tk)
 
-# exp_med : {INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} exp_high ({PLUS,MINUS} (PLUS|MINUS) exp_high)*
-def exp_med(stream):
-    if stream.pointer().type in exp_lookahead:
-        e = exp_high(stream)
-        while stream.pointer().type in ['PLUS','MINUS']:
-            if stream.pointer().type == 'PLUS':
-                op_tk = stream.match('PLUS')
-            else:
-                op_tk = stream.match('MINUS')
-            tmp = exp_high(stream)
-            e = (op_tk.type, e, tmp)
-        return e
-    else:
-        raise SyntaxError("exp_med: syntax error at {}"
-                          .format(stream.pointer().value))
+def exp(stream):
+    if stream.pointer().type not in exp_lookahead:
+        raise SyntaxError("exp: syntax error at {} ({})"
+                          .format(stream.pointer().value, stream.pointer().where()))
 
-# exp_high : {INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} primary ({MUL,DIV} (MUL|DIV) primary)*
-def exp_high(stream):
-    if stream.pointer().type in exp_lookahead:
+    # the stack holds entries ('LPAREN', tk), ('UNARY', tk) and
+    # ('BINARY', tk, left operand)
+    stack = list()
+    open_parens = 0
+
+    while True:
+        # open parentheses and unary operators in front of an operand
+        while stream.pointer().type in ['LPAREN', 'MINUS', 'NOT']:
+            tk = stream.match(stream.pointer().type)
+            if tk.type == 'LPAREN':
+                stack.append(('LPAREN', tk))
+                open_parens += 1
+            else:
+                stack.append(('UNARY', tk))
         e = primary(stream)
-        while stream.pointer().type in ['MUL','DIV']:
-            if stream.pointer().type == 'MUL':
-                op_tk = stream.match('MUL')
+
+        while True:
+            # the operand is complete, apply the unary operators in front of it
+            while stack and stack[-1][0] == 'UNARY':
+                e = unary_exp(stack.pop()[1], e)
+
+            type = stream.pointer().type
+            if type in binop_precedence:
+                # the operators are left associative, reduce all operators
+                # on the stack with the same or a higher precedence
+                while (stack and stack[-1][0] == 'BINARY'
+                       and binop_precedence[stack[-1][1].type] >= binop_precedence[type]):
+                    (BINARY, op_tk, left) = stack.pop()
+                    e = locate((op_tk.type, left, e), op_tk)
+                op_tk = stream.match(type)
+                stack.append(('BINARY', op_tk, e))
+                break
+            elif type == 'RPAREN' and open_parens > 0:
+                # the parenthesized expression is complete and becomes the operand
+                while stack[-1][0] == 'BINARY':
+                    (BINARY, op_tk, left) = stack.pop()
+                    e = locate((op_tk.type, left, e), op_tk)
+                stack.pop()
+                open_parens -= 1
+                stream.match('RPAREN')
             else:
-                op_tk = stream.match('DIV')
-            tmp = primary(stream)
-            e = (op_tk.type, e, tmp)
-        return e
-    else:
-        raise SyntaxError("exp_high: syntax error at {}"
-                          .format(stream.pointer().value))
+                # end of the expression
+                while stack and stack[-1][0] == 'BINARY':
+                    (BINARY, op_tk, left) = stack.pop()
+                    e = locate((op_tk.type, left, e), op_tk)
+                if open_parens > 0:
+                    stream.match('RPAREN')
+                return e
 
 # primary : {INTEGER} INTEGER
 #         | {FLOAT} FLOAT
 #         | {STRING} STRING
 #         | {ID} ID ({LPAREN,LSQUARE} id_exp_suffix)?
-#         | {LPAREN} LPAREN exp RPAREN
-#         | {MINUS} MINUS primary
-#         | {NOT} NOT primary
 def primary(stream):
+    tk = stream.pointer()
     if stream.pointer().type in ['INTEGER']:
         tk = stream.match('INTEGER')
-        return ('CONST', ('INTEGER_TYPE',), ('VALUE', int(tk.value)))
+        return locate(('CONST', ('INTEGER_TYPE',), ('VALUE', int(tk.value))), tk)
     elif stream.pointer().type in ['FLOAT']:
         tk = stream.match('FLOAT')
-        return ('CONST', ('FLOAT_TYPE',), ('VALUE', float(tk.value)))
+        return locate(('CONST', ('FLOAT_TYPE',), ('VALUE', float(tk.value))), tk)
     elif stream.pointer().type in ['STRING']:
         tk = stream.match('STRING')
-        return ('CONST', ('STRING_TYPE',), ('VALUE', str(tk.value)))
+        return locate(('CONST', ('STRING_TYPE',), ('VALUE', str(tk.value))), tk)
     elif stream.pointer().type in ['ID']:
         id_tok = stream.match('ID')
         if stream.pointer().type in ['LPAREN','LSQUARE']:
             e = id_exp_suffix(stream)
             if e[0] == 'CALL':
-                return ('CALLEXP', ('ID', id_tok.value), e[1])
+                return locate(('CALLEXP', ('ID', id_tok.value), e[1]), tk)
             elif e[0] == 'ARRAY':
-                return ('ARRAY_ACCESS',
-                        ('ID', id_tok.value),
-                        ('IX', e[1]))
+                return locate(('ARRAY_ACCESS',
+                               ('ID', id_tok.value),
+                               ('IX', e[1])), tk)
             elif e[0] == 'FUN_ARRAY':
-                return ('ARRAY_ACCESS',
-                        ('CALLEXP', ('ID', id_tok.value), e[1]),
-                        ('IX', e[2]))
+                return locate(('ARRAY_ACCESS',
+                               ('CALLEXP', ('ID', id_tok.value), e[1]),
+                               ('IX', e[2])), tk)
             else:
                 raise ValueError("uknown suffix {}".format(e[0]))
         else:
-            return ('ID', id_tok.value)
-    elif stream.pointer().type in ['LPAREN']:
-        stream.match('LPAREN')
-        e = exp(stream)
-        stream.match('RPAREN')
-        return e
-    elif stream.pointer().type in ['MINUS']:
-        stream.match('MINUS')
-        e = primary(stream)
-        if e[0] == 'CONST' and e[1][0] in ['INTEGER_TYPE', 'FLOAT_TYPE']:
-            return ('CONST', e[1], -e[2])
-        else:
-            return ('UMINUS', e)
-    elif stream.pointer().type in ['NOT']:
-        stream.match('NOT')
-        e = primary(stream)
-        # (CONST, TYPE, VAL)
-        if e[0] == 'CONST' and e[1][0] == 'INTEGER_TYPE':
-            return ('CONST', ('INTEGER_TYPE',), 0 if e[2] else 1)
-        else:
-            return ('NOT', e)
+            return locate(('ID', id_tok.value), tk)
     else:
-        raise SyntaxError("primary: syntax error at {}"
-                          .format(stream.pointer().value))
+        raise SyntaxError("primary: syntax error at {} ({})"
+                          .format(stream.pointer().value, stream.pointer().where()))
 
 # id_exp_suffix : {LPAREN} LPAREN ({INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} actual_args)? RPAREN
 #                       ({LSQUARE} LSQUARE exp RSQUARE)?
@@ -451,8 +498,8 @@ def id_exp_suffix(stream):
         stream.match('RSQUARE')
         return ('ARRAY', e)
     else:
-        raise ValueError("syntax error at {}"
-                        .format(stream.pointer().value))
+        raise ValueError("syntax error at {} ({})"
+                        .format(stream.pointer().value, stream.pointer().where()))
 
 # formal_args : {INTEGER_TYPE,FLOAT_TYPE,STRING_TYPE} data_type ID ({COMMA} COMMA data_type ID)*
 def formal_args(stream):
@@ -467,8 +514,8 @@ def formal_args(stream):
             ll.append(('FORMALARG', type, ('ID', id_tok.value)))
         return ('LIST', ll)
     else:
-        raise SyntaxError("formal_args: syntax error at {}"
-                          .format(stream.pointer().value))
+        raise SyntaxError("formal_args: syntax error at {} ({})"
+                          .format(stream.pointer().value, stream.pointer().where()))
 
 # actual_args : {INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} exp ({COMMA} COMMA exp)*
 def actual_args(stream):
@@ -481,17 +528,18 @@ def actual_args(stream):
             ll.append(e)
         return ('LIST', ll)
     else:
-        raise SyntaxError("actual_args: syntax error at {}"
-                          .format(stream.pointer().value))
+        raise SyntaxError("actual_args: syntax error at {} ({})"
+                          .format(stream.pointer().value, stream.pointer().where()))
 
 # frontend top-level driver
 def parse(stream):
     from cuppa5_lexer import Lexer
+    positions.clear()
     token_stream = Lexer(stream)
     sl = stmt_list(token_stream) # call the parser function for start symbol
     if not token_stream.end_of_file():
-        raise SyntaxError("parse: syntax error at {}"
-                          .format(token_stream.pointer().value))
+        raise SyntaxError("parse: syntax error at {} ({})"
+                          .format(token_stream.pointer().value, token_stream.pointer().where()))
     else:
         return sl
 
@@ -3,20 +3,70 @@
 
 from cuppa5_fe import parse
 from cuppa5_symtab import symtab
-from cuppa5_typecheck import walk as typecheck
+from cuppa5_typecheck import typecheck, annotations
+from cuppa5_typecheck import save_annotations, restore_annotations
 from cuppa5_interp_walk import walk as run
+from cuppa5_interp_compile import run as run_compiled
+from cuppa5_codegen import codegen
+from cuppa5_vm import assemble, execute
+from compact_ast import CompactAST
+from parse_cache import ParseCache, version
 from dumpast import dumpast
+from pprint import pprint
 
-def interp(input_stream, fe_ast=False, exceptions=False):
+def compiler_version():
+    import cuppa5_lexer, cuppa5_fe, cuppa5_types, cuppa5_symtab
+    import cuppa5_typecheck, compact_ast, walker
+    return version(cuppa5_lexer,
+                   cuppa5_fe,
+                   cuppa5_types,
+                   cuppa5_symtab,
+                   cuppa5_typecheck,
+                   compact_ast,
+                   walker)
+
+def check(input_stream, cache=None):
+    '''
+    parse and typecheck the program, with a cache a program seen before is
+    loaded from the cache instead together with its type annotations
+    '''
+    if cache:
+        entry = cache.get(input_stream)
+        if entry is not None:
+            (tree, saved) = entry
+            ast = CompactAST.load(tree).to_tuple()
+            restore_annotations(ast, saved)
+            return ast
+    ast = parse(input_stream)
+    symtab.initialize()
+    annotations.clear()
+    typecheck(ast)
+    if cache:
+        # the compact form is stored, marshal cannot store deeply nested trees
+        cache.put(input_stream, (CompactAST(ast).dump(), save_annotations(ast)))
+    return ast
+
+def interp(input_stream,
+           fe_ast=False,
+           exceptions=False,
+           compiled=False,
+           vm=False,
+           bytecode=False,
+           cache=None):
     try:
-        ast = parse(input_stream)
         if fe_ast:
-            dumpast(ast)
+            dumpast(parse(input_stream))
             sys.exit(0)
+        ast = check(input_stream, cache)
         symtab.initialize()
-        typecheck(ast)
-        symtab.initialize()
-        run(ast)
+        if bytecode:
+            pprint(codegen(ast))
+        elif vm:
+            execute(assemble(codegen(ast)))
+        elif compiled:
+            run_compiled(ast)
+        else:
+            run(ast)
     except Exception as e:
         if exceptions:
             raise e # rethrow for visibility
@@ -29,14 +79,28 @@ if __name__ == "__main__":
     import os
 
     ast_switch = False
+    except_switch = False
+    compile_switch = False
+    vm_switch = False
+    bytecode_switch = False
+    cache_switch = False
     char_stream = ''
 
     if len(sys.argv) == 1: # no args - read stdin
         char_stream = sys.stdin.read()
     else:
-        # test if there is a switch as first arg
-        ast_switch = sys.argv[1] == '-d'
-        except_switch = sys.argv[1] == '-e'
+        # test for switches in front of the filename
+        switches = sys.argv[1:-1]
+        ast_switch = '-d' in switches
+        except_switch = '-e' in switches
+        # -c: run the closure compiled program instead of the tree walker
+        compile_switch = '-c' in switches
+        # -v: run the program on the register VM
+        vm_switch = '-v' in switches
+        # -b: dump the register bytecode of the program
+        bytecode_switch = '-b' in switches
+        # -C: cache the typechecked program
+        cache_switch = '-C' in switches
         # last arg is the filename to open and read
         input_file = sys.argv[-1]
         if not os.path.isfile(input_file):
@@ -47,4 +111,10 @@ if __name__ == "__main__":
             char_stream = f.read()
             f.close()
 
-    interp(char_stream, fe_ast=ast_switch, exceptions=except_switch)
+    interp(char_stream,
+           fe_ast=ast_switch,
+           exceptions=except_switch,
+           compiled=compile_switch,
+           vm=vm_switch,
+           bytecode=bytecode_switch,
+           cache=ParseCache(compiler_version()) if cache_switch else None)
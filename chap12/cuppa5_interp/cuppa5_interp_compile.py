@@ -0,0 +1,559 @@
+# Compile Cuppa5 programs into a tree of Python closures.
+#
+# The tree walker in cuppa5_interp_walk looks up the node function in
+# its dispatch dictionary and unpacks the node tuple every time a node
+# is visited.  Here we walk the AST exactly once, unpack every node and
+# resolve its kind ahead of time, and return a Python closure that does
+# nothing but the actual work of the node at runtime.  Executing a
+# program then means calling the closure of the root statement list.
+#
+# The static types computed by the typechecker are available through
+# its annotations, therefore type promotion and coercion are resolved
+# while compiling and the closures work on plain Python values:
+# expression closures return the value of the expression.
+#
+# Variables do not live in the symbol table but in frames, see
+# cuppa5_resolve.  Every closure takes the frame of the current
+# function activation as its argument and accesses variables through
+# the (depth, index) slots computed by the resolver.
+#
+# Return statements do not raise exceptions.  Instead every statement
+# closure returns a completion: None if execution continues with the
+# next statement, otherwise the value of the executed return statement
+# (VOID for functions without a return value).  Compound statements
+# pass a completion other than None on to their caller, which means
+# that it propagates up to the function call that consumes it.
+#
+# The tree walker remains the reference implementation of the Cuppa5
+# semantics.
+
+from cuppa5_types import coerce, id as identity
+from cuppa5_typecheck import annotation
+from cuppa5_resolve import resolve, slot
+
+# the completion of a return statement without a value
+VOID = ('VOID',)
+
+#########################################################################
+def coercion(target, source):
+    '''
+    compute the coercion function from the source type to the target
+    type at compile time.  arrays are passed and returned by reference
+    and are never coerced.
+    '''
+    if target[0] == 'ARRAY_TYPE':
+        return identity
+    else:
+        return coerce(target, source)
+
+#########################################################################
+def coerced(conv, code):
+    '''
+    wrap the closure code so that its value is coerced with conv
+    '''
+    if conv is identity:
+        return code
+
+    def run(frame):
+        return conv(code(frame))
+    return run
+
+#########################################################################
+def compile_store(storable):
+    '''
+    compile a variable storable into a closure that stores a value
+    in the slot of the variable
+    '''
+    (depth, index) = slot(storable)
+
+    if depth == 0:
+        def store(frame, v):
+            frame[index] = v
+    else:
+        def store(frame, v):
+            frame[0][-depth][index] = v
+    return store
+
+#########################################################################
+def compile_location(storable):
+    '''
+    compile an array element storable, e.g. a[i], into a closure
+    that computes its location as a (memory, offset) pair.
+    '''
+    (ARRAY_ACCESS, name_exp, (IX, ix)) = storable
+    (ARRAY_TYPE, base_type, (SIZE, size)) = annotation(storable)[0]
+    name_code = compile(name_exp)
+    ix_code = compile(ix)
+
+    def location(frame):
+        memory = name_code(frame)
+        offset = ix_code(frame)
+        if offset < 0 or offset > size-1:
+            raise ValueError("array index {} out of bounds"
+                        .format(offset))
+        return (memory, offset)
+    return location
+
+#########################################################################
+def compile_actual_args(args):
+    '''
+    compile the list of actual arguments into a tuple of closures that
+    compute the actual values already coerced to the types of the
+    formal arguments
+    '''
+    (LIST, ll) = args
+    if not ll:
+        return ()
+
+    (formal_types, actual_types) = annotation(args)
+    arg_codes = tuple(coerced(coercion(tf, ta), compile(e))
+                      for (tf, ta, e) in zip(formal_types, actual_types, ll))
+
+    return arg_codes
+
+#########################################################################
+def compile_call(name, actual_arglist):
+    '''
+    compile calls for both call statements and call expressions.
+    the closure returns the completion of the function body.
+    '''
+    (depth, index) = slot(name)
+    arg_codes = compile_actual_args(actual_arglist)
+
+    def call(frame):
+        # the funval holds the compiled body of the function
+        if depth == 0:
+            funval = frame[index]
+        else:
+            funval = frame[0][-depth][index]
+        (body_code, locals, display) = funval
+
+        # switching the environment just means creating the new frame:
+        # the display of the function for static scoping followed by
+        # the actual arguments and the slots for the locals
+        new_frame = [display]
+        for code in arg_codes:
+            new_frame.append(code(frame))
+        new_frame += locals
+
+        return body_code(new_frame)
+    return call
+
+#########################################################################
+# node functions
+#########################################################################
+def stmtlist(node):
+
+    (STMTLIST, lst) = node
+    stmt_codes = tuple(compile(stmt) for stmt in lst)
+
+    def run(frame):
+        for stmt_code in stmt_codes:
+            completion = stmt_code(frame)
+            if completion is not None:
+                return completion
+    return run
+
+#########################################################################
+def nil(node):
+
+    (NIL,) = node
+
+    def run(frame):
+        return None
+    return run
+
+#########################################################################
+def fundecl_stmt(node):
+
+    (FUNDECL, (ID, name), type, (LIST, fl), body) = node
+    (index, frame_size) = slot(node)
+    body_code = compile(body)
+    # initial values of the slots following the formal arguments
+    locals = [None] * (frame_size - 1 - len(fl))
+
+    def run(frame):
+        # the display of the function consists of the frames of the
+        # statically enclosing functions including the current frame
+        frame[index] = (body_code, locals, frame[0] + (frame,))
+    return run
+
+#########################################################################
+def vardecl_stmt(node):
+
+    (VARDECL, (ID, name), type, init_val) = node
+    (type, ti) = annotation(node)
+    (index,) = slot(node)
+    init_code = coerced(coerce(type, ti), compile(init_val))
+
+    def run(frame):
+        frame[index] = init_code(frame)
+    return run
+
+#########################################################################
+def arraydecl_stmt(node):
+
+    (ARRAYDECL, (ID, name), array_type, (LIST, init_val_list)) = node
+    (index,) = slot(node)
+    init_codes = tuple(compile(e) for e in init_val_list)
+
+    def run(frame):
+        # every execution of the declaration allocates fresh memory
+        frame[index] = [code(frame) for code in init_codes]
+    return run
+
+#########################################################################
+def assign_stmt(node):
+
+    (ASSIGN, storable, exp) = node
+    (ts, te) = annotation(node)
+    exp_code = compile(exp)
+
+    if storable[0] == 'ARRAY_ACCESS':
+        # we are copying a value into a single element, e.g.
+        #   a[i] = x
+        location = compile_location(storable)
+
+        def run(frame):
+            v = exp_code(frame)
+            (memory, offset) = location(frame)
+            memory[offset] = v
+        return run
+
+    if ts[0] == 'ARRAY_TYPE':
+        # we are copying the whole array, e.g.
+        #     a = b
+        # copy the elements, the arrays must not share memory
+        memory_code = compile(storable)
+
+        def run(frame):
+            v = exp_code(frame)
+            memory_code(frame)[:] = v
+        return run
+
+    # we are copying a scalar value, e.g.
+    #     x = v
+    (depth, index) = slot(storable)
+    exp_code = coerced(coerce(ts, te), exp_code)
+
+    if depth == 0:
+        def run(frame):
+            frame[index] = exp_code(frame)
+    else:
+        store = compile_store(storable)
+        def run(frame):
+            store(frame, exp_code(frame))
+    return run
+
+#########################################################################
+def get_stmt(node):
+
+    (GET, (ID, name)) = node
+    (type,) = annotation(node)
+    store = compile_store(node[1])
+
+    def run(frame):
+        s = input("Value for " + name + '? ')
+        try:
+            if type[0] == 'STRING_TYPE':
+                new_value = s
+            elif type[0] == 'FLOAT_TYPE':
+                new_value = float(s)
+            elif type[0] == 'INTEGER_TYPE':
+                new_value = int(s)
+            else:
+                raise ValueError("input not supported for this type")
+        except ValueError:
+            raise ValueError("expected a {} value for {}"
+                    .format(type[0], name))
+        store(frame, new_value)
+    return run
+
+#########################################################################
+def put_stmt(node):
+
+    (PUT, exp) = node
+    exp_code = compile(exp)
+
+    def run(frame):
+        print(exp_code(frame))
+    return run
+
+#########################################################################
+def call_stmt(node):
+
+    (CALLSTMT, name, actual_args) = node
+    call = compile_call(name, actual_args)
+
+    def run(frame):
+        # the return value is discarded, execution continues
+        call(frame)
+    return run
+
+#########################################################################
+def return_stmt(node):
+
+    (RETURN, exp) = node
+    (ret_type, t) = annotation(node)
+    exp_code = compile(exp)
+
+    if ret_type[0] == 'VOID_TYPE':
+        def run(frame):
+            exp_code(frame)
+            return VOID
+    else:
+        # values of Cuppa5 expressions are never None, therefore the
+        # value itself serves as the completion
+        return coerced(coercion(ret_type, t), exp_code)
+    return run
+
+#########################################################################
+def while_stmt(node):
+
+    (WHILE, cond, body) = node
+    cond_code = compile(cond)
+    body_code = compile(body)
+
+    def run(frame):
+        while cond_code(frame):
+            completion = body_code(frame)
+            if completion is not None:
+                return completion
+    return run
+
+#########################################################################
+def if_stmt(node):
+
+    (IF, cond, then_stmt, else_stmt) = node
+    cond_code = compile(cond)
+    then_code = compile(then_stmt)
+    else_code = compile(else_stmt)
+
+    def run(frame):
+        if cond_code(frame):
+            return then_code(frame)
+        else:
+            return else_code(frame)
+    return run
+
+#########################################################################
+def block_stmt(node):
+
+    (BLOCK, stmt_list) = node
+    # the variables of the block live in the frame of the enclosing
+    # function, a block does not need any code of its own
+    return compile(stmt_list)
+
+#########################################################################
+def binop_exp(node):
+    '''
+    binary operators are specialized on the operand types computed by
+    the typechecker.  integer and float operands combine directly in
+    Python, only conversions into strings need an explicit coercion.
+    '''
+    (OP,c1,c2) = node
+    (t1, t2, t) = annotation(node)
+    code1 = compile(c1)
+    code2 = compile(c2)
+
+    if OP == 'DIV' and t[0] == 'INTEGER_TYPE':
+        OP = 'IDIV'
+
+    conv1 = coerce(t, t1)
+    conv2 = coerce(t, t2)
+
+    if t[0] != 'STRING_TYPE' or (conv1 is identity and conv2 is identity):
+        return fast_binop_dispatch[OP](code1, code2)
+    else:
+        op = binop_dispatch[OP]
+        def run(frame):
+            return op(conv1(code1(frame)), conv2(code2(frame)))
+        return run
+
+def plus(code1, code2):
+    def run(frame):
+        return code1(frame) + code2(frame)
+    return run
+
+def minus(code1, code2):
+    def run(frame):
+        return code1(frame) - code2(frame)
+    return run
+
+def mul(code1, code2):
+    def run(frame):
+        return code1(frame) * code2(frame)
+    return run
+
+def div(code1, code2):
+    def run(frame):
+        return code1(frame) / code2(frame)
+    return run
+
+def idiv(code1, code2):
+    def run(frame):
+        return code1(frame) // code2(frame)
+    return run
+
+def eq(code1, code2):
+    def run(frame):
+        return 1 if code1(frame) == code2(frame) else 0
+    return run
+
+def le(code1, code2):
+    def run(frame):
+        return 1 if code1(frame) <= code2(frame) else 0
+    return run
+
+# closures for operands that need no coercion
+fast_binop_dispatch = {
+    'PLUS'  : plus,
+    'MINUS' : minus,
+    'MUL'   : mul,
+    'DIV'   : div,
+    'IDIV'  : idiv,
+    'EQ'    : eq,
+    'LE'    : le,
+}
+
+# operators applied to coerced operand values
+binop_dispatch = {
+    'PLUS'  : lambda v1, v2: v1 + v2,
+    'EQ'    : lambda v1, v2: 1 if v1 == v2 else 0,
+    'LE'    : lambda v1, v2: 1 if v1 <= v2 else 0,
+}
+
+#########################################################################
+def const_exp(node):
+
+    (CONST, type, (VALUE, value)) = node
+
+    def run(frame):
+        return value
+    return run
+
+#########################################################################
+def id_exp(node):
+
+    (ID, name) = node
+    (depth, index) = slot(node)
+
+    if depth == 0:
+        def run(frame):
+            return frame[index]
+    else:
+        def run(frame):
+            return frame[0][-depth][index]
+    return run
+
+#########################################################################
+def call_exp(node):
+
+    (CALLEXP, (ID, name), actual_args) = node
+    call = compile_call(node[1], actual_args)
+
+    def run(frame):
+        return_value = call(frame)
+        if return_value is None or return_value is VOID:
+            raise ValueError("No return value from function {}".format(name))
+        return return_value
+    return run
+
+#########################################################################
+def uminus_exp(node):
+
+    (UMINUS, exp) = node
+    exp_code = compile(exp)
+
+    def run(frame):
+        return - exp_code(frame)
+    return run
+
+#########################################################################
+def not_exp(node):
+
+    (NOT, exp) = node
+    exp_code = compile(exp)
+
+    def run(frame):
+        return 0 if exp_code(frame) else 1
+    return run
+
+#########################################################################
+def paren_exp(node):
+
+    (PAREN, exp) = node
+    # parentheses do not need any code of their own
+    return compile(exp)
+
+#########################################################################
+def array_access_exp(node):
+
+    (ARRAY_ACCESS, array_exp, (IX, ix)) = node
+    (ARRAY_TYPE, base_type, (SIZE, size)) = annotation(node)[0]
+    array_code = compile(array_exp)
+    ix_code = compile(ix)
+
+    def run(frame):
+        varray = array_code(frame)
+        vix = ix_code(frame)
+        if vix < 0 or vix > size-1:
+            raise ValueError("array index {} out of bounds".format(vix))
+        return varray[vix]
+    return run
+
+#########################################################################
+# compile
+#########################################################################
+def compile(node):
+    # node format: (TYPE, [child1[, child2[, ...]]])
+    type = node[0]
+
+    if type in dispatch:
+        node_function = dispatch[type]
+        return node_function(node)
+    else:
+        raise ValueError("compile: unknown tree node type: " + type)
+
+# a dictionary to associate tree nodes with node functions
+dispatch = {
+    'STMTLIST'     : stmtlist,
+    'NIL'          : nil,
+    'FUNDECL'      : fundecl_stmt,
+    'VARDECL'      : vardecl_stmt,
+    'ARRAYDECL'    : arraydecl_stmt,
+    'ASSIGN'       : assign_stmt,
+    'GET'          : get_stmt,
+    'PUT'          : put_stmt,
+    'CALLSTMT'     : call_stmt,
+    'RETURN'       : return_stmt,
+    'WHILE'        : while_stmt,
+    'IF'           : if_stmt,
+    'BLOCK'        : block_stmt,
+    'CONST'        : const_exp,
+    'ID'           : id_exp,
+    'CALLEXP'      : call_exp,
+    'PAREN'        : paren_exp,
+    'PLUS'         : binop_exp,
+    'MINUS'        : binop_exp,
+    'MUL'          : binop_exp,
+    'DIV'          : binop_exp,
+    'EQ'           : binop_exp,
+    'LE'           : binop_exp,
+    'UMINUS'       : uminus_exp,
+    'NOT'          : not_exp,
+    'ARRAY_ACCESS' : array_access_exp,
+}
+
+#########################################################################
+def run(ast):
+    '''
+    resolve the variables of the typechecked AST to frame slots,
+    compile the AST into closures and execute it in the global frame
+    '''
+    frame_size = resolve(ast)
+    code = compile(ast)
+    # the global frame has an empty display
+    frame = [()] + [None] * (frame_size - 1)
+    code(frame)
+    return None
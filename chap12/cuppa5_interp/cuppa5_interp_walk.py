@@ -366,7 +366,7 @@ def div_exp(node):
 
     t = promote(t1,t2)
 
-    if t == 'INTEGER_TYPE':
+    if t[0] == 'INTEGER_TYPE':
         return ('INTEGER_TYPE', v1 // v2)
     else:
         return (t, coerce(t,t1)(v1) / coerce(t,t2)(v2))
@@ -0,0 +1,310 @@
+# A tree walker to resolve the identifiers of Cuppa5 programs to frame slots
+#
+# At runtime every function activation gets a frame, a Python list of
+# slots.  Slot 0 of a frame holds the display, a tuple with the frames of
+# the statically enclosing functions, and the remaining slots hold the
+# formal arguments followed by the local variables of the function.
+# Variables declared in nested blocks are allocated in the frame of the
+# enclosing function, blocks therefore do not need a runtime environment
+# of their own.  The global scope is treated as the frame of the
+# outermost function.
+#
+# Each use of an identifier is resolved to a (depth, index) pair where
+# depth is the number of static levels between the use and the
+# declaration and index is the position of the variable in that frame.
+# Just as in the compilers we do not use the symbol table to hold values
+# but to hold (level, index) pairs for the declared names.
+#
+# The node functions are generators yielding their recursive calls, see
+# walker, so that deeply nested programs do not exhaust the Python stack.
+
+from cuppa5_symtab import symtab
+from walker import run
+
+#########################################################################
+# The slots are kept in a table keyed by the identity of the node.
+slots = dict()
+
+def annotate(node, *info):
+    slots[id(node)] = info
+
+def slot(node):
+    if id(node) not in slots:
+        raise ValueError("internal: node {} has no slot".format(node[0]))
+    return slots[id(node)]
+
+#########################################################################
+# The layout of the frames of the functions currently being resolved.
+# Each entry is a list [next free index, frame size].
+frame_layouts = []
+
+def declare_slot(name):
+    level = len(frame_layouts) - 1
+    layout = frame_layouts[-1]
+    index = layout[0]
+    layout[0] += 1
+    layout[1] = max(layout[1], layout[0])
+    symtab.declare(name, (level, index))
+    return index
+
+#########################################################################
+# node functions
+#########################################################################
+def stmtlist(node):
+
+    (STMTLIST, lst) = node
+
+    for stmt in lst:
+        yield walk(stmt)
+
+    return None
+
+#########################################################################
+def nil(node):
+
+    (NIL,) = node
+
+    return None
+
+#########################################################################
+def fundecl_stmt(node):
+
+    (FUNDECL, (ID, name), type, (LIST, fl), body) = node
+
+    # declare the function before resolving the body to allow for recursion
+    index = declare_slot(name)
+
+    # formal arguments occupy the first slots of the new frame
+    frame_layouts.append([1, 1])
+    symtab.push_scope()
+    for (FORMALARG, type, (ID, f)) in fl:
+        declare_slot(f)
+    yield walk(body)
+    symtab.pop_scope()
+    (next_index, frame_size) = frame_layouts.pop()
+
+    annotate(node, index, frame_size)
+
+    return None
+
+#########################################################################
+def vardecl_stmt(node):
+
+    (VARDECL, (ID, name), type, init_val) = node
+
+    yield walk(init_val)
+    annotate(node, declare_slot(name))
+
+    return None
+
+#########################################################################
+def arraydecl_stmt(node):
+
+    (ARRAYDECL, (ID, name), type, (LIST, init_val_list)) = node
+
+    for e in init_val_list:
+        yield walk(e)
+    annotate(node, declare_slot(name))
+
+    return None
+
+#########################################################################
+def assign_stmt(node):
+
+    (ASSIGN, storable, exp) = node
+
+    yield walk(storable)
+    yield walk(exp)
+
+    return None
+
+#########################################################################
+def get_stmt(node):
+
+    (GET, storable) = node
+
+    yield walk(storable)
+
+    return None
+
+#########################################################################
+def put_stmt(node):
+
+    (PUT, exp) = node
+
+    yield walk(exp)
+
+    return None
+
+#########################################################################
+def call_stmt(node):
+
+    (CALLSTMT, name, (LIST, ll)) = node
+
+    yield walk(name)
+    for e in ll:
+        yield walk(e)
+
+    return None
+
+#########################################################################
+def return_stmt(node):
+
+    (RETURN, exp) = node
+
+    yield walk(exp)
+
+    return None
+
+#########################################################################
+def while_stmt(node):
+
+    (WHILE, cond, body) = node
+
+    yield walk(cond)
+    yield walk(body)
+
+    return None
+
+#########################################################################
+def if_stmt(node):
+
+    (IF, cond, then_stmt, else_stmt) = node
+
+    yield walk(cond)
+    yield walk(then_stmt)
+    yield walk(else_stmt)
+
+    return None
+
+#########################################################################
+def block_stmt(node):
+
+    (BLOCK, stmt_list) = node
+
+    # the slots of the block can be reused once the block is done
+    layout = frame_layouts[-1]
+    next_index = layout[0]
+    symtab.push_scope()
+    yield walk(stmt_list)
+    symtab.pop_scope()
+    layout[0] = next_index
+
+    return None
+
+#########################################################################
+def binop_exp(node):
+
+    (OP, c1, c2) = node
+
+    yield walk(c1)
+    yield walk(c2)
+
+    return None
+
+#########################################################################
+def const_exp(node):
+
+    (CONST, type, value) = node
+
+    return None
+
+#########################################################################
+def id_exp(node):
+
+    (ID, name) = node
+
+    (level, index) = symtab.lookup_sym(name)
+    depth = len(frame_layouts) - 1 - level
+    annotate(node, depth, index)
+
+    return None
+
+#########################################################################
+def call_exp(node):
+
+    (CALLEXP, name, (LIST, ll)) = node
+
+    yield walk(name)
+    for e in ll:
+        yield walk(e)
+
+    return None
+
+#########################################################################
+def unary_exp(node):
+
+    (OP, exp) = node
+
+    yield walk(exp)
+
+    return None
+
+#########################################################################
+def array_access_exp(node):
+
+    (ARRAY_ACCESS, array_exp, (IX, ix)) = node
+
+    yield walk(array_exp)
+    yield walk(ix)
+
+    return None
+
+#########################################################################
+# walk
+#########################################################################
+def walk(node):
+    # node format: (TYPE, [child1[, child2[, ...]]])
+    type = node[0]
+
+    if type in dispatch:
+        node_function = dispatch[type]
+        return node_function(node)
+    else:
+        raise ValueError("walk: unknown tree node type: " + type)
+
+# a dictionary to associate tree nodes with node functions
+dispatch = {
+    'STMTLIST'     : stmtlist,
+    'NIL'          : nil,
+    'FUNDECL'      : fundecl_stmt,
+    'VARDECL'      : vardecl_stmt,
+    'ARRAYDECL'    : arraydecl_stmt,
+    'ASSIGN'       : assign_stmt,
+    'GET'          : get_stmt,
+    'PUT'          : put_stmt,
+    'CALLSTMT'     : call_stmt,
+    'RETURN'       : return_stmt,
+    'WHILE'        : while_stmt,
+    'IF'           : if_stmt,
+    'BLOCK'        : block_stmt,
+    'CONST'        : const_exp,
+    'ID'           : id_exp,
+    'CALLEXP'      : call_exp,
+    'PAREN'        : unary_exp,
+    'PLUS'         : binop_exp,
+    'MINUS'        : binop_exp,
+    'MUL'          : binop_exp,
+    'DIV'          : binop_exp,
+    'EQ'           : binop_exp,
+    'LE'           : binop_exp,
+    'UMINUS'       : unary_exp,
+    'NOT'          : unary_exp,
+    'ARRAY_ACCESS' : array_access_exp,
+}
+
+#########################################################################
+def resolve(ast):
+    '''
+    resolve the identifiers of a typechecked program to frame slots and
+    return the size of the global frame
+    '''
+    global frame_layouts
+
+    symtab.initialize()
+    slots.clear()
+    frame_layouts = [[1, 1]]
+    run(walk(ast))
+    (next_index, frame_size) = frame_layouts.pop()
+
+    return frame_size
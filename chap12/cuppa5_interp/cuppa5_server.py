@@ -0,0 +1,57 @@
+# Cuppa5 interpreter server
+#
+# keeps the interpreter loaded and runs the programs sent by cuppa5_client,
+# the output of a program is sent back to the client, e.g.
+#
+#     python3 cuppa5_server.py &
+#     echo 5 | python3 cuppa5_client.py -v -i - bubble.txt
+#     python3 cuppa5_client.py --stop
+#
+# the typechecked programs are cached on disk and the most recently used
+# ones are kept in memory as well.
+
+import io
+import sys
+import threading
+from argparse import ArgumentParser
+from cuppa5_interp import interp, compiler_version
+from parse_cache import ParseCache
+from compile_server import serve, default_socket
+
+# the name of the default socket, shared with cuppa5_client
+server_name = 'cuppa5-interp'
+
+# the interpreter keeps its state in module level variables, e.g. the
+# symbol table, and a program reads and writes the standard streams,
+# therefore requests take turns running their programs
+interp_lock = threading.Lock()
+
+def interpreter(cache):
+    'the compile function of the server, it runs the program'
+    def run(source, options):
+        with interp_lock:
+            (stdin, stdout) = (sys.stdin, sys.stdout)
+            sys.stdin = io.StringIO(options.get('input', ''))
+            sys.stdout = io.StringIO()
+            try:
+                interp(source,
+                       compiled=options.get('c', False),
+                       vm=options.get('v', False),
+                       bytecode=options.get('b', False),
+                       cache=cache)
+                return sys.stdout.getvalue()
+            finally:
+                (sys.stdin, sys.stdout) = (stdin, stdout)
+    return run
+
+if __name__ == "__main__":
+    # parse command line args
+    aparser = ArgumentParser()
+    aparser.add_argument('-s', metavar='socket', default=default_socket(server_name), help='socket to listen on')
+    aparser.add_argument('-m', metavar='entries', type=int, default=256, help='number of cached programs kept in memory')
+
+    args = vars(aparser.parse_args())
+
+    cache = ParseCache(compiler_version(), memory_entries=args['m'])
+
+    serve(args['s'], interpreter(cache))
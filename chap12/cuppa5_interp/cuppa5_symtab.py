@@ -5,7 +5,7 @@
 #
 #########################################################################
 
-CURR_SCOPE = 0
+CURR_SCOPE = -1
 
 class SymTab:
 
@@ -21,27 +21,29 @@ class SymTab:
         return list(self.scoped_symtab)
 
     def set_config(self, c):
-        self.scoped_symtab = c
+        # install a copy so that pushing scopes does not modify
+        # the configuration we were given
+        self.scoped_symtab = list(c)
 
     def push_scope(self, ret_type=None):
-        # push a new dictionary onto the stack - stack grows to the left
+        # push a new dictionary onto the stack - stack grows to the right
         # Note: every block is associated with a return type
         # even if the return type is None.  If no return
         # type is given in the push instruction then we inherit
         # the return type of the outer block.
         if not ret_type:
             ret_type = self.lookup_ret_type()
-        self.scoped_symtab.insert(CURR_SCOPE,({},ret_type))
+        self.scoped_symtab.append(({},ret_type))
 
     def pop_scope(self):
-        # pop the left most dictionary off the stack
+        # pop the right most dictionary off the stack
         if len(self.scoped_symtab) == 1:
             raise ValueError("cannot pop the global scope")
         else:
-            self.scoped_symtab.pop(CURR_SCOPE)
+            self.scoped_symtab.pop()
 
     def declare(self, sym, init):
-        # declare a symbol in the current scope: dict @ position 0
+        # declare a symbol in the current scope: dict @ position -1
 
         # first we need to check whether the symbol was already declared
         # at this scope
@@ -55,12 +57,9 @@ class SymTab:
         # find the first occurence of sym in the symtab stack
         # and return the associated value
 
-        n_scopes = len(self.scoped_symtab)
-
-        for scope in range(n_scopes):
-            if sym in self.scoped_symtab[scope][0]:
-                val = self.scoped_symtab[scope][0].get(sym)
-                return val
+        for (scope, ret_type) in reversed(self.scoped_symtab):
+            if sym in scope:
+                return scope[sym]
 
         # not found
         raise ValueError("{} was not declared".format(sym))
@@ -69,11 +68,9 @@ class SymTab:
         # find the first occurence of sym in the symtab stack
         # and update the associated value
 
-        n_scopes = len(self.scoped_symtab)
-
-        for scope in range(n_scopes):
-            if sym in self.scoped_symtab[scope][0]:
-                self.scoped_symtab[scope][0][sym] = val
+        for (scope, ret_type) in reversed(self.scoped_symtab):
+            if sym in scope:
+                scope[sym] = val
                 return
 
         # not found
@@ -1,8 +1,52 @@
 # A tree walker to typecheck Cuppa5 programs
+#
+# The node functions are generators yielding their recursive calls, see
+# walker, so that deeply nested programs do not exhaust the Python stack.
 
 from cuppa5_symtab import symtab
 from cuppa5_types import promote, safe_assign
+from cuppa5_fe import where
+from walker import run
 
+#########################################################################
+# The typechecker annotates the AST with the static types it computes so
+# that later phases do not have to recompute them at runtime.  The AST
+# consists of immutable tuples, therefore the annotations are kept in a
+# table keyed by the identity of the annotated node.
+annotations = dict()
+
+def annotate(node, *types):
+    annotations[id(node)] = types
+
+def annotation(node):
+    if id(node) not in annotations:
+        raise ValueError("internal: node {} has no type annotation"
+                         .format(node[0]))
+    return annotations[id(node)]
+
+def nodes(ast):
+    'all tuples and lists of the AST in depth first order'
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        yield node
+        for i in range(len(node) - 1, -1, -1):
+            if isinstance(node[i], (tuple, list)):
+                stack.append(node[i])
+
+def save_annotations(ast):
+    'the annotations of the AST keyed by the positions of the nodes in nodes(ast)'
+    return [(ix, annotations[id(node)])
+            for (ix, node) in enumerate(nodes(ast))
+            if id(node) in annotations]
+
+def restore_annotations(ast, saved):
+    'annotate a copy of a typechecked AST with the saved annotations'
+    annotations.clear()
+    saved = dict(saved)
+    for (ix, node) in enumerate(nodes(ast)):
+        if ix in saved:
+            annotations[id(node)] = saved[ix]
 
 #########################################################################
 def declare_formal_args(formal_args):
@@ -25,12 +69,16 @@ def check_call(function_type, actual_arguments):
                             len(actual_args_list)))
 
     # type check association of actuals to formals
+    actual_arg_types = list()
     for (tformal, a) in zip(formal_arg_types,actual_args_list):
-        tactual = walk(a)
+        tactual = yield walk(a)
         if not safe_assign(tformal,tactual):
             raise ValueError(
                 "actual argument type {} is not compatible with formal argument type {}"
                 .format(tactual[0],tformal[0]))
+        actual_arg_types.append(tactual)
+
+    annotate(actual_arguments, formal_arg_types, actual_arg_types)
 
     return ret_type
 
@@ -42,7 +90,7 @@ def stmtlist(node):
     (STMTLIST, lst) = node
 
     for stmt in lst:
-        walk(stmt)
+        yield walk(stmt)
 
     return None
 
@@ -66,7 +114,7 @@ def fundecl_stmt(node):
     # typecheck body of function
     symtab.push_scope(ret_type=ret_type)
     declare_formal_args(arglist)
-    walk(body)
+    yield walk(body)
     symtab.pop_scope()
 
     return None
@@ -76,12 +124,13 @@ def vardecl_stmt(node):
 
     (VARDECL, (ID, name), type, init_val) = node
 
-    ti = walk(init_val)
+    ti = yield walk(init_val)
     if not safe_assign(type, ti):
         raise ValueError(
             "type {} of initializer is not compatible with declaration type {}"
             .format(ti[0],type[0]))
     symtab.declare(name, type)
+    annotate(node, type, ti)
     return None
 
 #########################################################################
@@ -99,7 +148,7 @@ def arraydecl_stmt(node):
 
     # walk through initializers and make sure they are type safe
     for ix in range(size):
-        ti = walk(init_val_list[ix])
+        ti = yield walk(init_val_list[ix])
         if not safe_assign(base_type, ti):
             raise ValueError(
                 "type {} of initializer is not compatible with declaration type {}"
@@ -114,24 +163,28 @@ def assign_stmt(node):
 
     (ASSIGN, storable, exp) = node
 
-    ts = walk(storable)
-    te = walk(exp)
+    ts = yield walk(storable)
+    te = yield walk(exp)
 
     if not safe_assign(ts, te):
         raise ValueError("left type {} is not compatible with right type {}"
                         .format(ts[0],te[0]))
 
+    annotate(node, ts, te)
+
     return None
 
 #########################################################################
 def get_stmt(node):
 
     (GET, storable) = node
-    type = walk(storable)
+    type = yield walk(storable)
 
-    if type == 'ARRAY_TYPE':
+    if type[0] == 'ARRAY_TYPE':
         raise ValueError("arrays not supported in get")
 
+    annotate(node, type)
+
     return None
 
 #########################################################################
@@ -139,7 +192,7 @@ def put_stmt(node):
 
     (PUT, exp) = node
 
-    walk(exp)
+    yield walk(exp)
 
     return None
 
@@ -152,7 +205,7 @@ def call_stmt(node):
     if type[0] != 'FUNCTION_TYPE':
         raise ValueError("{} is not a function".format(name))
 
-    check_call(type, actual_args)
+    yield check_call(type, actual_args)
 
     return None
 
@@ -161,8 +214,9 @@ def return_stmt(node):
 
     (RETURN, exp) = node
 
-    t = walk(exp)
+    t = yield walk(exp)
     ret_type = symtab.lookup_ret_type()
+    annotate(node, ret_type, t)
     if t[0] == 'VOID_TYPE' and ret_type[0] == 'VOID_TYPE':
         return None
     elif not safe_assign(ret_type, t):
@@ -177,11 +231,11 @@ def while_stmt(node):
 
     (WHILE, cond, body) = node
 
-    ctype = walk(cond)
+    ctype = yield walk(cond)
     if ctype[0] != 'INTEGER_TYPE':
         raise ValueError("while condition has to be of type INTEGER_TYPE not {}"
                     .format(ctype[0]))
-    walk(body)
+    yield walk(body)
 
     return None
 
@@ -190,12 +244,12 @@ def if_stmt(node):
 
     (IF, cond, then_stmt, else_stmt) = node
 
-    ctype = walk(cond)
+    ctype = yield walk(cond)
     if ctype[0] != 'INTEGER_TYPE':
         raise ValueError("if condition has to be of type INTEGER_TYPE not {}"
                     .format(ctype[0]))
-    walk(then_stmt)
-    walk(else_stmt)
+    yield walk(then_stmt)
+    yield walk(else_stmt)
 
     return None
 
@@ -205,7 +259,7 @@ def block_stmt(node):
     (BLOCK, stmt_list) = node
 
     symtab.push_scope()
-    walk(stmt_list)
+    yield walk(stmt_list)
     symtab.pop_scope()
     return None
 
@@ -214,19 +268,22 @@ def plus_exp(node):
 
     (PLUS,c1,c2) = node
 
-    t1 = walk(c1)
-    t2 = walk(c2)
+    t1 = yield walk(c1)
+    t2 = yield walk(c2)
+    tr = promote(t1,t2)
+    annotate(node, t1, t2, tr)
 
-    return promote(t1,t2)
+    return tr
 
 #########################################################################
 def minus_exp(node):
 
     (MINUS,c1,c2) = node
 
-    t1 = walk(c1)
-    t2 = walk(c2)
+    t1 = yield walk(c1)
+    t2 = yield walk(c2)
     tr = promote(t1,t2)
+    annotate(node, t1, t2, tr)
     if tr[0] not in ['INTEGER_TYPE','FLOAT_TYPE']:
         raise ValueError("operation on type {} not supported"
                         .format(tr[0]))
@@ -237,9 +294,10 @@ def mul_exp(node):
 
     (MUL,c1,c2) = node
 
-    t1 = walk(c1)
-    t2 = walk(c2)
+    t1 = yield walk(c1)
+    t2 = yield walk(c2)
     tr = promote(t1,t2)
+    annotate(node, t1, t2, tr)
     if tr[0] not in ['INTEGER_TYPE','FLOAT_TYPE']:
         raise ValueError("operation on type {} not supported"
                         .format(tr[0]))
@@ -250,9 +308,10 @@ def div_exp(node):
 
     (DIV,c1,c2) = node
 
-    t1 = walk(c1)
-    t2 = walk(c2)
+    t1 = yield walk(c1)
+    t2 = yield walk(c2)
     tr = promote(t1,t2)
+    annotate(node, t1, t2, tr)
     if tr[0] not in ['INTEGER_TYPE','FLOAT_TYPE']:
         raise ValueError("operation on type {} not supported"
                         .format(tr[0]))
@@ -263,8 +322,10 @@ def eq_exp(node):
 
     (EQ,c1,c2) = node
 
-    walk(c1)
-    walk(c2)
+    t1 = yield walk(c1)
+    t2 = yield walk(c2)
+    # operands are compared at their common type
+    annotate(node, t1, t2, promote(t1,t2))
 
     return ('INTEGER_TYPE',)
 
@@ -273,8 +334,10 @@ def le_exp(node):
 
     (LE,c1,c2) = node
 
-    walk(c1)
-    walk(c2)
+    t1 = yield walk(c1)
+    t2 = yield walk(c2)
+    # operands are compared at their common type
+    annotate(node, t1, t2, promote(t1,t2))
 
     return ('INTEGER_TYPE',)
 
@@ -304,14 +367,14 @@ def call_exp(node):
     if type[0] != 'FUNCTION_TYPE':
         raise ValueError("{} is not a function".format(name))
 
-    return check_call(type, actual_args)
+    return (yield check_call(type, actual_args))
 
 #########################################################################
 def uminus_exp(node):
 
     (UMINUS, exp) = node
 
-    tr = walk(exp)
+    tr = yield walk(exp)
     if tr[0] not in ['INTEGER_TYPE','FLOAT_TYPE']:
         raise ValueError("operation on type {} not supported"
                         .format(tr[0]))
@@ -322,7 +385,7 @@ def not_exp(node):
 
     (NOT, exp) = node
 
-    tr = walk(exp)
+    tr = yield walk(exp)
     if tr[0] not in ['INTEGER_TYPE']:
         raise ValueError("operation on type {} not supported"
                         .format(tr[0]))
@@ -334,15 +397,15 @@ def paren_exp(node):
     (PAREN, exp) = node
 
     # return the value of the parenthesized expression
-    return walk(exp)
+    return (yield walk(exp))
 
 #########################################################################
 def array_access_exp(node):
 
     (ARRAY_ACCESS, array_exp, (IX, ix)) = node
 
-    type = walk(array_exp)
-    ix_type = walk(ix)
+    type = yield walk(array_exp)
+    ix_type = yield walk(ix)
 
     if type[0] != 'ARRAY_TYPE':
         raise ValueError("{} not an array".format(name))
@@ -351,6 +414,7 @@ def array_access_exp(node):
         raise ValueError("array index has to be of type INTEGER_TYPE")
 
     (ARRAY_TYPE, base_type, size) = type
+    annotate(node, type)
 
     return base_type
 
@@ -363,7 +427,15 @@ def walk(node):
 
     if type in dispatch:
         node_function = dispatch[type]
-        return node_function(node)
+        try:
+            return (yield node_function(node))
+        except ValueError as e:
+            # report the position of the innermost node with a known
+            # source position
+            if not hasattr(e, 'position') and where(node):
+                e.position = where(node)
+                e.args = ("{} ({})".format(e, e.position),)
+            raise
     else:
         raise ValueError("walk: unknown tree node type: " + type)
 
@@ -396,3 +468,10 @@ dispatch = {
     'NOT'          : not_exp,
     'ARRAY_ACCESS' : array_access_exp,
 }
+
+#########################################################################
+def typecheck(ast):
+    '''
+    typecheck the program, the walker runs on an explicit stack
+    '''
+    return run(walk(ast))
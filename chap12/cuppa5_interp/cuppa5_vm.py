@@ -0,0 +1,255 @@
+'''
+A register based virtual machine for Cuppa5, see cuppa5_codegen for the
+code generator and the layout of the register files.
+
+Instructions (r: register, L: label):
+
+    move r1 r2           r1 = r2
+    getup r1 d i         r1 = slot i of the frame d static levels up
+    setup d i r1         slot i of the frame d static levels up = r1
+    add|sub|mul r1 r2 r3 r1 = r2 op r3
+    div|idiv r1 r2 r3    r1 = r2 / r3, idiv is integer division
+    eq|le r1 r2 r3       r1 = 1 if r2 op r3 else 0
+    neg r1 r2            r1 = - r2
+    not r1 r2            r1 = 0 if r2 else 1
+    tostr|tofloat r1 r2  r1 = r2 coerced to string/float
+    newarray r1 values   r1 = new array initialized with the tuple values
+    getelem r1 r2 r3     r1 = r2[r3]
+    setelem r1 r2 r3     r1[r2] = r3
+    copyarray r1 r2      copy the elements of array r2 into array r1
+    jump L               jump to L
+    jt|jf r1 L           jump to L if r1 is true/false
+    jeq|jne r1 r2 L      jump to L if r1 == r2 / r1 != r2
+    jle|jgt r1 r2 L      jump to L if r1 <= r2 / r1 > r2
+    closure r1 fun       r1 = function value of fun in the current scope
+    call r1 r2 args      call function r2 with the argument registers args,
+                         the return value is stored in r1, a call without
+                         r1 discards the return value
+    ret r1               return the value in r1 to the caller
+    retv                 return without a value, an error if the caller
+                         expects a value
+    print r1             print the value in r1
+    input r1 type name   read a value of the given type for name into r1
+    halt                 stop the machine
+
+Before execution the program is assembled: mnemonics are replaced by
+integer opcodes, labels by instruction indices, and every instruction is
+padded to the form (opcode, a, b, c) so that the machine loop can decode
+it with a single tuple unpacking.
+'''
+
+#########################################################################
+# opcodes, numbered roughly in order of expected frequency which is
+# also the order in which the machine loop tests them
+
+mnemonics = [
+    'getelem',
+    'add',
+    'move',
+    'jle',
+    'jgt',
+    'setelem',
+    'sub',
+    'mul',
+    'jeq',
+    'jne',
+    'jt',
+    'jf',
+    'jump',
+    'getup',
+    'setup',
+    'idiv',
+    'div',
+    'eq',
+    'le',
+    'call',
+    'ret',
+    'retv',
+    'neg',
+    'not',
+    'tostr',
+    'tofloat',
+    'newarray',
+    'copyarray',
+    'closure',
+    'print',
+    'input',
+    'halt',
+    ]
+
+opcodes = {m : op for (op, m) in enumerate(mnemonics)}
+
+(GETELEM, ADD, MOVE, JLE, JGT, SETELEM, SUB, MUL, JEQ, JNE, JT, JF,
+ JUMP, GETUP, SETUP, IDIV, DIV, EQ, LE, CALL, RET, RETV, NEG, NOT,
+ TOSTR, TOFLOAT, NEWARRAY, COPYARRAY, CLOSURE, PRINT, INPUT,
+ HALT) = range(len(mnemonics))
+
+# instructions whose last operand is a label
+jumps = [JLE, JGT, JEQ, JNE, JT, JF, JUMP]
+
+#########################################################################
+def label_def(instr):
+
+    return instr[0][-1] == ':'
+
+#########################################################################
+def assemble(fun):
+    '''
+    assemble a function value produced by the code generator into the
+    triple (instruction tuple, register template, name)
+    '''
+    (FUNCTION, name, code, template) = fun
+
+    # compute the instruction index of every label
+    label_table = dict()
+    ix = 0
+    for instr in code:
+        if label_def(instr):
+            label_table[instr[0][:-1]] = ix
+        else:
+            ix += 1
+
+    program = list()
+    for instr in code:
+        if label_def(instr):
+            continue
+        op = opcodes[instr[0]]
+        operands = list(instr[1:])
+        if op in jumps:
+            operands[-1] = label_table[operands[-1]]
+        elif op == CLOSURE:
+            operands[-1] = assemble(operands[-1])
+        operands += [None] * (3 - len(operands))
+        program.append((op, *operands))
+
+    return (tuple(program), template, name)
+
+#########################################################################
+def execute(program):
+    '''
+    execute an assembled main program
+    '''
+    (code, template, name) = program
+
+    # the register file of the main program, it has an empty display
+    regs = [()] + template
+    # the stack holds the (code, pc, regs, return register, callee name)
+    # tuple of every active caller
+    stack = []
+    pc = 0
+
+    while True:
+        (op, a, b, c) = code[pc]
+        pc += 1
+
+        if op == GETELEM:
+            ix = regs[c]
+            if ix < 0:
+                raise ValueError("array index {} out of bounds".format(ix))
+            try:
+                regs[a] = regs[b][ix]
+            except IndexError:
+                raise ValueError("array index {} out of bounds".format(ix))
+        elif op == ADD:
+            regs[a] = regs[b] + regs[c]
+        elif op == MOVE:
+            regs[a] = regs[b]
+        elif op == JLE:
+            if regs[a] <= regs[b]:
+                pc = c
+        elif op == JGT:
+            if regs[a] > regs[b]:
+                pc = c
+        elif op == SETELEM:
+            ix = regs[b]
+            if ix < 0:
+                raise ValueError("array index {} out of bounds".format(ix))
+            try:
+                regs[a][ix] = regs[c]
+            except IndexError:
+                raise ValueError("array index {} out of bounds".format(ix))
+        elif op == SUB:
+            regs[a] = regs[b] - regs[c]
+        elif op == MUL:
+            regs[a] = regs[b] * regs[c]
+        elif op == JEQ:
+            if regs[a] == regs[b]:
+                pc = c
+        elif op == JNE:
+            if regs[a] != regs[b]:
+                pc = c
+        elif op == JT:
+            if regs[a]:
+                pc = b
+        elif op == JF:
+            if not regs[a]:
+                pc = b
+        elif op == JUMP:
+            pc = a
+        elif op == GETUP:
+            regs[a] = regs[0][-b][c]
+        elif op == SETUP:
+            regs[0][-a][b] = regs[c]
+        elif op == IDIV:
+            regs[a] = regs[b] // regs[c]
+        elif op == DIV:
+            regs[a] = regs[b] / regs[c]
+        elif op == EQ:
+            regs[a] = 1 if regs[b] == regs[c] else 0
+        elif op == LE:
+            regs[a] = 1 if regs[b] <= regs[c] else 0
+        elif op == CALL:
+            (fcode, ftemplate, display, fname) = regs[b]
+            new_regs = [display]
+            for r in c:
+                new_regs.append(regs[r])
+            new_regs += ftemplate
+            stack.append((code, pc, regs, a, fname))
+            (code, pc, regs) = (fcode, 0, new_regs)
+        elif op == RET:
+            value = regs[a]
+            (code, pc, regs, dst, fname) = stack.pop()
+            if dst is not None:
+                regs[dst] = value
+        elif op == RETV:
+            (code, pc, regs, dst, fname) = stack.pop()
+            if dst is not None:
+                # the typechecker only allows calls of functions with a
+                # return value in expressions, this one ran off its end
+                raise ValueError("No return value from function {}".format(fname))
+        elif op == NEG:
+            regs[a] = - regs[b]
+        elif op == NOT:
+            regs[a] = 0 if regs[b] else 1
+        elif op == TOSTR:
+            regs[a] = str(regs[b])
+        elif op == TOFLOAT:
+            regs[a] = float(regs[b])
+        elif op == NEWARRAY:
+            regs[a] = list(b)
+        elif op == COPYARRAY:
+            regs[a][:] = regs[b]
+        elif op == CLOSURE:
+            (fcode, ftemplate, fname) = b
+            regs[a] = (fcode, ftemplate, regs[0] + (regs,), fname)
+        elif op == PRINT:
+            print(regs[a])
+        elif op == INPUT:
+            s = input("Value for " + c + '? ')
+            try:
+                if b == 'STRING_TYPE':
+                    regs[a] = s
+                elif b == 'FLOAT_TYPE':
+                    regs[a] = float(s)
+                elif b == 'INTEGER_TYPE':
+                    regs[a] = int(s)
+                else:
+                    raise ValueError("input not supported for this type")
+            except ValueError:
+                raise ValueError("expected a {} value for {}".format(b, c))
+        elif op == HALT:
+            break
+        else:
+            raise ValueError("unknown opcode {}".format(op))
+
+    return None
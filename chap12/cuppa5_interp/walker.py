@@ -0,0 +1,63 @@
+'''
+An explicit stack driver for our tree walkers
+
+Python limits the depth of recursion, a tree walker calling walk on the
+children of a node therefore fails on deeply nested programs, e.g. machine
+generated expressions or long else if chains.  With this driver the node
+functions of a walker are generators which yield their recursive calls
+instead of making them,
+
+    def plus_exp(node):
+        (PLUS, c1, c2) = node
+        t1 = yield walk(c1)
+        t2 = yield walk(c2)
+        return promote(t1, t2)
+
+where walk looks up the node function of the child and returns the
+generator created by calling it.  The driver keeps the generators of all
+active calls on a stack of its own and sends every generator the result of
+the call it yielded.  An exception raised by a call is thrown into the
+generator that yielded it, just like an exception raised by a recursive
+call, therefore try statements in node functions work as before.  Node
+functions that do not recurse can stay ordinary functions, yielding their
+result simply returns it.
+'''
+
+from types import GeneratorType
+
+def run(call):
+    'run a call of a generator based walker to completion and return its result'
+    if type(call) is not GeneratorType:
+        return call
+
+    stack = [call]
+    value = None
+    error = None
+
+    while True:
+        try:
+            if error is None:
+                result = stack[-1].send(value)
+            else:
+                result = stack[-1].throw(error)
+        except StopIteration as stop:
+            # the call returned, resume its caller with the result
+            stack.pop()
+            (value, error) = (stop.value, None)
+            if not stack:
+                return value
+            continue
+        except Exception as e:
+            # the call raised an exception, throw it into its caller
+            stack.pop()
+            (value, error) = (None, e)
+            if not stack:
+                raise
+            continue
+
+        # the generator on top of the stack yielded a call
+        if type(result) is GeneratorType:
+            stack.append(result)
+            (value, error) = (None, None)
+        else:
+            (value, error) = (result, None)
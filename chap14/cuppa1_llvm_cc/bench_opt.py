@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# Benchmark for the optimization levels of the Cuppa1 LLVM backend
+#
+# Compiles while loops in the style of while.txt and nested.txt at the
+# optimization levels 0-3, runs the native code in-process and reports
+# the compile and run times for every level.  Every program puts a single
+# value, the values have to agree across the levels.
+#
+# usage: python bench_opt.py [number of iterations]
+
+import ctypes
+from time import perf_counter
+from cuppa1_fe import parse
+from cuppa1_jit import compile_main, libc
+
+# a count down loop as in while.txt, performs n iterations
+count_down = '''
+x = %d
+s = 0
+while (x) {
+    s = s + x
+    x = x - 1
+}
+put s
+'''
+
+# nested loops as in nested.txt, performs n iterations of the inner loop,
+# the division keeps LLVM from computing the sum in closed form
+nested = '''
+m = %d
+x = 1
+s = 0
+while (x =< m) {
+    y = 1
+    while (y =< m) {
+        s = s + (10*x+y) / (y+1)
+        y = y + 1
+    }
+    x = x + 1
+}
+put s
+'''
+
+def bench(name, ast, n):
+    print("{} ({} iterations)".format(name, n))
+    for opt in range(4):
+        start = perf_counter()
+        main = ctypes.CFUNCTYPE(None)(compile_main(ast, opt))
+        compiled = perf_counter()
+        main()
+        libc.fflush(None)
+        elapsed = perf_counter()
+        print("  -O{} compile {:8.2f}ms run {:8.2f}ms {:6.2f}ns/iteration"
+              .format(opt, 1e3 * (compiled - start), 1e3 * (elapsed - compiled),
+                      1e9 * (elapsed - compiled) / n), flush=True)
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000000
+    bench('count down', parse(count_down % n), n)
+    m = int(n ** 0.5)
+    bench('nested', parse(nested % m), m * m)
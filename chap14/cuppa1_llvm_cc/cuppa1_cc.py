@@ -4,19 +4,34 @@ import sys
 from argparse import ArgumentParser
 from cuppa1_fe import parse
 from cuppa1_llvm_codegen import codegen
+from cuppa1_jit import run
 from dumpast import dumpast
+from parse_cache import ParseCache, version
 
 def cc(input_stream,
        ast_switch=False,
        ir_switch=False,
-       exception_switch=False):
+       exception_switch=False,
+       cache=None,
+       ctx=None,
+       run_switch=False,
+       opt=0):
 
     try:
-        ast = parse(input_stream)
+        # with a cache the AST of a source seen before is not parsed again
+        ast = cache.get(input_stream) if cache else None
+        if ast is None:
+            ast = parse(input_stream)
+            if cache:
+                cache.put(input_stream, ast)
         if ast_switch:
             dumpast(ast)
             sys.exit()
-        code = codegen(ast, ir_switch)
+        if run_switch:
+            # compile to native code in memory and run the program
+            run(ast, opt)
+            return None
+        code = codegen(ast, ir_switch, ctx, opt)
         return code
     except Exception as e:
         if exception_switch:
@@ -33,6 +48,9 @@ if __name__ == "__main__":
     aparser.add_argument('-e', help='full exception dump', action="store_true")
     aparser.add_argument('-ir', help='generate llvm ir code', action="store_true")
     aparser.add_argument('-o', metavar='output_file', help='llvm output file')
+    aparser.add_argument('-run', help='run the program in-process', action="store_true")
+    aparser.add_argument('-O', metavar='level', type=int, choices=range(4), default=0, help='optimization level 0-3')
+    aparser.add_argument('-cache', help='cache the parsed program', action="store_true")
 
     args = vars(aparser.parse_args())
 
@@ -55,13 +73,25 @@ if __name__ == "__main__":
     input_stream = f.read()
     f.close()
 
+    if args['cache']:
+        import cuppa1_lexer, cuppa1_fe
+        cache = ParseCache(version(cuppa1_lexer, cuppa1_fe))
+    else:
+        cache = None
+
     # run the compiler
     code = cc(input_stream,
               ast_switch,
               ir_switch,
-              exception_switch)
+              exception_switch,
+              cache,
+              run_switch=args['run'],
+              opt=args['O'])
 
-    if args['o']:
+    if args['run']:
+        # the program has run already
+        pass
+    elif args['o']:
         f = open(args['o'], 'w')
         f.write(code)
         f.close()
@@ -0,0 +1,76 @@
+'''
+jit
+
+runs Cuppa1 programs in-process: the IR module of a program is handed to
+an MCJIT execution engine which compiles it to native code in memory, the
+main function is then called directly through ctypes.  There is no
+assembler and no linker involved, printf and scanf are resolved against
+the C library already loaded into the Python process.
+
+The compiled programs are cached keyed by a hash of their AST and the
+optimization level, running a program again, e.g. in a long running
+process, jumps straight into the machine code compiled the first time.
+'''
+
+import sys
+import ctypes
+import hashlib
+import marshal
+from collections import OrderedDict
+from llvmlite import binding
+from cuppa1_llvm_codegen import make_ir, make_module, target_machine, llvm_lock
+
+# the number of compiled programs kept, every one holds on to its
+# execution engine and thereby to its machine code
+MAX_ENGINES = 64
+
+# (ast hash, optimization level) -> (execution engine, address of main)
+engines = OrderedDict()
+
+# the C library, the programs write through its stdout buffer
+libc = ctypes.CDLL(None)
+
+#########################################################################
+def ast_hash(ast):
+    return hashlib.sha256(marshal.dumps(ast)).hexdigest()
+
+#########################################################################
+def compile_main(ast, opt=0):
+    '''
+    return the address of the main function of the program, compiling it
+    unless it is in the cache already
+    '''
+    key = (ast_hash(ast), opt)
+    tm = target_machine()
+
+    with llvm_lock:
+        if key in engines:
+            engines.move_to_end(key)
+            return engines[key][1]
+
+    # generating the IR does not touch the LLVM binding
+    ir_module = make_ir(ast)
+
+    with llvm_lock:
+        mod_ref = make_module(ir_module, opt, tm)
+        engine = binding.create_mcjit_compiler(mod_ref, tm)
+        engine.finalize_object()
+        main_addr = engine.get_function_address("main")
+        engines[key] = (engine, main_addr)
+        while len(engines) > MAX_ENGINES:
+            engines.popitem(last=False)
+
+    return main_addr
+
+#########################################################################
+def run(ast, opt=0):
+    '''
+    compile the program to native code and run it
+    '''
+    main = ctypes.CFUNCTYPE(None)(compile_main(ast, opt))
+
+    # Python and the C library buffer their output separately, flush both
+    # so that the output appears in order
+    sys.stdout.flush()
+    main()
+    libc.fflush(None)
@@ -9,6 +9,7 @@ on the LLVM backend
 # llvm stuff
 #########################################################################
 
+import threading
 from llvmlite import ir
 from llvmlite import binding
 
@@ -18,21 +19,28 @@ target_triple = binding.get_default_triple()
 # with the desired target triple, e.g.
 #   target_triple = "x86_64-unknown-linux-gnu"
 
-# IR entities needed throughout the code generator
-# these are initialized in make_ir
-main = None
-module = None
-builder = None
-printf = None
-scanf = None
-print_fmt = None
-scan_fmt = None
-prompt_fmt = None
-
-# variable address hash - we have to keep track
-# of the variable-address pairs we have generated in the IR
-# in order to avoid creating multiple instances of the same global vars.
-addresses = dict()
+# IR entities needed throughout the code generator are kept in a
+# CompilerContext which is passed along to all node functions, every
+# compilation has a context of its own and compilations can therefore
+# run concurrently.  The IR entities are initialized in make_ir.
+class CompilerContext:
+
+    def __init__(self):
+        self.main = None
+        self.module = None
+        self.builder = None
+        self.printf = None
+        self.scanf = None
+        self.print_fmt = None
+        self.scan_fmt = None
+        self.prompt_fmt = None
+
+        self.entry = None
+
+        # variable address hash - we have to keep track
+        # of the variable-address pairs we have generated in the IR
+        # in order to avoid creating multiple instances of the same vars.
+        self.addresses = dict()
 
 # define types that we will commonly use
 i64 = ir.IntType(64);
@@ -43,139 +51,144 @@ io_fun = ir.FunctionType(i64, [voidptr], var_arg=True)
 i64_const0 = ir.Constant(i64, 0)
 i64_const1 = ir.Constant(i64, 1)
 
+#########################################################################
+# variables
+#########################################################################
+def address(id, ctx):
+    '''
+    the address of the variable id, every variable is a stack slot of main
+    allocated in the entry block where the mem2reg pass finds it and
+    promotes it to a register
+    '''
+    try:
+        return ctx.addresses[id]
+    except KeyError:
+        # compute an address for id, variables start out as zero
+        entry_builder = ir.IRBuilder(ctx.entry)
+        id_addr = entry_builder.alloca(i64, name=id)
+        entry_builder.store(i64_const0, id_addr)
+        ctx.addresses[id] = id_addr
+        return id_addr
+
 #########################################################################
 # node functions
 #########################################################################
-def stmtlst(node):
+def stmtlst(node, ctx):
 
     (STMTLIST, lst) = node
 
     for stmt in lst:
-        walk(stmt)
+        walk(stmt, ctx)
 
 #########################################################################
-def nil(node):
+def nil(node, ctx):
 
     (NIL,) = node
 
 #########################################################################
-def assign_stmt(node):
+def assign_stmt(node, ctx):
 
     (ASSIGN, (ID, id), exp) = node
 
-    exp_val = walk(exp)
+    exp_val = walk(exp, ctx)
 
-    try:
-        id_addr = addresses[id]
-    except KeyError:
-        # compute an address for id
-        id_addr = ir.GlobalVariable(module, i64, name=id)
-        id_addr.global_constant = False
-        id_addr.initializer = i64_const0
-        addresses[id] = id_addr
+    id_addr = address(id, ctx)
 
-    builder.store(exp_val, id_addr)
+    ctx.builder.store(exp_val, id_addr)
 
 #########################################################################
-def get_stmt(node):
+def get_stmt(node, ctx):
 
     (GET, (ID, id)) = node
 
-    try:
-        id_addr = addresses[id]
-    except KeyError:
-        # compute an address for id
-        id_addr = ir.GlobalVariable(module, i64, name=id)
-        id_addr.global_constant = False
-        id_addr.initializer = i64_const0
-        addresses[id] = id_addr
+    id_addr = address(id, ctx)
 
-    builder.call(printf, [prompt_fmt])
-    builder.call(scanf, [scan_fmt, id_addr])
+    ctx.builder.call(ctx.printf, [ctx.prompt_fmt])
+    ctx.builder.call(ctx.scanf, [ctx.scan_fmt, id_addr])
 
 #########################################################################
-def put_stmt(node):
+def put_stmt(node, ctx):
 
     (PUT, exp) = node
 
-    exp_val = walk(exp)
-    builder.call(printf, [print_fmt, exp_val])
+    exp_val = walk(exp, ctx)
+    ctx.builder.call(ctx.printf, [ctx.print_fmt, exp_val])
 
 #########################################################################
-def while_stmt(node):
+def while_stmt(node, ctx):
     # the code here was inspired by the Python implementation of
     # the Kaleidoscope compiler:
     #      https://github.com/symhom/Kaleidoscope_Compiler
 
     (WHILE, cond, body) = node
 
-    w_body_block = builder.append_basic_block("w_body")
-    w_after_block = builder.append_basic_block("w_after")
+    w_body_block = ctx.builder.append_basic_block("w_body")
+    w_after_block = ctx.builder.append_basic_block("w_after")
 
     # head
-    cond_val = walk(cond)
-    cmp_val = builder.icmp_signed('!=', cond_val, i64_const0)
-    builder.cbranch(cmp_val, w_body_block, w_after_block)
+    cond_val = walk(cond, ctx)
+    cmp_val = ctx.builder.icmp_signed('!=', cond_val, i64_const0)
+    ctx.builder.cbranch(cmp_val, w_body_block, w_after_block)
 
     # body
-    builder.position_at_start(w_body_block)
-    walk(body)
-    cond_val = walk(cond)
-    cmp_val = builder.icmp_signed('!=', cond_val, i64_const0)
-    builder.cbranch(cmp_val, w_body_block, w_after_block)
+    ctx.builder.position_at_start(w_body_block)
+    walk(body, ctx)
+    cond_val = walk(cond, ctx)
+    cmp_val = ctx.builder.icmp_signed('!=', cond_val, i64_const0)
+    ctx.builder.cbranch(cmp_val, w_body_block, w_after_block)
 
     # after
-    builder.position_at_start(w_after_block)
+    ctx.builder.position_at_start(w_after_block)
 
 #########################################################################
-def if_stmt(node):
+def if_stmt(node, ctx):
 
     (IF, cond, then_stmt, else_stmt) = node
 
-    cond_val = walk(cond)
-    cmp_val = builder.icmp_signed('!=', cond_val, i64_const0)
+    cond_val = walk(cond, ctx)
+    cmp_val = ctx.builder.icmp_signed('!=', cond_val, i64_const0)
 
     if else_stmt[0] == 'NIL':
-        with builder.if_then(cmp_val):
-            walk(then_stmt)
+        with ctx.builder.if_then(cmp_val):
+            walk(then_stmt, ctx)
     else:
-        with builder.if_else(cmp_val) as (then, otherwise):
+        with ctx.builder.if_else(cmp_val) as (then, otherwise):
             with then:
-                walk(then_stmt)
+                walk(then_stmt, ctx)
             with otherwise:
-                walk(else_stmt)
+                walk(else_stmt, ctx)
 
 #########################################################################
-def block_stmt(node):
+def block_stmt(node, ctx):
 
     (BLOCK, s) = node
-    walk(s)
+    walk(s, ctx)
 
 #########################################################################
-def binop_exp(node):
+def binop_exp(node, ctx):
 
     (OP, lc, rc) = node
 
-    l_val = walk(lc)
-    r_val = walk(rc)
+    l_val = walk(lc, ctx)
+    r_val = walk(rc, ctx)
 
     if OP == 'PLUS':
-        return builder.add(l_val, r_val)
+        return ctx.builder.add(l_val, r_val)
     elif OP == 'MINUS':
-        return builder.sub(l_val, r_val)
+        return ctx.builder.sub(l_val, r_val)
     elif OP == 'MUL':
-        return builder.mul(l_val, r_val)
+        return ctx.builder.mul(l_val, r_val)
     elif OP == 'DIV':
-        return builder.sdiv(l_val, r_val)
+        return ctx.builder.sdiv(l_val, r_val)
     elif OP == 'EQ':
-        return builder.icmp_signed('==', l_val, r_val)
+        return ctx.builder.icmp_signed('==', l_val, r_val)
     elif OP == 'LE':
-        return builder.icmp_signed('<=', l_val, r_val)
+        return ctx.builder.icmp_signed('<=', l_val, r_val)
     else:
         raise ValueError('internal error')
 
 #########################################################################
-def integer_exp(node):
+def integer_exp(node, ctx):
 
     (INTEGER, value) = node
 
@@ -183,58 +196,51 @@ def integer_exp(node):
     return const_val
 
 #########################################################################
-def id_exp(node):
+def id_exp(node, ctx):
 
     (ID, id) = node
 
-    try:
-        id_addr = addresses[id]
-    except KeyError:
-        # compute an address for id
-        id_addr = ir.GlobalVariable(module, i64, name=id)
-        id_addr.global_constant = False
-        id_addr.initializer = i64_const0
-        addresses[id] = id_addr
+    id_addr = address(id, ctx)
 
-    id_val = builder.load(id_addr)
+    id_val = ctx.builder.load(id_addr)
 
     return id_val
 
 #########################################################################
-def uminus_exp(node):
+def uminus_exp(node, ctx):
 
     (UMINUS, e) = node
 
-    e_val = walk(e)
-    return builder.neg(e_val)
+    e_val = walk(e, ctx)
+    return ctx.builder.neg(e_val)
 
 #########################################################################
-def not_exp(node):
+def not_exp(node, ctx):
 
     (NOT, e) = node
 
-    e_val = walk(e)
+    e_val = walk(e, ctx)
 
-    return builder.not_(e_val)
+    return ctx.builder.not_(e_val)
 
 #########################################################################
-def paren_exp(node):
+def paren_exp(node, ctx):
 
     (PAREN, exp) = node
 
-    exp_val = walk(exp)
+    exp_val = walk(exp, ctx)
 
     return exp_val
 
 #########################################################################
 # walk
 #########################################################################
-def walk(node):
+def walk(node, ctx):
     node_type = node[0]
 
     if node_type in dispatch:
         node_function = dispatch[node_type]
-        return node_function(node)
+        return node_function(node, ctx)
     else:
         raise ValueError("walk: unknown tree node type: " + node_type)
 
@@ -265,11 +271,11 @@ dispatch = {
 # make a global string variable - declares a global string var in
 # current IR context
 
-def make_str_var(name, init):
+def make_str_var(name, init, ctx):
     initializer = init+"\0" # zero terminated!
     constant_val = ir.Constant(ir.ArrayType(ir.IntType(8), len(initializer)),
                         bytearray(initializer.encode("utf8")))
-    global_str = ir.GlobalVariable(module, constant_val.type, name=name)
+    global_str = ir.GlobalVariable(ctx.module, constant_val.type, name=name)
     global_str.global_constant = True
     global_str.initializer = constant_val
     return global_str
@@ -277,76 +283,147 @@ def make_str_var(name, init):
 #########################################################################
 # make_ir
 
-def make_ir(ast):
-    global main
-    global module
-    global builder
-    global printf
-    global scanf
-    global print_fmt
-    global scan_fmt
-    global prompt_fmt
+def make_ir(ast, ctx=None):
+
+    # without a context of its own the compilation gets a fresh one
+    if ctx is None:
+        ctx = CompilerContext()
 
     # define the module and the target machine for our code
-    module = ir.Module(name="main")
-    module.triple = target_triple
+    ctx.module = ir.Module(name="main")
+    ctx.module.triple = target_triple
 
     # we have to embed our code in a main function
     # in order to use the C runtime system
     main_type = ir.FunctionType(ir.VoidType(), [])
-    main = ir.Function(module, main_type, name="main")
+    ctx.main = ir.Function(ctx.module, main_type, name="main")
 
     # I/O RTS functions
-    printf = ir.Function(module, io_fun, name="printf")
-    scanf = ir.Function(module, io_fun, name="scanf")
+    ctx.printf = ir.Function(ctx.module, io_fun, name="printf")
+    ctx.scanf = ir.Function(ctx.module, io_fun, name="scanf")
 
-    # all our Cuppa1 code will start in this block
-    block = main.append_basic_block(name="entry")
-    builder = ir.IRBuilder(block)
+    # the entry block holds the stack slots of the variables only,
+    # all our Cuppa1 code will start in the block after it
+    ctx.entry = ctx.main.append_basic_block(name="entry")
+    block = ctx.main.append_basic_block(name="start")
+    ctx.builder = ir.IRBuilder(block)
 
     # string variable to hold the format string for printf
-    print_fmt_string = make_str_var("pfmtstr", "%d\n")
-    print_fmt = builder.bitcast(print_fmt_string, voidptr)
+    print_fmt_string = make_str_var("pfmtstr", "%d\n", ctx)
+    ctx.print_fmt = ctx.builder.bitcast(print_fmt_string, voidptr)
 
     # string variable to hold the format string for scanf
-    scan_fmt_string = make_str_var("sfmtstr", "%lld")
-    scan_fmt = builder.bitcast(scan_fmt_string, voidptr)
+    scan_fmt_string = make_str_var("sfmtstr", "%lld", ctx)
+    ctx.scan_fmt = ctx.builder.bitcast(scan_fmt_string, voidptr)
 
     # string variable to hold the format string for prompt
-    prompt_fmt_string = make_str_var("qfmtstr", "? ")
-    prompt_fmt = builder.bitcast(prompt_fmt_string, voidptr)
+    prompt_fmt_string = make_str_var("qfmtstr", "? ", ctx)
+    ctx.prompt_fmt = ctx.builder.bitcast(prompt_fmt_string, voidptr)
 
     # generate code for the program
-    walk(ast)
+    walk(ast, ctx)
 
     # We have to emit some sort of block terminator
-    builder.ret_void()
+    ctx.builder.ret_void()
+    ir.IRBuilder(ctx.entry).branch(block)
 
     # return the IR module as a string
-    return str(module)
+    return str(ctx.module)
 
 #########################################################################
 # make_asm
 
-def make_asm(ir_module):
+# LLVM is initialized and the target machine is created only once, by the
+# first compilation, all later compilations reuse the target machine.  The
+# LLVM binding is not thread safe, compilations take turns holding the lock.
+_target_machine = None
+llvm_lock = threading.Lock()
+
+def target_machine():
+
+    global _target_machine
 
     # Note: llvmlite does not allow us to do cross-compilation
     # only native compilation is supported.
     # therefore, only use default triple for native code generation
 
-    binding.initialize()
-    binding.initialize_native_target()
-    binding.initialize_native_asmprinter()
-    target = binding.Target.from_triple(binding.get_default_triple())
-    target_machine = target.create_target_machine()
-    target_machine.set_asm_verbosity(True)
+    with llvm_lock:
+        if _target_machine is None:
+            binding.initialize()
+            binding.initialize_native_target()
+            binding.initialize_native_asmprinter()
+            target = binding.Target.from_triple(binding.get_default_triple())
+            _target_machine = target.create_target_machine()
+            _target_machine.set_asm_verbosity(True)
+
+    return _target_machine
+
+#########################################################################
+# optimize
+
+# the passes run at the optimization levels, every level runs the passes
+# of the levels below it as well
+opt_passes = {
+    # promote the variables to registers (SROA includes mem2reg) and
+    # clean up the code
+    1 : ['sroa',
+         'instruction_combining',
+         'cfg_simplification',
+         'dead_code_elimination'],
+    # common subexpressions and loop invariant code
+    2 : ['reassociate_expressions',
+         'gvn',
+         'sccp',
+         'loop_simplification',
+         'loop_rotate',
+         'licm',
+         'instruction_combining',
+         'dead_store_elimination',
+         'cfg_simplification'],
+    # unroll the loops and clean up after it
+    3 : ['loop_unroll',
+         'instruction_combining',
+         'gvn',
+         'aggressive_dead_code_elimination',
+         'cfg_simplification'],
+}
 
+def optimize(mod_ref, opt, tm):
+    '''
+    run the optimization passes of level opt (0-3) over the module,
+    has to be called holding llvm_lock
+    '''
+    if opt == 0:
+        return
+    if opt not in opt_passes:
+        raise ValueError("unknown optimization level: {}".format(opt))
+    pm = binding.create_module_pass_manager()
+    tm.add_analysis_passes(pm)
+    for level in range(1, opt + 1):
+        for p in opt_passes[level]:
+            getattr(pm, 'add_' + p + '_pass')()
+    pm.run(mod_ref)
+
+def make_module(ir_module, opt, tm):
+    '''
+    parse, verify and optimize the IR module, has to be called
+    holding llvm_lock
+    '''
     # necessary in order to generate code from ir module
     mod_ref = binding.parse_assembly(ir_module)
     mod_ref.verify()
+    optimize(mod_ref, opt, tm)
+    return mod_ref
+
+def make_asm(ir_module, opt=0):
+
+    tm = target_machine()
+
+    with llvm_lock:
+        mod_ref = make_module(ir_module, opt, tm)
 
-    # generate the native assembly code
-    asm_code = target_machine.emit_assembly(mod_ref)
+        # generate the native assembly code
+        asm_code = tm.emit_assembly(mod_ref)
 
     # return asm code as a string
     return asm_code
@@ -354,13 +431,17 @@ def make_asm(ir_module):
 #########################################################################
 # codegen
 
-def codegen(ast, ir_flag=False):
+def codegen(ast, ir_flag=False, ctx=None, opt=0):
 
-    ir_module = make_ir(ast)
+    ir_module = make_ir(ast, ctx)
     if ir_flag:
-        return ir_module
+        if opt == 0:
+            return ir_module
+        tm = target_machine()
+        with llvm_lock:
+            return str(make_module(ir_module, opt, tm))
     else:
         if binding.get_default_triple() != target_triple:
             raise ValueError('cross-compilation not supported in code generator')
-        asm = make_asm(ir_module)
+        asm = make_asm(ir_module, opt)
         return asm
@@ -0,0 +1,48 @@
+# Cuppa1 compile server with LLVM backend
+#
+# keeps the compiler and the LLVM target machine loaded and compiles the
+# programs sent by cuppa1_client into native assembly code or LLVM IR, e.g.
+#
+#     python3 cuppa1_server.py &
+#     python3 cuppa1_client.py fact.txt
+#     python3 cuppa1_client.py --stop
+#
+# the parsed programs are cached on disk and the most recently used ones
+# are kept in memory as well.
+
+from argparse import ArgumentParser
+from cuppa1_cc import cc
+from cuppa1_llvm_codegen import CompilerContext, target_machine
+from parse_cache import ParseCache, version
+from compile_server import serve, default_socket
+
+# the name of the default socket, shared with cuppa1_client
+server_name = 'cuppa1-llvm'
+
+def compiler(cache):
+    'the compile function of the server'
+    def compile(source, options):
+        return cc(source,
+                  ir_switch=options.get('ir', False),
+                  exception_switch=True,
+                  cache=cache,
+                  ctx=CompilerContext(),
+                  opt=options.get('opt', 0))
+    return compile
+
+if __name__ == "__main__":
+    # parse command line args
+    aparser = ArgumentParser()
+    aparser.add_argument('-s', metavar='socket', default=default_socket(server_name), help='socket to listen on')
+    aparser.add_argument('-m', metavar='entries', type=int, default=256, help='number of cached programs kept in memory')
+
+    args = vars(aparser.parse_args())
+
+    import cuppa1_lexer, cuppa1_fe
+    cache = ParseCache(version(cuppa1_lexer, cuppa1_fe),
+                       memory_entries=args['m'])
+
+    # initialize LLVM before the first request arrives
+    target_machine()
+
+    serve(args['s'], compiler(cache))
@@ -0,0 +1,73 @@
+# Cuppa3 compiler driver with LLVM backend
+
+import sys
+from argparse import ArgumentParser
+from cuppa3_fe import parse
+from cuppa3_llvm_codegen import codegen
+from dumpast import dumpast
+
+def cc(input_stream,
+       ast_switch=False,
+       ir_switch=False,
+       exception_switch=False,
+       ctx=None,
+       opt=0):
+
+    try:
+        ast = parse(input_stream)
+        if ast_switch:
+            dumpast(ast)
+            sys.exit()
+        code = codegen(ast, ir_switch, ctx, opt)
+        return code
+    except Exception as e:
+        if exception_switch:
+            raise e
+        else:
+            print('error: ' + str(e))
+            sys.exit()
+
+if __name__ == "__main__":
+    # parse command line args
+    aparser = ArgumentParser()
+    aparser.add_argument('input', metavar='input_file', help='cuppa3 input file')
+    aparser.add_argument('-ast', help='dump ast', action="store_true")
+    aparser.add_argument('-e', help='full exception dump', action="store_true")
+    aparser.add_argument('-ir', help='generate llvm ir code', action="store_true")
+    aparser.add_argument('-o', metavar='output_file', help='llvm output file')
+    aparser.add_argument('-O', metavar='level', type=int, choices=range(4), default=0, help='optimization level 0-3')
+
+    args = vars(aparser.parse_args())
+
+    if args['ast']:
+        ast_switch = True
+    else:
+        ast_switch = False
+
+    if args['e']:
+        exception_switch = True
+    else:
+        exception_switch = False
+
+    if args['ir']:
+        ir_switch = True
+    else:
+        ir_switch = False
+
+    f = open(args['input'], 'r')
+    input_stream = f.read()
+    f.close()
+
+    # run the compiler
+    code = cc(input_stream,
+              ast_switch,
+              ir_switch,
+              exception_switch,
+              opt=args['O'])
+
+    if args['o']:
+        f = open(args['o'], 'w')
+        f.write(code)
+        f.close()
+    else:
+        print(code)
@@ -0,0 +1,578 @@
+'''
+codegen
+
+this is the static code generator for our Cuppa3 compiler based
+on the LLVM backend.
+
+Cuppa3 functions become LLVM functions taking their arguments as i64
+values and returning an i64 value, calls are LLVM calls.  The top level
+statements of a program make up the main function.  Variables declared
+at the top level are global variables since functions can see them,
+arguments and variables declared in functions are stack slots of the
+function which the optimizer promotes to registers.
+'''
+
+#########################################################################
+# llvm stuff
+#########################################################################
+
+import threading
+from llvmlite import ir
+from llvmlite import binding
+from cuppa3_symtab import SymTab
+
+# set the following to the target machine
+target_triple = binding.get_default_triple()
+# For cross-compilation replace the default target triple above
+# with the desired target triple, e.g.
+#   target_triple = "x86_64-unknown-linux-gnu"
+
+# IR entities needed throughout the code generator are kept in a
+# CompilerContext which is passed along to all node functions, every
+# compilation has a context of its own and compilations can therefore
+# run concurrently.  The IR entities are initialized in make_ir.
+class CompilerContext:
+
+    def __init__(self):
+        self.module = None
+        self.printf = None
+        self.scanf = None
+        self.print_fmt = None
+        self.scan_fmt = None
+        self.prompt_fmt = None
+
+        # the function we generate code for, main or a Cuppa3 function,
+        # its entry block holding the stack slots and the builder
+        # positioned in its code
+        self.function = None
+        self.entry = None
+        self.builder = None
+        self.in_function = False
+
+        # the symbol table maps variable names to ('INTEGER', address)
+        # and function names to ('FUNVAL', function)
+        self.symtab = SymTab()
+
+# define types that we will commonly use
+i64 = ir.IntType(64);
+voidptr = ir.IntType(64).as_pointer()
+io_fun = ir.FunctionType(i64, [voidptr], var_arg=True)
+
+# often used constants
+i64_const0 = ir.Constant(i64, 0)
+i64_const1 = ir.Constant(i64, 1)
+
+#########################################################################
+# variables and functions
+#########################################################################
+def declare_var(name, ctx):
+    '''
+    declare the variable name in the current scope and return its
+    address, a global variable at the top level and a stack slot in the
+    entry block of the function otherwise
+    '''
+    if ctx.in_function:
+        entry_builder = ir.IRBuilder(ctx.entry)
+        addr = entry_builder.alloca(i64, name=name)
+    else:
+        # variables in different scopes may share a name
+        addr = ir.GlobalVariable(ctx.module, i64,
+                                 name=ctx.module.get_unique_name(name))
+        addr.global_constant = False
+        addr.initializer = i64_const0
+    ctx.symtab.declare(name, ('INTEGER', addr))
+    return addr
+
+def var_addr(name, ctx):
+
+    val = ctx.symtab.lookup_sym(name)
+
+    if val[0] != 'INTEGER':
+        raise ValueError("{} is not a variable".format(name))
+
+    return val[1]
+
+def handle_call(name, actual_arglist, ctx):
+    '''
+    handle calls for both call-statements and call-expressions,
+    returns the value of the call
+    '''
+    val = ctx.symtab.lookup_sym(name)
+
+    if val[0] != 'FUNVAL':
+        raise ValueError("{} is not a function".format(name))
+
+    (FUNVAL, function) = val
+    (LIST, ll) = actual_arglist
+
+    if len(function.args) != len(ll):
+        raise ValueError("function {} expects {} arguments"
+                         .format(name, len(function.args)))
+
+    # arguments are passed by value
+    arg_vals = [walk(e, ctx) for e in ll]
+    return ctx.builder.call(function, arg_vals)
+
+def bool_val(cmp_val, ctx):
+    # comparisons compute i1 values, Cuppa3 values are all i64
+    return ctx.builder.zext(cmp_val, i64)
+
+#########################################################################
+# node functions
+#########################################################################
+def stmtlst(node, ctx):
+
+    (STMTLIST, lst) = node
+
+    for stmt in lst:
+        walk(stmt, ctx)
+
+#########################################################################
+def nil(node, ctx):
+
+    (NIL,) = node
+
+#########################################################################
+def fundecl_stmt(node, ctx):
+
+    (FUNDECL, (ID, name), (LIST, fl), body) = node
+
+    if ctx.in_function:
+        raise ValueError("Function declarations cannot be nested.")
+
+    # the function is declared before its body is walked so that
+    # it can call itself
+    fun_type = ir.FunctionType(i64, [i64] * len(fl))
+    function = ir.Function(ctx.module, fun_type,
+                           name=ctx.module.get_unique_name(name))
+    ctx.symtab.declare(name, ('FUNVAL', function))
+
+    # generate the function body, the code generation for main
+    # continues afterwards
+    saved = (ctx.function, ctx.entry, ctx.builder)
+    ctx.function = function
+    ctx.entry = function.append_basic_block(name="entry")
+    block = function.append_basic_block(name="start")
+    ctx.builder = ir.IRBuilder(block)
+    ctx.in_function = True
+    ctx.symtab.push_scope()
+
+    # the arguments arrive as SSA values, they are copied into stack
+    # slots because the function may assign to them
+    for ((ID, arg_name), arg) in zip(fl, function.args):
+        arg.name = arg_name
+        ctx.builder.store(arg, declare_var(arg_name, ctx))
+
+    walk(body, ctx)
+
+    # functions without a return statement return zero
+    ctx.builder.ret(i64_const0)
+    ir.IRBuilder(ctx.entry).branch(block)
+
+    ctx.symtab.pop_scope()
+    ctx.in_function = False
+    (ctx.function, ctx.entry, ctx.builder) = saved
+
+#########################################################################
+def vardecl_stmt(node, ctx):
+
+    (VARDECL, (ID, name), init_val) = node
+
+    # the initial value is computed before the variable is in scope
+    init = walk(init_val, ctx)
+    ctx.builder.store(init, declare_var(name, ctx))
+
+#########################################################################
+def assign_stmt(node, ctx):
+
+    (ASSIGN, (ID, name), exp) = node
+
+    exp_val = walk(exp, ctx)
+    ctx.builder.store(exp_val, var_addr(name, ctx))
+
+#########################################################################
+def get_stmt(node, ctx):
+
+    (GET, (ID, name)) = node
+
+    addr = var_addr(name, ctx)
+    ctx.builder.call(ctx.printf, [ctx.prompt_fmt])
+    ctx.builder.call(ctx.scanf, [ctx.scan_fmt, addr])
+
+#########################################################################
+def put_stmt(node, ctx):
+
+    (PUT, exp) = node
+
+    exp_val = walk(exp, ctx)
+    ctx.builder.call(ctx.printf, [ctx.print_fmt, exp_val])
+
+#########################################################################
+def call_stmt(node, ctx):
+
+    (CALLSTMT, (ID, name), actual_args) = node
+
+    handle_call(name, actual_args, ctx)
+
+#########################################################################
+def return_stmt(node, ctx):
+
+    (RETURN, exp) = node
+
+    if not ctx.in_function:
+        raise ValueError("return has to appear in a function context.")
+
+    if exp[0] == 'NIL':
+        ctx.builder.ret(i64_const0)
+    else:
+        ctx.builder.ret(walk(exp, ctx))
+
+    # a return terminates the block, statements following the return
+    # are unreachable and go into a block of their own
+    block = ctx.function.append_basic_block("r_after")
+    ctx.builder.position_at_start(block)
+
+#########################################################################
+def while_stmt(node, ctx):
+
+    (WHILE, cond, body) = node
+
+    w_body_block = ctx.builder.append_basic_block("w_body")
+    w_after_block = ctx.builder.append_basic_block("w_after")
+
+    # head
+    cond_val = walk(cond, ctx)
+    cmp_val = ctx.builder.icmp_signed('!=', cond_val, i64_const0)
+    ctx.builder.cbranch(cmp_val, w_body_block, w_after_block)
+
+    # body
+    ctx.builder.position_at_start(w_body_block)
+    walk(body, ctx)
+    cond_val = walk(cond, ctx)
+    cmp_val = ctx.builder.icmp_signed('!=', cond_val, i64_const0)
+    ctx.builder.cbranch(cmp_val, w_body_block, w_after_block)
+
+    # after
+    ctx.builder.position_at_start(w_after_block)
+
+#########################################################################
+def if_stmt(node, ctx):
+
+    (IF, cond, then_stmt, else_stmt) = node
+
+    cond_val = walk(cond, ctx)
+    cmp_val = ctx.builder.icmp_signed('!=', cond_val, i64_const0)
+
+    if else_stmt[0] == 'NIL':
+        with ctx.builder.if_then(cmp_val):
+            walk(then_stmt, ctx)
+    else:
+        with ctx.builder.if_else(cmp_val) as (then, otherwise):
+            with then:
+                walk(then_stmt, ctx)
+            with otherwise:
+                walk(else_stmt, ctx)
+
+#########################################################################
+def block_stmt(node, ctx):
+
+    (BLOCK, s) = node
+
+    ctx.symtab.push_scope()
+    walk(s, ctx)
+    ctx.symtab.pop_scope()
+
+#########################################################################
+def binop_exp(node, ctx):
+
+    (OP, lc, rc) = node
+
+    l_val = walk(lc, ctx)
+    r_val = walk(rc, ctx)
+
+    if OP == 'PLUS':
+        return ctx.builder.add(l_val, r_val)
+    elif OP == 'MINUS':
+        return ctx.builder.sub(l_val, r_val)
+    elif OP == 'MUL':
+        return ctx.builder.mul(l_val, r_val)
+    elif OP == 'DIV':
+        return ctx.builder.sdiv(l_val, r_val)
+    elif OP == 'EQ':
+        return bool_val(ctx.builder.icmp_signed('==', l_val, r_val), ctx)
+    elif OP == 'LE':
+        return bool_val(ctx.builder.icmp_signed('<=', l_val, r_val), ctx)
+    else:
+        raise ValueError('internal error')
+
+#########################################################################
+def integer_exp(node, ctx):
+
+    (INTEGER, value) = node
+
+    const_val = ir.Constant(i64, int(value))
+    return const_val
+
+#########################################################################
+def id_exp(node, ctx):
+
+    (ID, name) = node
+
+    return ctx.builder.load(var_addr(name, ctx))
+
+#########################################################################
+def call_exp(node, ctx):
+
+    (CALLEXP, (ID, name), actual_args) = node
+
+    return handle_call(name, actual_args, ctx)
+
+#########################################################################
+def uminus_exp(node, ctx):
+
+    (UMINUS, e) = node
+
+    e_val = walk(e, ctx)
+    return ctx.builder.neg(e_val)
+
+#########################################################################
+def not_exp(node, ctx):
+
+    (NOT, e) = node
+
+    e_val = walk(e, ctx)
+    return bool_val(ctx.builder.icmp_signed('==', e_val, i64_const0), ctx)
+
+#########################################################################
+def paren_exp(node, ctx):
+
+    (PAREN, exp) = node
+
+    exp_val = walk(exp, ctx)
+
+    return exp_val
+
+#########################################################################
+# walk
+#########################################################################
+def walk(node, ctx):
+    node_type = node[0]
+
+    if node_type in dispatch:
+        node_function = dispatch[node_type]
+        return node_function(node, ctx)
+    else:
+        raise ValueError("walk: unknown tree node type: " + node_type)
+
+# a dictionary to associate tree nodes with node functions
+dispatch = {
+    'STMTLIST' : stmtlst,
+    'NIL'      : nil,
+    'FUNDECL'  : fundecl_stmt,
+    'VARDECL'  : vardecl_stmt,
+    'ASSIGN'   : assign_stmt,
+    'GET'      : get_stmt,
+    'PUT'      : put_stmt,
+    'CALLSTMT' : call_stmt,
+    'RETURN'   : return_stmt,
+    'WHILE'    : while_stmt,
+    'IF'       : if_stmt,
+    'BLOCK'    : block_stmt,
+    'INTEGER'  : integer_exp,
+    'ID'       : id_exp,
+    'CALLEXP'  : call_exp,
+    'UMINUS'   : uminus_exp,
+    'NOT'      : not_exp,
+    'PAREN'    : paren_exp,
+    'PLUS'     : binop_exp,
+    'MINUS'    : binop_exp,
+    'MUL'      : binop_exp,
+    'DIV'      : binop_exp,
+    'EQ'       : binop_exp,
+    'LE'       : binop_exp,
+}
+
+#########################################################################
+# make a global string variable - declares a global string var in
+# current IR context
+
+def make_str_var(name, init, ctx):
+    initializer = init+"\0" # zero terminated!
+    constant_val = ir.Constant(ir.ArrayType(ir.IntType(8), len(initializer)),
+                        bytearray(initializer.encode("utf8")))
+    global_str = ir.GlobalVariable(ctx.module, constant_val.type, name=name)
+    global_str.global_constant = True
+    global_str.initializer = constant_val
+    return global_str
+
+#########################################################################
+# make_ir
+
+def make_ir(ast, ctx=None):
+
+    # without a context of its own the compilation gets a fresh one
+    if ctx is None:
+        ctx = CompilerContext()
+
+    # define the module and the target machine for our code
+    ctx.module = ir.Module(name="main")
+    ctx.module.triple = target_triple
+
+    # we have to embed our top level code in a main function
+    # in order to use the C runtime system
+    main_type = ir.FunctionType(ir.VoidType(), [])
+    ctx.function = ir.Function(ctx.module, main_type, name="main")
+
+    # I/O RTS functions
+    ctx.printf = ir.Function(ctx.module, io_fun, name="printf")
+    ctx.scanf = ir.Function(ctx.module, io_fun, name="scanf")
+
+    # the entry block holds the stack slots of the variables only,
+    # all our Cuppa3 code will start in the block after it
+    ctx.entry = ctx.function.append_basic_block(name="entry")
+    block = ctx.function.append_basic_block(name="start")
+    ctx.builder = ir.IRBuilder(block)
+
+    # the format strings are used by all functions, they are passed
+    # to printf and scanf as constant expressions
+
+    # string variable to hold the format string for printf
+    print_fmt_string = make_str_var("pfmtstr", "%lld\n", ctx)
+    ctx.print_fmt = print_fmt_string.bitcast(voidptr)
+
+    # string variable to hold the format string for scanf
+    scan_fmt_string = make_str_var("sfmtstr", "%lld", ctx)
+    ctx.scan_fmt = scan_fmt_string.bitcast(voidptr)
+
+    # string variable to hold the format string for prompt
+    prompt_fmt_string = make_str_var("qfmtstr", "? ", ctx)
+    ctx.prompt_fmt = prompt_fmt_string.bitcast(voidptr)
+
+    # generate code for the program
+    walk(ast, ctx)
+
+    # We have to emit some sort of block terminator
+    ctx.builder.ret_void()
+    ir.IRBuilder(ctx.entry).branch(block)
+
+    # return the IR module as a string
+    return str(ctx.module)
+
+#########################################################################
+# make_asm
+
+# LLVM is initialized and the target machine is created only once, by the
+# first compilation, all later compilations reuse the target machine.  The
+# LLVM binding is not thread safe, compilations take turns holding the lock.
+_target_machine = None
+llvm_lock = threading.Lock()
+
+def target_machine():
+
+    global _target_machine
+
+    # Note: llvmlite does not allow us to do cross-compilation
+    # only native compilation is supported.
+    # therefore, only use default triple for native code generation
+
+    with llvm_lock:
+        if _target_machine is None:
+            binding.initialize()
+            binding.initialize_native_target()
+            binding.initialize_native_asmprinter()
+            target = binding.Target.from_triple(binding.get_default_triple())
+            _target_machine = target.create_target_machine()
+            _target_machine.set_asm_verbosity(True)
+
+    return _target_machine
+
+#########################################################################
+# optimize
+
+# the passes run at the optimization levels, every level runs the passes
+# of the levels below it as well
+opt_passes = {
+    # promote the variables to registers (SROA includes mem2reg) and
+    # clean up the code
+    1 : ['sroa',
+         'instruction_combining',
+         'cfg_simplification',
+         'dead_code_elimination'],
+    # turn tail recursion into loops, common subexpressions and loop
+    # invariant code
+    2 : ['tail_call_elimination',
+         'sroa',
+         'reassociate_expressions',
+         'gvn',
+         'sccp',
+         'loop_simplification',
+         'loop_rotate',
+         'licm',
+         'instruction_combining',
+         'dead_store_elimination',
+         'cfg_simplification'],
+    # unroll the loops and clean up after it
+    3 : ['loop_unroll',
+         'instruction_combining',
+         'gvn',
+         'aggressive_dead_code_elimination',
+         'cfg_simplification'],
+}
+
+def optimize(mod_ref, opt, tm):
+    '''
+    run the optimization passes of level opt (0-3) over the module,
+    has to be called holding llvm_lock
+    '''
+    if opt == 0:
+        return
+    if opt not in opt_passes:
+        raise ValueError("unknown optimization level: {}".format(opt))
+    pm = binding.create_module_pass_manager()
+    tm.add_analysis_passes(pm)
+    for level in range(1, opt + 1):
+        for p in opt_passes[level]:
+            getattr(pm, 'add_' + p + '_pass')()
+    pm.run(mod_ref)
+
+def make_module(ir_module, opt, tm):
+    '''
+    parse, verify and optimize the IR module, has to be called
+    holding llvm_lock
+    '''
+    # necessary in order to generate code from ir module
+    mod_ref = binding.parse_assembly(ir_module)
+    mod_ref.verify()
+    optimize(mod_ref, opt, tm)
+    return mod_ref
+
+def make_asm(ir_module, opt=0):
+
+    tm = target_machine()
+
+    with llvm_lock:
+        mod_ref = make_module(ir_module, opt, tm)
+
+        # generate the native assembly code
+        asm_code = tm.emit_assembly(mod_ref)
+
+    # return asm code as a string
+    return asm_code
+
+#########################################################################
+# codegen
+
+def codegen(ast, ir_flag=False, ctx=None, opt=0):
+
+    ir_module = make_ir(ast, ctx)
+    if ir_flag:
+        if opt == 0:
+            return ir_module
+        tm = target_machine()
+        with llvm_lock:
+            return str(make_module(ir_module, opt, tm))
+    else:
+        if binding.get_default_triple() != target_triple:
+            raise ValueError('cross-compilation not supported in code generator')
+        asm = make_asm(ir_module, opt)
+        return asm